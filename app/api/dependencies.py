@@ -1,5 +1,7 @@
 # app/api/dependencies.py
 from typing import Generator
+from fastapi import HTTPException
+from config import settings
 from config.database import SessionLocal
 
 def get_db() -> Generator:
@@ -7,4 +9,10 @@ def get_db() -> Generator:
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def require_inference():
+    """Reject face recognition requests on workers started without inference."""
+    if not settings.enable_inference:
+        raise HTTPException(status_code=503, detail="Face recognition is disabled on this worker")
@@ -6,7 +6,7 @@ from datetime import datetime, date, time
 import numpy as np
 import cv2
 import io
-from app.api.dependencies import get_db
+from app.api.dependencies import get_db, require_inference
 from app.models import Attendance, Student, Classroom, Enrollment
 from app.services.attendance_service import AttendanceService
 from config import settings
@@ -15,7 +15,7 @@ router = APIRouter(tags=["attendance"])
 attendance_service = AttendanceService()
 
 
-@router.post("/session/start/{classroom_id}")
+@router.post("/session/start/{classroom_id}", dependencies=[Depends(require_inference)])
 async def start_attendance_session(
         classroom_id: int,
         db: Session = Depends(get_db)
@@ -94,7 +94,7 @@ async def mark_attendance_manual(
     }
 
 
-@router.post("/process-frame")
+@router.post("/process-frame", dependencies=[Depends(require_inference)])
 async def process_camera_frame(
         classroom_id: int = Form(...),
         image: UploadFile = File(...),
@@ -138,7 +138,7 @@ async def process_camera_frame(
         raise HTTPException(status_code=500, detail=f"Error in face recognition: {str(e)}")
 
 
-@router.post("/verify-face")
+@router.post("/verify-face", dependencies=[Depends(require_inference)])
 async def verify_student_face(
         student_id: str = Form(...),
         image: UploadFile = File(...),
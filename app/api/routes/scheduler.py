@@ -3,7 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List, Dict, Optional
 from datetime import datetime
-from app.api.dependencies import get_db
+from app.api.dependencies import get_db, require_inference
 from app.core.background_service import background_service
 from app.models import Classroom
 from pydantic import BaseModel
@@ -41,7 +41,7 @@ async def get_active_sessions():
     return status["scheduler"]["active_sessions"]
 
 
-@router.post("/sessions/manual")
+@router.post("/sessions/manual", dependencies=[Depends(require_inference)])
 async def start_manual_session(request: ManualSessionRequest, db: Session = Depends(get_db)):
     """Start a manual attendance session outside of regular schedule."""
     # Verify classroom exists
@@ -143,7 +143,12 @@ async def update_camera_config(request: CameraConfigRequest):
             username=cam.get("username"),
             password=cam.get("password"),
             fps=cam.get("fps", 10),
-            resolution=tuple(cam.get("resolution", [640, 480]))
+            resolution=tuple(cam.get("resolution", [640, 480])),
+            detection_scale=cam.get("detection_scale"),
+            detector_backend=cam.get("detector_backend"),
+            motion_threshold=cam.get("motion_threshold"),
+            motion_refresh_seconds=cam.get("motion_refresh_seconds"),
+            capture_backend=cam.get("capture_backend")
         )
         configs.append(config)
 
@@ -167,7 +172,14 @@ async def update_camera_config(request: CameraConfigRequest):
             "username": c.username,
             "password": c.password,
             "fps": c.fps,
-            "resolution": list(c.resolution)
+            "resolution": list(c.resolution),
+            # Per-camera tuning, only written when set
+            **{
+                key: getattr(c, key)
+                for key in ("detection_scale", "detector_backend", "motion_threshold", "motion_refresh_seconds",
+                            "capture_backend")
+                if getattr(c, key) is not None
+            }
         }
         for c in configs
     ]
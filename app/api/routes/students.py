@@ -5,7 +5,7 @@ from typing import List, Optional
 import os
 import uuid
 from datetime import datetime
-from app.api.dependencies import get_db
+from app.api.dependencies import get_db, require_inference
 from app.models import Student
 from app.services.student_service import StudentService
 from app.utils.validators import validate_image_file
@@ -15,7 +15,7 @@ router = APIRouter(tags=["students"])
 student_service = StudentService()
 
 
-@router.post("/register")
+@router.post("/register", dependencies=[Depends(require_inference)])
 async def register_student(
         student_id: str = Form(...),
         first_name: str = Form(...),
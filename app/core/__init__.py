@@ -1,7 +1,14 @@
 # app/core/__init__.py
 from .face_detection import FaceDetector
+from .detector_backends import DetectorBackend
 from .face_encoding import FaceEncoder
+from .model_registry import ModelRegistry, InferenceDisabledError
+from .face_index import FaceIndex, FlatIndex, IVFIndex, Float16Index, Int8Index
+from .face_gallery import FaceGallery
+from .gallery_snapshot import GallerySnapshotStore
+from .face_quality import FaceQualityGate
 from .face_recognition import FaceRecognitionSystem
+from .face_tracker import BoxTracker
 from .camera_handler import MultiCameraHandler, CameraHandler  # Include both for compatibility
 
-__all__ = ["FaceDetector", "FaceEncoder", "FaceRecognitionSystem", "MultiCameraHandler", "CameraHandler"]
\ No newline at end of file
+__all__ = ["FaceDetector", "DetectorBackend", "FaceEncoder", "ModelRegistry", "InferenceDisabledError", "FaceIndex", "FlatIndex", "IVFIndex", "Float16Index", "Int8Index", "FaceGallery", "GallerySnapshotStore", "FaceQualityGate", "FaceRecognitionSystem", "BoxTracker", "MultiCameraHandler", "CameraHandler"]
\ No newline at end of file
@@ -4,6 +4,8 @@ import signal
 import logging
 from typing import Optional
 from app.services.scheduler_service import AttendanceSchedulerService
+from app.services.gallery_cache import gallery_cache
+from app.core.model_registry import model_registry
 from sqlalchemy.orm import Session
 from config.database import SessionLocal
 import threading
@@ -103,6 +105,7 @@ class BackgroundServiceManager:
 
     def get_status(self) -> dict:
         """Get current status of background services."""
+        quality_gate = self.scheduler_service.attendance_service.face_recognition.quality_gate
         return {
             'running': self.is_running,
             'scheduler': {
@@ -120,10 +123,21 @@ class BackgroundServiceManager:
                 camera_key: {
                     'connected': camera.is_connected(),
                     'type': camera.config.camera_type.value,
-                    'location': camera.config.location
+                    'capture_backend': camera.capture_backend,
+                    'location': camera.config.location,
+                    'motion_gate': camera.motion_gate.get_stats(),
+                    'frame_sequence': camera.frame_slot.sequence,
+                    'frame_age': camera.get_frame_age(),
+                    'frames_grabbed': camera.frames_grabbed,
+                    'frames_decoded': camera.frames_decoded,
+                    'shared_memory': camera.frame_ring.name if camera.frame_ring is not None else None
                 }
                 for camera_key, camera in self.scheduler_service.camera_handler.cameras.items()
-            }
+            },
+            'gallery_cache': gallery_cache.get_stats(),
+            'face_tracking': self.scheduler_service.attendance_service.get_box_tracker_stats(),
+            'face_quality': quality_gate.get_stats() if quality_gate is not None else None,
+            'models': model_registry.get_stats()
         }
 
 
@@ -1,14 +1,18 @@
 # app/core/camera_handler.py
 import cv2
+import re
+import shutil
 import threading
-import queue
 import time
-from typing import Optional, List, Dict, Union
+from typing import Optional, List, Dict, Tuple, Union
 import logging
 from config import settings
 import numpy as np
 from dataclasses import dataclass
 from enum import Enum
+from .motion_gate import MotionGate
+from .frame_buffer import CapturedFrame, LatestFrameSlot, SharedFrameRing
+from .ffmpeg_capture import FFmpegCapture
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +34,11 @@ class CameraConfig:
     fps: int = 5
     resolution: tuple = (640, 480)
     reconnect_attempts: int = 3
+    detection_scale: Optional[float] = None  # Face detection downscale factor, None = settings.detection_scale
+    detector_backend: Optional[str] = None  # mtcnn, yunet, haar or cascade, None = settings.detector_backend
+    motion_threshold: Optional[float] = None  # Changed pixel fraction that counts as motion, None = settings.motion_threshold
+    motion_refresh_seconds: Optional[float] = None  # Process a static scene this often, None = settings.motion_refresh_seconds
+    capture_backend: Optional[str] = None  # opencv or ffmpeg, None = settings.camera_capture_backend
 
 
 class MultiCameraHandler:
@@ -38,6 +47,10 @@ class MultiCameraHandler:
         self.is_running = False
         self.frame_processors = []
 
+        # Every camera notifies this on a new frame, see wait_for_frames
+        self.frame_arrived = threading.Condition()
+        self.delivered_sequences: Dict[str, int] = {}  # Newest frame handed out per camera
+
     def add_camera(self, config: CameraConfig) -> str:
         """Add a camera to the handler."""
         camera_key = f"{config.name}_{config.location}"
@@ -46,7 +59,11 @@ class MultiCameraHandler:
             logger.warning(f"Camera {camera_key} already exists")
             return camera_key
 
-        camera = CameraStream(config)
+        shared_memory_name = None
+        if settings.camera_shared_memory:
+            shared_memory_name = "frames_" + re.sub(r"\W", "_", camera_key)
+
+        camera = CameraStream(config, frame_listener=self.frame_arrived, shared_memory_name=shared_memory_name)
         self.cameras[camera_key] = camera
 
         if self.is_running:
@@ -60,6 +77,7 @@ class MultiCameraHandler:
         if camera_key in self.cameras:
             self.cameras[camera_key].stop()
             del self.cameras[camera_key]
+            self.delivered_sequences.pop(camera_key, None)
             logger.info(f"Removed camera: {camera_key}")
 
     def start_all(self):
@@ -80,15 +98,107 @@ class MultiCameraHandler:
             return self.cameras[camera_key].get_frame()
         return None
 
-    def get_all_frames(self) -> Dict[str, np.ndarray]:
-        """Get latest frames from all cameras."""
+    def get_shared_memory_names(self) -> Dict[str, str]:
+        """Shared-memory ring names of the running cameras, for worker processes to SharedFrameRing.attach()."""
+        return {key: camera.frame_ring.name for key, camera in self.cameras.items() if camera.frame_ring is not None}
+
+    def get_frame_snapshot(self, new_only: bool = False,
+                           max_age: Optional[float] = None) -> Dict[str, CapturedFrame]:
+        """
+        The newest frame of every camera at once, without waiting. Each CapturedFrame
+        carries its sequence number and age.
+        new_only skips cameras without a frame newer than the last one handed out with
+        new_only, max_age skips frames older than that many seconds (e.g. dead cameras).
+        """
+        snapshot = self._fresh_frames(new_only, max_age)
+        if new_only:
+            for key, frame in snapshot.items():
+                self.delivered_sequences[key] = frame.sequence
+        return snapshot
+
+    def _fresh_frames(self, new_only: bool, max_age: Optional[float]) -> Dict[str, CapturedFrame]:
+        max_age = settings.camera_max_frame_age if max_age is None else max_age
         frames = {}
-        for key, camera in self.cameras.items():
-            frame = camera.get_frame()
-            if frame is not None:
-                frames[key] = frame
+        for key, camera in list(self.cameras.items()):
+            frame = camera.get_latest_frame()
+            if frame is None or (max_age > 0 and frame.age > max_age):
+                continue
+            if new_only and frame.sequence <= self.delivered_sequences.get(key, 0):
+                continue
+            frames[key] = frame
         return frames
 
+    def wait_for_frames(self, min_cameras: int = 0, timeout: float = 1.0,
+                        max_age: Optional[float] = None) -> Dict[str, CapturedFrame]:
+        """
+        Wait until at least min_cameras cameras (0 = all) have a frame not handed out yet, or
+        until timeout, then return the new frames, like get_frame_snapshot(new_only=True).
+        """
+        with self.frame_arrived:
+            needed = min(min_cameras or len(self.cameras), len(self.cameras))
+            self.frame_arrived.wait_for(lambda: len(self._fresh_frames(True, max_age)) >= needed, timeout)
+        return self.get_frame_snapshot(new_only=True, max_age=max_age)
+
+    def get_all_frames(self) -> Dict[str, np.ndarray]:
+        """Get latest frames from all cameras, without waiting on slow or dead ones."""
+        return {key: frame.image for key, frame in self.get_frame_snapshot(new_only=True).items()}
+
+    def get_changed_frames(self, frames: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, np.ndarray]:
+        """
+        Get latest frames (or filter the given ones) from the cameras whose scene changed
+        since their last processed frame (or whose refresh interval passed). All frames if
+        motion gating is off.
+        """
+        frames = self.get_all_frames() if frames is None else frames
+        if not settings.motion_gating:
+            return frames
+        return {key: frame for key, frame in frames.items() if self.cameras[key].motion_gate.should_process(frame)}
+
+
+class DecodePacer:
+    """
+    Decides which grabbed frames get decoded: one per interval, on a fixed deadline grid
+    instead of "interval since the last frame", so decoding doesn't drift below the
+    configured fps. Deadlines missed while the source was slow are skipped, not caught up.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.next_deadline = 0.0
+
+    def reset(self, now: float):
+        """Decode the next frame grabbed at or after now."""
+        self.next_deadline = now
+
+    def due(self, now: float) -> bool:
+        """Returns: True if the frame grabbed at now should be decoded, advancing the deadline"""
+        if now < self.next_deadline:
+            return False
+        self.next_deadline += self.interval
+        if self.next_deadline <= now:
+            self.next_deadline = now + self.interval
+        return True
+
+
+def grab_and_decode(cap, pacer: DecodePacer) -> Tuple[bool, Optional[np.ndarray], float]:
+    """
+    Take the next frame off the capture with grab(), which waits for the source but doesn't
+    decode, and decode it with retrieve() only when the pacer says one is due. Grabbing
+    every frame keeps the capture at the live edge instead of letting the stream buffer fill.
+    Returns: (ok, frame or None when it wasn't due, time.monotonic() of the grab)
+    """
+    if not cap.grab():
+        return False, None, time.monotonic()
+
+    grabbed_at = time.monotonic()
+    if not pacer.due(grabbed_at):
+        return True, None, grabbed_at
+
+    ret, frame = cap.retrieve()
+    if not ret or frame is None:
+        return False, None, grabbed_at
+    return True, frame, grabbed_at
+
 
 # Backward compatibility wrapper for old CameraHandler
 class CameraHandler:
@@ -98,7 +208,8 @@ class CameraHandler:
         self.camera_index = camera_index or settings.camera_index
         self.cap = None
         self.is_running = False
-        self.frame_queue = queue.Queue(maxsize=10)
+        self.frame_slot = LatestFrameSlot()
+        self.last_read_sequence = 0
         self.capture_thread = None
         self.frame_interval = 1.0 / settings.frame_rate
 
@@ -134,50 +245,30 @@ class CameraHandler:
             self.cap.release()
             self.cap = None
 
-        # Clear queue
-        while not self.frame_queue.empty():
-            try:
-                self.frame_queue.get_nowait()
-            except queue.Empty:
-                break
+        self.frame_slot.clear()
 
         logger.info(f"Camera {self.camera_index} stopped")
 
     def _capture_loop(self):
-        """Continuous capture loop running in separate thread."""
-        last_capture_time = 0
+        """Continuous capture loop running in separate thread, decoding frame_rate frames per second."""
+        pacer = DecodePacer(self.frame_interval)
 
         while self.is_running:
-            current_time = time.time()
-
-            # Control frame rate
-            if current_time - last_capture_time < self.frame_interval:
-                time.sleep(0.01)
-                continue
-
-            ret, frame = self.cap.read()
-            if ret:
-                # Add frame to queue (drop old frames if queue is full)
-                try:
-                    self.frame_queue.put_nowait(frame)
-                    last_capture_time = current_time
-                except queue.Full:
-                    # Remove old frame and add new one
-                    try:
-                        self.frame_queue.get_nowait()
-                        self.frame_queue.put_nowait(frame)
-                    except queue.Empty:
-                        pass
-            else:
+            ok, frame, grabbed_at = grab_and_decode(self.cap, pacer)
+            if not ok:
                 logger.error("Failed to capture frame")
                 time.sleep(0.1)
+            elif frame is not None:
+                # Replaces the previous frame, consumers always get the newest one
+                self.frame_slot.put(frame, grabbed_at)
 
     def get_frame(self, timeout: float = 1.0) -> Optional[np.ndarray]:
-        """Get the latest frame from the camera."""
-        try:
-            return self.frame_queue.get(timeout=timeout)
-        except queue.Empty:
+        """Get the latest frame from the camera, waiting up to timeout for one not returned before."""
+        frame = self.frame_slot.wait_newer(self.last_read_sequence, timeout)
+        if frame is None:
             return None
+        self.last_read_sequence = frame.sequence
+        return frame.image
 
     def capture_single_frame(self) -> Optional[np.ndarray]:
         """Capture a single frame directly."""
@@ -189,16 +280,34 @@ class CameraHandler:
 
 
 class CameraStream:
-    def __init__(self, config: CameraConfig):
+    def __init__(self, config: CameraConfig, frame_listener: Optional[threading.Condition] = None,
+                 shared_memory_name: Optional[str] = None):
         self.config = config
         self.cap = None
         self.is_running = False
-        self.frame_queue = queue.Queue(maxsize=10)
+        self.frame_slot = LatestFrameSlot(frame_listener)
+        self.shared_memory_name = shared_memory_name
+        self.frame_ring: Optional[SharedFrameRing] = None  # Created on start when shared_memory_name is set
+        self.last_read_sequence = 0
         self.capture_thread = None
         self.reconnect_thread = None
         self.last_frame_time = 0
         self.frame_interval = 1.0 / config.fps
+        self.capture_backend = config.capture_backend or settings.camera_capture_backend
+        if self.capture_backend not in ("opencv", "ffmpeg"):
+            raise ValueError(f"Unknown capture backend {self.capture_backend!r}, expected opencv or ffmpeg")
+        if self.capture_backend == "ffmpeg" and shutil.which(settings.ffmpeg_binary) is None:
+            # ffmpeg is an optional system package, a camera without it still has to start
+            logger.error(f"{settings.ffmpeg_binary} not found, camera {config.name} falls back to OpenCV capture")
+            self.capture_backend = "opencv"
+        self.frames_grabbed = 0
+        self.frames_decoded = 0
         self.connection_lost = False
+        self.motion_gate = MotionGate(
+            threshold=settings.motion_threshold if config.motion_threshold is None else config.motion_threshold,
+            refresh_seconds=(settings.motion_refresh_seconds if config.motion_refresh_seconds is None
+                             else config.motion_refresh_seconds)
+        )
 
     def _get_stream_url(self) -> Union[int, str]:
         """Get the appropriate stream URL based on camera type."""
@@ -220,6 +329,11 @@ class CameraStream:
         try:
             stream_url = self._get_stream_url()
 
+            if self.capture_backend == "ffmpeg":
+                # ffmpeg drops to config.fps and scales to config.resolution itself
+                self.cap = FFmpegCapture(stream_url, self.config.resolution, self.config.fps)
+                return self.cap.isOpened()
+
             if self.config.camera_type in [CameraType.IP, CameraType.RTSP]:
                 # Set buffer size for network streams
                 self.cap = cv2.VideoCapture(stream_url, cv2.CAP_FFMPEG)
@@ -254,6 +368,11 @@ class CameraStream:
             logger.error(f"Cannot start camera {self.config.name}")
             return
 
+        if self.shared_memory_name and self.frame_ring is None:
+            self.frame_ring = SharedFrameRing.create(
+                self.shared_memory_name, self.config.resolution, settings.camera_shared_memory_slots
+            )
+
         self.is_running = True
         self.connection_lost = False
 
@@ -274,49 +393,44 @@ class CameraStream:
             self.cap.release()
             self.cap = None
 
-        # Clear queue
-        while not self.frame_queue.empty():
-            try:
-                self.frame_queue.get_nowait()
-            except queue.Empty:
-                break
+        self.frame_slot.clear()
+
+        if self.frame_ring is not None:
+            self.frame_ring.close()
+            self.frame_ring = None
 
         logger.info(f"Stopped camera: {self.config.name}")
 
     def _capture_loop(self):
-        """Continuous capture loop with reconnection logic."""
+        """
+        Continuous capture loop with reconnection logic. Runs at the source's frame rate,
+        grab() blocks until the next frame arrives, and decodes config.fps frames per second.
+        """
         consecutive_failures = 0
+        # ffmpeg's fps filter already dropped the frames we don't want
+        pacer = DecodePacer(0.0 if self.capture_backend == "ffmpeg" else self.frame_interval)
 
         while self.is_running:
-            current_time = time.time()
-
-            # Control frame rate
-            if current_time - self.last_frame_time < self.frame_interval:
-                time.sleep(0.01)
-                continue
-
             if not self.cap or not self.cap.isOpened():
                 if not self._reconnect():
                     time.sleep(1)
                     continue
+                pacer.reset(time.monotonic())
 
-            ret, frame = self.cap.read()
+            ok, frame, grabbed_at = grab_and_decode(self.cap, pacer)
 
-            if ret and frame is not None:
+            if ok:
                 consecutive_failures = 0
                 self.connection_lost = False
-
-                # Add frame to queue
-                try:
-                    self.frame_queue.put_nowait(frame)
-                    self.last_frame_time = current_time
-                except queue.Full:
-                    # Remove old frame and add new one
-                    try:
-                        self.frame_queue.get_nowait()
-                        self.frame_queue.put_nowait(frame)
-                    except queue.Empty:
-                        pass
+                self.frames_grabbed += 1
+
+                if frame is not None:
+                    # Replaces the previous frame, consumers always get the newest one
+                    self.frame_slot.put(frame, grabbed_at)
+                    if self.frame_ring is not None:
+                        self.frame_ring.put(frame, grabbed_at)
+                    self.frames_decoded += 1
+                    self.last_frame_time = time.time()
             else:
                 consecutive_failures += 1
 
@@ -348,11 +462,21 @@ class CameraStream:
         return False
 
     def get_frame(self, timeout: float = 1.0) -> Optional[np.ndarray]:
-        """Get the latest frame from the camera."""
-        try:
-            return self.frame_queue.get(timeout=timeout)
-        except queue.Empty:
+        """Get the latest frame from the camera, waiting up to timeout for one not returned before."""
+        frame = self.frame_slot.wait_newer(self.last_read_sequence, timeout)
+        if frame is None:
             return None
+        self.last_read_sequence = frame.sequence
+        return frame.image
+
+    def get_latest_frame(self) -> Optional[CapturedFrame]:
+        """The newest frame with its sequence number and capture time, without waiting."""
+        return self.frame_slot.latest()
+
+    def get_frame_age(self) -> Optional[float]:
+        """Seconds since the newest frame was captured, None before the first frame."""
+        frame = self.frame_slot.latest()
+        return round(frame.age, 3) if frame is not None else None
 
     def is_connected(self) -> bool:
         """Check if camera is connected and working."""
@@ -0,0 +1,249 @@
+# app/core/detector_backends.py
+"""
+Face detector backends behind FaceDetector. Every backend returns, per image, boxes as
+[x1, y1, x2, y2], a probability per face and 5-point landmarks (left eye, right eye, nose,
+left and right mouth corner, as MTCNN orders them), or (None, None, None) without faces.
+"""
+import threading
+import cv2
+from abc import ABC, abstractmethod
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
+from config import settings
+from .model_registry import FACE_CROP_MARGIN, model_registry
+
+Detections = Tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[np.ndarray]]
+
+# Typical landmark positions inside a frontal face box, for detectors without landmarks
+_LANDMARK_TEMPLATE = np.array([
+    [0.31, 0.40], [0.69, 0.40], [0.50, 0.58], [0.35, 0.78], [0.65, 0.78]
+], dtype=np.float32)
+
+
+def template_landmarks(boxes: np.ndarray) -> np.ndarray:
+    """Place the frontal landmark template in each [x1, y1, x2, y2] box. Returns: (K x 5 x 2) array"""
+    origin = boxes[:, None, :2]
+    size = (boxes[:, 2:] - boxes[:, :2])[:, None, :]
+    return (origin + _LANDMARK_TEMPLATE[None] * size).astype(np.float32)
+
+
+class DetectorBackend(ABC):
+    """Base class: detection is backend specific, crops are cut and normalised like MTCNN's."""
+    name = ""
+    mtcnn_probabilities = False  # Face probabilities come from MTCNN, which QUALITY_MIN_PROBABILITY is set for
+
+    @abstractmethod
+    def detect(self, rgb_images: List[np.ndarray]) -> List[Detections]:
+        """Returns: (boxes, probs, landmarks) per image, (None, None, None) without faces"""
+
+    def extract(self, rgb_image: np.ndarray, boxes: np.ndarray):
+        """
+        Crop each box (plus margin) and resize it to FaceNet input, normalised to (x - 127.5) / 128.
+        Returns: (K x 3 x H x W) float tensor
+        """
+        import torch
+        from facenet_pytorch.models.mtcnn import fixed_image_standardization
+        from facenet_pytorch.models.utils.detect_face import extract_face
+
+        image = Image.fromarray(rgb_image)
+        return torch.stack([
+            fixed_image_standardization(extract_face(image, box, settings.facenet_image_size, FACE_CROP_MARGIN))
+            for box in boxes
+        ])
+
+
+class MTCNNBackend(DetectorBackend):
+    """facenet_pytorch's MTCNN, the most accurate and the slowest on CPU."""
+    name = "mtcnn"
+    mtcnn_probabilities = True
+
+    @property
+    def model(self):
+        return model_registry.get("mtcnn")
+
+    def detect(self, rgb_images: List[np.ndarray]) -> List[Detections]:
+        # MTCNN can only stack equally sized images, so it runs once per image size
+        groups: Dict[Tuple[int, ...], List[int]] = {}
+        for i, image in enumerate(rgb_images):
+            groups.setdefault(image.shape, []).append(i)
+
+        results: List[Detections] = [(None, None, None)] * len(rgb_images)
+        for indices in groups.values():
+            # MTCNN turns PIL images back into arrays anyway, so hand it the arrays directly
+            if len(indices) == 1:
+                batch_boxes, batch_probs, batch_points = self.model.detect(rgb_images[indices[0]], landmarks=True)
+                batch_boxes, batch_probs, batch_points = [batch_boxes], [batch_probs], [batch_points]
+            else:
+                batch_boxes, batch_probs, batch_points = self.model.detect(
+                    np.stack([rgb_images[i] for i in indices]), landmarks=True
+                )
+
+            for i, boxes, probs, points in zip(indices, batch_boxes, batch_probs, batch_points):
+                if boxes is not None:
+                    # MTCNN hands back object arrays
+                    results[i] = tuple(np.asarray(a, dtype=np.float32) for a in (boxes, probs, points))
+
+        return results
+
+    def extract(self, rgb_image: np.ndarray, boxes: np.ndarray):
+        return self.model.extract(Image.fromarray(rgb_image), boxes, None)
+
+
+class YuNetBackend(DetectorBackend):
+    """OpenCV's YuNet DNN detector: a single small CNN pass instead of MTCNN's image pyramid, with landmarks."""
+    name = "yunet"
+
+    def __init__(self):
+        # FaceDetectorYN keeps the input size as state, so calls on the shared instance are serialised
+        self._lock = threading.Lock()
+
+    def detect(self, rgb_images: List[np.ndarray]) -> List[Detections]:
+        model = model_registry.get("yunet")
+        results = []
+        for rgb_image in rgb_images:
+            height, width = rgb_image.shape[:2]
+            with self._lock:
+                model.setInputSize((width, height))
+                # YuNet was trained on BGR frames
+                _, faces = model.detect(cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR))
+
+            if faces is None or len(faces) == 0:
+                results.append((None, None, None))
+                continue
+
+            # Rows: x, y, w, h, 5 landmark (x, y) pairs in MTCNN's order, score
+            boxes = np.concatenate([faces[:, :2], faces[:, :2] + faces[:, 2:4]], axis=1)
+            results.append((boxes.astype(np.float32), faces[:, 14].astype(np.float32),
+                            faces[:, 4:14].reshape(-1, 5, 2).astype(np.float32)))
+        return results
+
+
+class HaarBackend(DetectorBackend):
+    """
+    OpenCV Haar cascade, a fallback without model downloads (crops still go through torch,
+    like every backend's). It has no scores or landmarks, so every face gets probability 1.0
+    and template landmarks, and it misses turned faces.
+    """
+    name = "haar"
+
+    def __init__(self, min_neighbors: int = 5):
+        self.min_neighbors = min_neighbors  # Lower finds more faces and more false positives
+
+    def detect(self, rgb_images: List[np.ndarray]) -> List[Detections]:
+        cascade = model_registry.get("haar")
+        results = []
+        for rgb_image in rgb_images:
+            gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY) if rgb_image.ndim == 3 else rgb_image
+            faces = cascade.detectMultiScale(
+                gray, scaleFactor=1.2, minNeighbors=self.min_neighbors, minSize=(settings.min_face_size, settings.min_face_size)
+            )
+
+            if len(faces) == 0:
+                results.append((None, None, None))
+                continue
+
+            faces = np.asarray(faces, dtype=np.float32)
+            boxes = np.concatenate([faces[:, :2], faces[:, :2] + faces[:, 2:4]], axis=1)
+            results.append((boxes, np.ones(len(boxes), dtype=np.float32), template_landmarks(boxes)))
+        return results
+
+
+def merge_regions(boxes: np.ndarray, padding: float, width: int, height: int) -> List[Tuple[int, int, int, int]]:
+    """
+    Pad each [x1, y1, x2, y2] box by padding times its size on every side, clip it to the
+    frame and merge overlapping regions, so no face is split between two crops.
+    Returns: Integer (x1, y1, x2, y2) regions
+    """
+    size = boxes[:, 2:] - boxes[:, :2]
+    padded = np.concatenate([boxes[:, :2] - size * padding, boxes[:, 2:] + size * padding], axis=1)
+    padded = np.clip(padded, 0, [width, height, width, height])
+
+    regions = [list(region) for region in padded]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    return [(int(x1), int(y1), int(np.ceil(x2)), int(np.ceil(y2))) for x1, y1, x2, y2 in regions]
+
+
+class CascadeBackend(DetectorBackend):
+    """
+    Two-stage detection: a cheap proposer (Haar or YuNet) finds candidate faces with
+    relaxed settings, then MTCNN runs only on padded crops around them, so its image
+    pyramid covers a few small regions instead of the whole frame. Faces the proposer
+    misses entirely are not found.
+    """
+    name = "cascade"
+    mtcnn_probabilities = True
+
+    def __init__(self, proposer: Optional[str] = None, padding: Optional[float] = None,
+                 proposal_scale: Optional[float] = None):
+        proposer = proposer or settings.cascade_proposer
+        if proposer == "haar":
+            # Recall matters more than precision here, MTCNN rejects the false positives
+            self.proposer: DetectorBackend = HaarBackend(min_neighbors=2)
+        elif proposer == "yunet":
+            self.proposer = YuNetBackend()
+        else:
+            raise ValueError(f"Unknown cascade proposer {proposer!r}, expected haar or yunet")
+
+        self.confirmer = MTCNNBackend()
+        self.padding = settings.cascade_padding if padding is None else padding
+        self.proposal_scale = settings.cascade_proposal_scale if proposal_scale is None else proposal_scale
+
+    def _propose(self, rgb_images: List[np.ndarray]) -> List[Optional[np.ndarray]]:
+        """Proposal boxes in frame coordinates, found on frames downscaled by proposal_scale."""
+        scale = self.proposal_scale
+        if not 0 < scale < 1:
+            return [boxes for boxes, _, _ in self.proposer.detect(rgb_images)]
+
+        small = [cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) for image in rgb_images]
+        return [boxes / scale if boxes is not None else None for boxes, _, _ in self.proposer.detect(small)]
+
+    def detect(self, rgb_images: List[np.ndarray]) -> List[Detections]:
+        results = []
+        for rgb_image, proposals in zip(rgb_images, self._propose(rgb_images)):
+            if proposals is None:
+                results.append((None, None, None))
+                continue
+
+            height, width = rgb_image.shape[:2]
+            regions = merge_regions(proposals, self.padding, width, height)
+            crops = [rgb_image[y1:y2, x1:x2] for x1, y1, x2, y2 in regions]
+
+            boxes, probs, points = [], [], []
+            for (x1, y1, _, _), (crop_boxes, crop_probs, crop_points) in zip(regions, self.confirmer.detect(crops)):
+                if crop_boxes is None:
+                    continue
+                # Back to frame coordinates
+                boxes.append(crop_boxes + np.array([x1, y1, x1, y1], dtype=np.float32))
+                probs.append(crop_probs)
+                points.append(crop_points + np.array([x1, y1], dtype=np.float32))
+
+            if boxes:
+                results.append((np.concatenate(boxes), np.concatenate(probs), np.concatenate(points)))
+            else:
+                results.append((None, None, None))
+        return results
+
+
+DETECTOR_BACKENDS = {
+    backend.name: backend for backend in (MTCNNBackend, YuNetBackend, HaarBackend, CascadeBackend)
+}
+
+
+def create_detector_backend(name: str) -> DetectorBackend:
+    if name not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown detector backend {name!r}, expected one of {sorted(DETECTOR_BACKENDS)}")
+    return DETECTOR_BACKENDS[name]()
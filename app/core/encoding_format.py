@@ -0,0 +1,116 @@
+# app/core/encoding_format.py
+"""
+Binary format for face encodings stored in Student.face_encoding.
+
+Layout (all little-endian):
+    magic      4s   b"FENC"
+    version    B    format version
+    dtype      B    element type code (1 = float32)
+    dim        H    embedding dimension
+    rows       H    number of per-photo embeddings after the averaged encoding
+    id_len     B    length of the model id
+    model_id   id_len bytes, ASCII, zero-padded so the payload starts 4-byte aligned
+    payload    (1 + rows) x dim elements: averaged encoding, then the per-photo block
+
+Older rows hold a pickled dict; decode_encoding still reads those during migration.
+"""
+import io
+import pickle
+import struct
+import numpy as np
+from typing import Optional, Tuple
+
+MAGIC = b"FENC"
+FORMAT_VERSION = 1
+DEFAULT_MODEL_ID = "facenet-vggface2"
+
+_HEADER = struct.Struct("<4sBBHHB")
+_DTYPES = {1: np.dtype("<f4")}
+_DTYPE_CODES = {dtype: code for code, dtype in _DTYPES.items()}
+
+
+def is_raw_encoding(data: bytes) -> bool:
+    """True if the bytes use the raw binary format rather than a legacy pickle."""
+    return data[:len(MAGIC)] == MAGIC
+
+
+def encode_encoding(encoding: np.ndarray, embeddings: Optional[np.ndarray] = None,
+                    model_id: str = DEFAULT_MODEL_ID) -> bytes:
+    """Serialise an averaged encoding and optional (K x D) per-photo block."""
+    dtype = _DTYPES[1]
+    encoding = np.asarray(encoding, dtype=dtype).ravel()
+    dim = encoding.shape[0]
+
+    if embeddings is None:
+        embeddings = np.empty((0, dim), dtype=dtype)
+    embeddings = np.asarray(embeddings, dtype=dtype).reshape(-1, dim)
+
+    model_bytes = model_id.encode("ascii")
+    header_len = _HEADER.size + len(model_bytes)
+    padding = -header_len % 4
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, _DTYPE_CODES[dtype], dim, embeddings.shape[0], len(model_bytes))
+    return b"".join([header, model_bytes, b"\0" * padding, encoding.tobytes(), embeddings.tobytes()])
+
+
+def decode_encoding(data: bytes) -> Tuple[np.ndarray, Optional[np.ndarray], str]:
+    """
+    Decode stored encoding bytes of either format.
+    Returns: (encoding, per-photo embeddings or None, model id). Raw-format arrays are
+    read-only views over the input buffer.
+    """
+    if not is_raw_encoding(data):
+        return _decode_legacy(data)
+
+    if len(data) < _HEADER.size:
+        raise ValueError("Truncated face encoding header")
+
+    _, version, dtype_code, dim, rows, id_len = _HEADER.unpack_from(data)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported face encoding format version: {version}")
+    if dtype_code not in _DTYPES:
+        raise ValueError(f"Unsupported face encoding dtype code: {dtype_code}")
+
+    model_id = bytes(data[_HEADER.size:_HEADER.size + id_len]).decode("ascii")
+    offset = _HEADER.size + id_len
+    offset += -offset % 4
+
+    values = np.frombuffer(data, dtype=_DTYPES[dtype_code], count=(1 + rows) * dim, offset=offset)
+    values = values.reshape(1 + rows, dim)
+
+    return values[0], (values[1:] if rows else None), model_id
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    """
+    Only allows what the old pickled dicts of numpy arrays need, for every pickle protocol:
+    protocols 0-2 store the array bytes through _codecs.encode, protocol 5 rebuilds arrays
+    with numpy's _frombuffer.
+    """
+
+    _ALLOWED = {
+        ("numpy", "ndarray"),
+        ("numpy", "dtype"),
+        ("numpy.core.multiarray", "_reconstruct"),
+        ("numpy.core.multiarray", "scalar"),
+        ("numpy._core.multiarray", "_reconstruct"),
+        ("numpy._core.multiarray", "scalar"),
+        ("numpy.core.numeric", "_frombuffer"),
+        ("numpy._core.numeric", "_frombuffer"),
+        ("_codecs", "encode"),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) not in self._ALLOWED:
+            raise pickle.UnpicklingError(f"Disallowed global in face encoding: {module}.{name}")
+        return super().find_class(module, name)
+
+
+def _decode_legacy(data: bytes) -> Tuple[np.ndarray, Optional[np.ndarray], str]:
+    payload = _LegacyUnpickler(io.BytesIO(data)).load()
+    encoding = np.asarray(payload["encoding"], dtype=np.float32)
+    embeddings = payload.get("embeddings")
+    if embeddings is not None:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+    # Legacy rows only recorded "facenet", they were always produced with the vggface2 weights
+    return encoding, embeddings, DEFAULT_MODEL_ID
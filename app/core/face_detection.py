@@ -1,46 +1,106 @@
 # app/core/face_detection.py
 import cv2
 import numpy as np
-from typing import List, Tuple, Optional
-from facenet_pytorch import MTCNN
-import torch
-from PIL import Image
+from typing import Any, Dict, List, Tuple, Optional
+from config import settings
+from .model_registry import model_registry
+from .face_quality import FaceQualityGate
+from .detector_backends import DetectorBackend, create_detector_backend
 
 
 class FaceDetector:
     def __init__(self):
-        # Use GPU if available
-        self.device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
-
-        # Initialize MTCNN for face detection
-        self.detector = MTCNN(
-            image_size=160,  # FaceNet input size
-            margin=20,
-            min_face_size=20,
-            thresholds=[0.6, 0.7, 0.7],
-            factor=0.709,
-            post_process=True,
-            select_largest=False,
-            keep_all=True,
-            device=self.device
-        )
-
-    def detect_faces(self, image: np.ndarray) -> List[Tuple[int, int, int, int]]:
+        # Detection runs on frames downscaled by this factor, cameras can override it
+        self.detection_scale = settings.detection_scale
+
+        # Detector backend (mtcnn, yunet, haar or cascade), cameras can override it
+        self.backend_name = settings.detector_backend
+        self._backends: Dict[str, DetectorBackend] = {}
+        self.backend(self.backend_name)  # Fail early on a misconfigured name
+
+    @property
+    def device(self):
+        return model_registry.device
+
+    def backend(self, name: Optional[str] = None) -> DetectorBackend:
+        """The named detector backend, default self.backend_name. Its model loads on first use."""
+        name = name or self.backend_name
+        if name not in self._backends:
+            self._backends[name] = create_detector_backend(name)
+        return self._backends[name]
+
+    def _inference(self):
+        # MTCNN doesn't disable autograd itself, so every detection would record a graph
+        import torch
+        return torch.inference_mode()
+
+    @staticmethod
+    def _to_rgb(image: np.ndarray) -> np.ndarray:
+        if len(image.shape) == 3 and image.shape[2] == 3:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return image
+
+    def _downscale(self, rgb_image: np.ndarray, scale: Optional[float]) -> Tuple[np.ndarray, float]:
+        """Returns: (image to run detection on, the scale actually applied)"""
+        scale = self.detection_scale if scale is None else scale
+        if not 0 < scale < 1:
+            return rgb_image, 1.0
+
+        height, width = rgb_image.shape[:2]
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        # INTER_AREA averages pixels, so small faces keep their structure
+        return cv2.resize(rgb_image, size, interpolation=cv2.INTER_AREA), scale
+
+    def _detect(self, rgb_image: np.ndarray, scale: Optional[float],
+                backend: Optional[str] = None) -> Tuple[Optional[np.ndarray], ...]:
+        """
+        Run the detector backend on a downscaled copy of the frame.
+        Returns: (boxes as [x1, y1, x2, y2], probabilities, 5-point landmarks), all in
+        full-resolution coordinates
+        """
+        return self._detect_batch([rgb_image], [scale], [backend])[0]
+
+    def _detect_batch(self, rgb_images: List[np.ndarray], scales: List[Optional[float]],
+                      backends: Optional[List[Optional[str]]] = None) -> List[Tuple[Optional[np.ndarray], ...]]:
+        """
+        Detect faces in several frames. Frames using the same backend are handed to it
+        together, so MTCNN can batch the equally sized ones.
+        """
+        prepared = [self._downscale(image, scale) for image, scale in zip(rgb_images, scales)]
+        backends = backends or [None] * len(rgb_images)
+
+        groups: Dict[str, List[int]] = {}
+        for i, name in enumerate(backends):
+            groups.setdefault(name or self.backend_name, []).append(i)
+
+        results: List[Tuple[Optional[np.ndarray], ...]] = [(None, None, None)] * len(rgb_images)
+
+        for name, indices in groups.items():
+            detections = self.backend(name).detect([prepared[i][0] for i in indices])
+
+            for i, (boxes, probs, points) in zip(indices, detections):
+                scale = prepared[i][1]
+                if boxes is not None and scale != 1.0:
+                    boxes = boxes / scale
+                    points = points / scale
+                results[i] = (boxes, probs, points)
+
+        return results
+
+    def detect_faces(self, image: np.ndarray, scale: Optional[float] = None,
+                     backend: Optional[str] = None) -> List[Tuple[int, int, int, int]]:
         """
         Detect faces in an image and return their locations.
+        scale downscales the frame for detection (default self.detection_scale), backend
+        picks the detector (default self.backend_name).
         Returns: List of (top, right, bottom, left) tuples
         """
         # Convert BGR to RGB if needed
-        if len(image.shape) == 3 and image.shape[2] == 3:
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        else:
-            rgb_image = image
-
-        # Convert to PIL Image
-        pil_image = Image.fromarray(rgb_image)
+        rgb_image = self._to_rgb(image)
 
         # Detect faces
-        boxes, probs = self.detector.detect(pil_image)
+        with self._inference():
+            boxes, _, _ = self._detect(rgb_image, scale, backend)
 
         face_locations = []
         if boxes is not None:
@@ -51,23 +111,76 @@ class FaceDetector:
 
         return face_locations
 
-    def detect_and_align_faces(self, image: np.ndarray) -> Tuple[List[np.ndarray], List[Tuple[int, int, int, int]]]:
+    def detect_and_align_faces(self, image: np.ndarray, scale: Optional[float] = None,
+                               backend: Optional[str] = None) -> Tuple[List[np.ndarray], List[Tuple[int, int, int, int]]]:
         """
         Detect and align faces for FaceNet input.
+        Detection may run on a downscaled frame (see scale), faces are always cropped from
+        the full-resolution frame.
         Returns: (aligned_faces, face_locations)
         """
-        # Convert BGR to RGB if needed
-        if len(image.shape) == 3 and image.shape[2] == 3:
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        else:
-            rgb_image = image
-
-        # Convert to PIL Image
-        pil_image = Image.fromarray(rgb_image)
+        return self.detect_and_align_faces_batch([image], [scale], backends=[backend])[0]
 
-        # Detect and align faces
-        aligned_faces, probs, boxes = self.detector(pil_image, return_prob=True)
+    def detect_and_align_faces_batch(self, images: List[np.ndarray], scales: Optional[List[Optional[float]]] = None,
+                                     as_tensors: bool = False, quality_gate: Optional[FaceQualityGate] = None,
+                                     backends: Optional[List[Optional[str]]] = None
+                                     ) -> List[Tuple[Any, List[Tuple[int, int, int, int]]]]:
+        """
+        Detect and align faces in several frames (e.g. every camera of a room), running
+        detection once per group of equally sized frames instead of once per frame.
+        With as_tensors, each frame's faces are returned as MTCNN produced them: one
+        normalised (K x 3 x 160 x 160) float tensor (or None) that FaceEncoder can consume
+        directly, skipping the round trip through uint8 images.
+        quality_gate drops faces that aren't worth encoding, see FaceQualityGate.
+        backends optionally picks each frame's detector backend.
+        Returns: One (aligned_faces, face_locations) per input frame
+        """
+        if scales is None:
+            scales = [None] * len(images)
+        if backends is None:
+            backends = [None] * len(images)
 
+        # Convert BGR to RGB if needed
+        rgb_images = [self._to_rgb(image) for image in images]
+
+        results = []
+        with self._inference():
+            detections = self._detect_batch(rgb_images, scales, backends)
+
+            # Every backend crops the same way, so embeddings don't depend on the detector
+            for rgb_image, backend, (boxes, probs, landmarks) in zip(rgb_images, backends, detections):
+                if boxes is not None and quality_gate is not None:
+                    boxes = self._select(boxes, quality_gate.check_detections(
+                        boxes, probs, landmarks, self.backend(backend).mtcnn_probabilities
+                    ))
+
+                aligned_faces = self.backend(backend).extract(rgb_image, boxes) if boxes is not None else None
+
+                if aligned_faces is not None and quality_gate is not None:
+                    keep = quality_gate.check_sharpness(aligned_faces)
+                    boxes = self._select(boxes, keep)
+                    aligned_faces = aligned_faces[np.flatnonzero(keep)] if boxes is not None else None
+                if as_tensors:
+                    results.append((aligned_faces, self._box_locations(boxes)))
+                else:
+                    results.append(self._collect_faces(aligned_faces, boxes))
+
+        return results
+
+    @staticmethod
+    def _select(boxes: np.ndarray, keep: np.ndarray) -> Optional[np.ndarray]:
+        # None means "no faces" throughout
+        return boxes[keep] if keep.any() else None
+
+    @staticmethod
+    def _box_locations(boxes: Optional[np.ndarray]) -> List[Tuple[int, int, int, int]]:
+        # Convert from [x1, y1, x2, y2] to (top, right, bottom, left)
+        if boxes is None:
+            return []
+        return [(y1, x2, y2, x1) for x1, y1, x2, y2 in boxes.astype(int)]
+
+    @staticmethod
+    def _collect_faces(aligned_faces, boxes) -> Tuple[List[np.ndarray], List[Tuple[int, int, int, int]]]:
         face_locations = []
         aligned_face_arrays = []
 
@@ -3,61 +3,121 @@ import cv2
 import numpy as np
 import pickle
 import os
-import torch
-from typing import List, Optional, Dict, Tuple
-from facenet_pytorch import InceptionResnetV1
+from typing import TYPE_CHECKING, List, Optional, Dict, Tuple
 from PIL import Image
-import torch.nn.functional as F
 from config import settings
+from .encoding_format import encode_encoding, decode_encoding, DEFAULT_MODEL_ID
+from .model_registry import model_registry
+
+if TYPE_CHECKING:
+    import torch
+
+# Inference backend -> model registry entry, selected with settings.encoder_backend
+ENCODER_MODELS = {
+    "torch": "facenet",
+    "onnx": "facenet-onnx",
+    "onnx-int8": "facenet-onnx-int8",
+}
 
 
 class FaceEncoder:
     def __init__(self):
-        self.device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
         self.encodings_dir = settings.encodings_dir
 
-        # Load pre-trained FaceNet model
-        self.model = InceptionResnetV1(
-            pretrained='vggface2',
-            classify=False,
-            device=self.device
-        ).eval()
-
-        # Embedding size for FaceNet
+        # Embedding size and input size for FaceNet
         self.embedding_size = 512
+        self.model_id = DEFAULT_MODEL_ID
+        self.image_size = settings.facenet_image_size
 
-    def preprocess_face(self, face_image: np.ndarray) -> torch.Tensor:
-        """Preprocess face image for FaceNet input."""
+        # Maximum number of faces per forward pass
+        self.max_batch_size = settings.encoder_batch_size
+
+        if settings.encoder_backend not in ENCODER_MODELS:
+            raise ValueError(f"Unknown encoder backend: {settings.encoder_backend}")
+        self.backend = settings.encoder_backend
+
+        # CPU fast path of the torch backend, see torch_runtime
+        self.cpu_optimized = settings.torch_cpu_optimized
+        self.bf16 = settings.torch_bf16
+
+    @property
+    def device(self):
+        return model_registry.device
+
+    @property
+    def model(self):
+        """Shared pre-trained FaceNet model for the configured backend, loaded on first use."""
+        return model_registry.get(ENCODER_MODELS[self.backend])
+
+    def _prepare_face(self, face_image: np.ndarray) -> np.ndarray:
+        """Convert a face image to 160x160 RGB."""
         # Ensure image is RGB
         if len(face_image.shape) == 2:
             face_image = cv2.cvtColor(face_image, cv2.COLOR_GRAY2RGB)
         elif face_image.shape[2] == 4:
             face_image = cv2.cvtColor(face_image, cv2.COLOR_BGRA2RGB)
 
-        # Resize to 160x160 (FaceNet input size)
-        face_image = cv2.resize(face_image, (160, 160))
+        # Resize to 160x160 (FaceNet input size), MTCNN crops are already this size
+        if face_image.shape[:2] != (self.image_size, self.image_size):
+            face_image = cv2.resize(face_image, (self.image_size, self.image_size))
+
+        return face_image
+
+    def preprocess_face(self, face_image: np.ndarray) -> "torch.Tensor":
+        """Preprocess face image for FaceNet input."""
+        return self.preprocess_faces([face_image])
+
+    def _prepare_batch(self, face_images: List[np.ndarray]) -> np.ndarray:
+        """Stack face images into one (N x 160 x 160 x 3) float32 array."""
+        batch = np.empty((len(face_images), self.image_size, self.image_size, 3), dtype=np.float32)
+        for i, face_image in enumerate(face_images):
+            batch[i] = self._prepare_face(face_image)
+        return batch
+
+    def preprocess_faces(self, face_images: List[np.ndarray]) -> "torch.Tensor":
+        """Preprocess a batch of face images into a single NCHW tensor."""
+        import torch
+
+        batch = self._prepare_batch(face_images)
+
+        # HWC to CHW and normalize to [-1, 1] for the whole batch at once
+        face_tensor = torch.from_numpy(batch).to(self.device).permute(0, 3, 1, 2)
+        return (face_tensor - 127.5) / 128.0
+
+    def _embed(self, face_images: List[np.ndarray]) -> np.ndarray:
+        """Run one forward pass of the configured backend, returns raw (N x D) embeddings."""
+        if self.backend != "torch":
+            # Same normalisation as preprocess_faces, without going through torch
+            batch = self._prepare_batch(face_images).transpose(0, 3, 1, 2)
+            return self.model.run((batch - 127.5) / 128.0)
 
-        # Convert to tensor and normalize
-        face_tensor = torch.from_numpy(face_image).float()
-        face_tensor = face_tensor.permute(2, 0, 1)  # HWC to CHW
+        return self._embed_tensor(self.preprocess_faces(face_images))
 
-        # Normalize to [-1, 1]
-        face_tensor = (face_tensor - 127.5) / 128.0
+    def _embed_tensor(self, batch_tensor: "torch.Tensor") -> np.ndarray:
+        """Run the configured backend on an already normalised (N x 3 x 160 x 160) tensor."""
+        if self.backend != "torch":
+            # A CPU tensor's numpy() is a view, no copy
+            return self.model.run(batch_tensor.cpu().numpy())
 
-        return face_tensor.unsqueeze(0).to(self.device)
+        import torch
+
+        batch_tensor = batch_tensor.to(self.device)
+
+        if self.cpu_optimized and batch_tensor.device.type == 'cpu':
+            from .torch_runtime import inference_context
+            model = self.model  # load outside autocast, tracing must see float32
+            with inference_context(self.bf16):
+                embeddings = model(batch_tensor.contiguous(memory_format=torch.channels_last))
+            return embeddings.float().numpy()
+
+        with torch.no_grad():
+            return self.model(batch_tensor).cpu().numpy()
 
     def generate_encoding(self, face_image: np.ndarray) -> Optional[np.ndarray]:
         """Generate face encoding using FaceNet."""
         try:
-            # Preprocess face
-            face_tensor = self.preprocess_face(face_image)
-
             # Generate embedding
-            with torch.no_grad():
-                embedding = self.model(face_tensor)
-
-            # Convert to numpy array
-            embedding_np = embedding.cpu().numpy().flatten()
+            embedding_np = self._embed([face_image]).flatten()
 
             # L2 normalize the embedding
             embedding_np = embedding_np / np.linalg.norm(embedding_np)
@@ -68,39 +128,70 @@ class FaceEncoder:
             print(f"Error generating encoding: {e}")
             return None
 
-    def generate_encoding_batch(self, face_images: List[np.ndarray]) -> List[Optional[np.ndarray]]:
-        """Generate encodings for multiple faces efficiently."""
+    def generate_encoding_matrix(self, face_images: List[np.ndarray],
+                                 batch_size: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        Generate L2-normalised encodings for many faces in batched forward passes.
+        Returns: (N x embedding_size) float32 array, or None on failure
+        """
         if not face_images:
-            return []
+            return np.empty((0, self.embedding_size), dtype=np.float32)
 
         try:
-            # Preprocess all faces
-            face_tensors = []
-            for face in face_images:
-                face_tensor = self.preprocess_face(face)
-                face_tensors.append(face_tensor)
+            return self._encode_chunks(len(face_images), lambda s, e: self._embed(face_images[s:e]), batch_size)
 
-            # Stack tensors for batch processing
-            batch_tensor = torch.cat(face_tensors, dim=0)
+        except Exception as e:
+            print(f"Error in batch encoding: {e}")
+            return None
 
-            # Generate embeddings
-            with torch.no_grad():
-                embeddings = self.model(batch_tensor)
+    def generate_encoding_matrix_from_tensors(self, face_tensors: List[Optional["torch.Tensor"]],
+                                              batch_size: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        Encode aligned face tensors straight from the detector (see
+        FaceDetector.detect_and_align_faces_batch with as_tensors), already normalised and
+        at input size, so no image conversion happens.
+        Returns: (N x embedding_size) float32 array in input order, or None on failure
+        """
+        face_tensors = [t for t in face_tensors if t is not None and len(t) > 0]
+        if not face_tensors:
+            return np.empty((0, self.embedding_size), dtype=np.float32)
 
-            # Convert to numpy and normalize
-            embeddings_np = embeddings.cpu().numpy()
-            normalized_embeddings = []
+        import torch
 
-            for embedding in embeddings_np:
-                normalized = embedding / np.linalg.norm(embedding)
-                normalized_embeddings.append(normalized)
+        try:
+            batch = face_tensors[0] if len(face_tensors) == 1 else torch.cat(face_tensors)
+            if tuple(batch.shape[2:]) != (self.image_size, self.image_size):
+                raise ValueError(f"Expected {self.image_size}x{self.image_size} faces, got {tuple(batch.shape[2:])}")
 
-            return normalized_embeddings
+            return self._encode_chunks(len(batch), lambda s, e: self._embed_tensor(batch[s:e]), batch_size)
 
         except Exception as e:
             print(f"Error in batch encoding: {e}")
+            return None
+
+    def _encode_chunks(self, count: int, embed_chunk, batch_size: Optional[int]) -> np.ndarray:
+        batch_size = batch_size or self.max_batch_size
+
+        chunks = []
+        for start in range(0, count, batch_size):
+            # Generate embeddings
+            chunks.append(embed_chunk(start, min(start + batch_size, count)))
+
+        embeddings = np.concatenate(chunks).astype(np.float32, copy=False)
+
+        # L2 normalize all embeddings at once
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    def generate_encoding_batch(self, face_images: List[np.ndarray],
+                                batch_size: Optional[int] = None) -> List[Optional[np.ndarray]]:
+        """Generate encodings for multiple faces efficiently."""
+        embeddings = self.generate_encoding_matrix(face_images, batch_size)
+
+        if embeddings is None:
             return [None] * len(face_images)
 
+        return list(embeddings)
+
     def save_encoding(self, student_id: str, encoding: np.ndarray) -> str:
         """Save encoding to file."""
         filename = f"{student_id}_facenet_encoding.pkl"
@@ -128,19 +219,31 @@ class FaceEncoder:
                 return data['encoding']
         return None
 
-    def save_encoding_to_db(self, encoding: np.ndarray) -> bytes:
-        """Convert encoding to bytes for database storage."""
-        encoding_data = {
-            'encoding': encoding,
-            'model': 'facenet',
-            'embedding_size': self.embedding_size
-        }
-        return pickle.dumps(encoding_data)
+    def save_encoding_to_db(self, encoding: np.ndarray, embeddings: Optional[np.ndarray] = None) -> bytes:
+        """
+        Convert encoding to bytes for database storage (raw float32, see encoding_format).
+        embeddings optionally keeps the individual per-photo encodings as one (K x D) block.
+        """
+        return encode_encoding(encoding, embeddings, model_id=self.model_id)
 
     def load_encoding_from_db(self, encoding_bytes: bytes) -> np.ndarray:
-        """Load encoding from database bytes."""
-        data = pickle.loads(encoding_bytes)
-        return data['encoding']
+        """Load encoding from database bytes (raw or legacy pickle)."""
+        encoding, _ = self.load_embeddings_from_db(encoding_bytes)
+        return encoding
+
+    def load_embeddings_from_db(self, encoding_bytes: bytes) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Load the averaged encoding and the per-photo embedding block from database bytes.
+        Rows stored before per-photo embeddings were kept return the encoding as a 1-row block.
+        """
+        encoding, embeddings, _ = decode_encoding(encoding_bytes)
+
+        if encoding.shape[0] != self.embedding_size:
+            raise ValueError(f"Stored encoding has {encoding.shape[0]} dims, expected {self.embedding_size}")
+
+        if embeddings is None:
+            embeddings = encoding[np.newaxis, :]
+        return encoding, embeddings
 
     def compute_similarity(self, encoding1: np.ndarray, encoding2: np.ndarray) -> float:
         """Compute cosine similarity between two encodings."""
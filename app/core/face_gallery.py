@@ -0,0 +1,168 @@
+# app/core/face_gallery.py
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+from .face_index import FaceIndex, FlatIndex, create_index
+
+
+class FaceGallery:
+    """
+    Known face embeddings held as one contiguous (N x D) float32 matrix of per-student
+    centroids, plus an optional block of individual per-photo embeddings per student.
+    """
+
+    def __init__(self, embedding_size: int = 512, index_type: str = "flat",
+                 ivf_min_size: int = 10000, ivf_n_lists: int = 0, ivf_n_probe: int = 8,
+                 rescore_k: int = 32):
+        self.embedding_size = embedding_size
+        self.embeddings = np.empty((0, embedding_size), dtype=np.float32)
+        self.ids: List[int] = []
+        self.names: List[str] = []
+        self._rows: Dict[int, int] = {}
+
+        # Per-photo embeddings, student row i owns member_embeddings[member_offsets[i]:member_offsets[i + 1]]
+        self.member_embeddings = np.empty((0, embedding_size), dtype=np.float32)
+        self.member_offsets = np.zeros(1, dtype=np.int64)
+
+        # Search backend selection, see face_index.create_index
+        self.index: FaceIndex = FlatIndex()
+        self.index_type = index_type
+        self.ivf_min_size = ivf_min_size
+        self.ivf_n_lists = ivf_n_lists
+        self.ivf_n_probe = ivf_n_probe
+        self.rescore_k = rescore_k
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def build(self, encodings: Sequence[np.ndarray], ids: Sequence[int], names: Sequence[str],
+              embedding_sets: Optional[Sequence[np.ndarray]] = None):
+        """
+        Replace the gallery contents with the given L2-normalised encodings.
+        embedding_sets optionally gives each student's (K x D) per-photo embeddings for re-ranking.
+        """
+        if len(encodings) != len(ids) or len(ids) != len(names):
+            raise ValueError("encodings, ids and names must have the same length")
+        if embedding_sets is not None and len(embedding_sets) != len(ids):
+            raise ValueError("embedding_sets must have one entry per encoding")
+
+        if len(encodings) > 0:
+            matrix = np.stack([np.asarray(e, dtype=np.float32).ravel() for e in encodings])
+        else:
+            matrix = np.empty((0, self.embedding_size), dtype=np.float32)
+
+        member_embeddings = None
+        member_offsets = None
+
+        if embedding_sets is not None and len(embedding_sets) > 0:
+            blocks = [np.asarray(b, dtype=np.float32).reshape(-1, self.embedding_size) for b in embedding_sets]
+            # Every student needs at least one member row, fall back to the centroid
+            blocks = [b if len(b) > 0 else matrix[i:i + 1] for i, b in enumerate(blocks)]
+            member_embeddings = np.concatenate(blocks)
+            member_offsets = np.concatenate([[0], np.cumsum([len(b) for b in blocks])]).astype(np.int64)
+
+        self.attach(matrix, ids, names, member_embeddings, member_offsets)
+
+    def attach(self, embeddings: np.ndarray, ids: Sequence[int], names: Sequence[str],
+               member_embeddings: Optional[np.ndarray] = None, member_offsets: Optional[np.ndarray] = None,
+               index: Optional[FaceIndex] = None):
+        """
+        Use already laid-out arrays as the gallery without copying them (e.g. memory-mapped
+        snapshot files). Builds an index unless a matching one is given.
+        """
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.ids = list(ids)
+        self.names = list(names)
+        self._rows = {student_id: row for row, student_id in enumerate(self.ids)}
+
+        if member_embeddings is not None and member_offsets is not None:
+            self.member_embeddings = np.ascontiguousarray(member_embeddings, dtype=np.float32)
+            self.member_offsets = np.asarray(member_offsets, dtype=np.int64)
+        else:
+            self.member_embeddings = np.empty((0, self.embedding_size), dtype=np.float32)
+            self.member_offsets = np.zeros(1, dtype=np.int64)
+
+        if index is not None:
+            self.use_index(index)
+            return
+
+        self.index = create_index(
+            self.index_type, len(self.ids),
+            ivf_min_size=self.ivf_min_size,
+            n_lists=self.ivf_n_lists,
+            n_probe=self.ivf_n_probe,
+            rescore_k=self.rescore_k
+        )
+        self.index.build(self.embeddings)
+
+    def use_index(self, index: FaceIndex):
+        """Attach a prebuilt (e.g. loaded from disk) index over the current embeddings."""
+        if len(index) != len(self):
+            raise ValueError(f"Index has {len(index)} entries but gallery has {len(self)}")
+        self.index = index
+
+    def index_of(self, student_id: int) -> Optional[int]:
+        """Return the gallery row of a student, or None if not loaded."""
+        return self._rows.get(student_id)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the gallery and its index."""
+        index_bytes = self.index.nbytes
+        if np.may_share_memory(self.index.embeddings, self.embeddings):
+            index_bytes -= self.index.embeddings.nbytes
+        return self.embeddings.nbytes + self.member_embeddings.nbytes + index_bytes
+
+    @property
+    def has_members(self) -> bool:
+        return len(self.member_offsets) == len(self.ids) + 1 and len(self.member_embeddings) > 0
+
+    def members_of(self, row: int) -> np.ndarray:
+        """Per-photo embeddings of a gallery row, or its centroid if none were loaded."""
+        if not self.has_members:
+            return self.embeddings[row:row + 1]
+        return self.member_embeddings[self.member_offsets[row]:self.member_offsets[row + 1]]
+
+    def search(self, queries: np.ndarray, top_k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the most similar gallery rows for each query.
+        Returns: (indices, similarities), both (M x k) and sorted best-first.
+        """
+        return self.index.search(queries, top_k)
+
+    def rerank(self, queries: np.ndarray, candidates: np.ndarray,
+               candidate_scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Re-score each query's candidate rows against their full per-photo embedding sets.
+        A candidate's score is the best of its centroid score and its closest photo.
+        Returns: (best_row, best_similarity) per query, row -1 where there was no candidate
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.embedding_size)
+        best_rows = np.full(queries.shape[0], -1, dtype=np.int64)
+        best_scores = np.zeros(queries.shape[0], dtype=np.float32)
+
+        for q in range(queries.shape[0]):
+            valid = candidates[q] >= 0
+            rows = candidates[q][valid]
+            if rows.size == 0:
+                continue
+
+            scores = candidate_scores[q][valid].astype(np.float32)
+
+            if self.has_members:
+                starts = self.member_offsets[rows]
+                counts = self.member_offsets[rows + 1] - starts
+                section_starts = np.cumsum(counts) - counts
+                member_rows = np.repeat(starts - section_starts, counts) + np.arange(counts.sum())
+                member_scores = self.member_embeddings[member_rows] @ queries[q]
+                scores = np.maximum(scores, np.maximum.reduceat(member_scores, section_starts))
+
+            best = int(np.argmax(scores))
+            best_rows[q] = rows[best]
+            best_scores[q] = scores[best]
+
+        return best_rows, best_scores
+
+    @staticmethod
+    def similarity_to_distance(similarities: np.ndarray) -> np.ndarray:
+        """Euclidean distance between unit vectors, derived from their cosine similarity."""
+        return np.sqrt(np.clip(2.0 - 2.0 * np.asarray(similarities), 0.0, None))
@@ -0,0 +1,374 @@
+# app/core/face_index.py
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Pick the k best columns per row of a score matrix, sorted best-first."""
+    k = min(k, scores.shape[1])
+
+    if k == 1:
+        indices = np.argmax(scores, axis=1)[:, np.newaxis]
+    else:
+        indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, indices, axis=1), axis=1)
+        indices = np.take_along_axis(indices, order, axis=1)
+
+    return indices, np.take_along_axis(scores, indices, axis=1)
+
+
+def _as_queries(queries: np.ndarray) -> np.ndarray:
+    queries = np.asarray(queries, dtype=np.float32)
+    if queries.ndim == 1:
+        queries = queries[np.newaxis, :]
+    return queries
+
+
+def _empty_result(count: int) -> Tuple[np.ndarray, np.ndarray]:
+    return np.empty((count, 0), dtype=np.int64), np.empty((count, 0), dtype=np.float32)
+
+
+class FaceIndex(ABC):
+    """Inner-product search over L2-normalised embeddings."""
+
+    kind = "base"
+
+    def __init__(self):
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return self.embeddings.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the index arrays."""
+        return sum(array.nbytes for array in self.state().values())
+
+    def build(self, embeddings: np.ndarray):
+        """Index the given (N x D) embedding matrix."""
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    @abstractmethod
+    def search(self, queries: np.ndarray, top_k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the top_k most similar rows for each query.
+        Returns: (indices, similarities), both (M x k) and sorted best-first.
+        """
+
+    def state(self) -> dict:
+        """Arrays that fully describe the index."""
+        return {'embeddings': self.embeddings}
+
+    def _restore(self, state: dict):
+        # No copies, so memory-mapped arrays stay mapped
+        self.embeddings = np.ascontiguousarray(state['embeddings'], dtype=np.float32)
+
+    def save(self, path: str):
+        """Save the index to a .npz file."""
+        with open(path, 'wb') as f:
+            np.savez(f, kind=np.array(self.kind), **self.state())
+
+    @classmethod
+    def load(cls, path: str) -> "FaceIndex":
+        """Load an index saved with save(), whatever its kind."""
+        with np.load(path, allow_pickle=False) as data:
+            state = {key: data[key] for key in data.files}
+
+        kind = str(state.pop('kind'))
+        return cls.from_state(kind, state)
+
+    @classmethod
+    def from_state(cls, kind: str, state: dict) -> "FaceIndex":
+        """Recreate an index of the given kind from the arrays returned by state()."""
+        index_class = INDEX_TYPES.get(kind)
+        if index_class is None:
+            raise ValueError(f"Unknown face index kind: {kind}")
+
+        index = index_class()
+        index._restore(state)
+        return index
+
+
+class FlatIndex(FaceIndex):
+    """Exact brute-force search with a single matrix multiply."""
+
+    kind = "flat"
+
+    def search(self, queries: np.ndarray, top_k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        queries = _as_queries(queries)
+        if len(self) == 0 or queries.shape[0] == 0:
+            return _empty_result(queries.shape[0])
+
+        # Both sides are L2-normalised, so the dot product is the cosine similarity
+        return _top_k(queries @ self.embeddings.T, top_k)
+
+
+class IVFIndex(FaceIndex):
+    """
+    Inverted-file index: embeddings are clustered with spherical k-means and a query
+    only scans the n_probe closest clusters. Raising n_probe trades latency for recall.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, n_lists: int = 0, n_probe: int = 8, train_iterations: int = 10, seed: int = 0):
+        super().__init__()
+        self.n_lists = n_lists  # 0 picks roughly sqrt(N) lists at build time
+        self.n_probe = n_probe
+        self.train_iterations = train_iterations
+        self.seed = seed
+
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self.ids = np.empty(0, dtype=np.int64)  # original row of each sorted embedding
+        self.offsets = np.zeros(1, dtype=np.int64)  # list i is rows offsets[i]:offsets[i + 1]
+
+    def build(self, embeddings: np.ndarray):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        count = embeddings.shape[0]
+
+        if count == 0:
+            self.embeddings = embeddings
+            self.centroids = np.empty((0, embeddings.shape[1]), dtype=np.float32)
+            self.ids = np.empty(0, dtype=np.int64)
+            self.offsets = np.zeros(1, dtype=np.int64)
+            return
+
+        n_lists = self.n_lists or int(np.sqrt(count))
+        n_lists = max(1, min(n_lists, count))
+
+        self.centroids = self._train_centroids(embeddings, n_lists)
+        assignments = np.argmax(embeddings @ self.centroids.T, axis=1)
+
+        # Store embeddings sorted by list so every list is one contiguous block
+        order = np.argsort(assignments, kind='stable')
+        self.ids = order.astype(np.int64)
+        self.embeddings = np.ascontiguousarray(embeddings[order])
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))]).astype(np.int64)
+
+        logger.info(f"Built IVF index with {count} embeddings in {n_lists} lists")
+
+    def _train_centroids(self, embeddings: np.ndarray, n_lists: int) -> np.ndarray:
+        """Spherical k-means on a sample of the embeddings."""
+        rng = np.random.default_rng(self.seed)
+
+        sample_size = min(embeddings.shape[0], n_lists * 64)
+        sample = embeddings[rng.choice(embeddings.shape[0], sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(self.train_iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+
+            # Re-seed lists that lost all their members
+            empty = np.bincount(assignments, minlength=n_lists) == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+        return centroids.astype(np.float32)
+
+    def search(self, queries: np.ndarray, top_k: int = 1,
+               n_probe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        queries = _as_queries(queries)
+        if len(self) == 0 or queries.shape[0] == 0:
+            return _empty_result(queries.shape[0])
+
+        n_probe = max(1, min(n_probe or self.n_probe, self.centroids.shape[0]))
+        probed_lists, _ = _top_k(queries @ self.centroids.T, n_probe)
+
+        k = min(top_k, len(self))
+        candidate_ids = [[] for _ in range(queries.shape[0])]
+        candidate_scores = [[] for _ in range(queries.shape[0])]
+
+        # Scan list by list so each list block is scored against all queries probing it at once
+        for list_id in np.unique(probed_lists):
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            if start == end:
+                continue
+
+            query_rows = np.nonzero((probed_lists == list_id).any(axis=1))[0]
+            best, best_scores = _top_k(queries[query_rows] @ self.embeddings[start:end].T, k)
+
+            for j, q in enumerate(query_rows):
+                candidate_ids[q].append(self.ids[start + best[j]])
+                candidate_scores[q].append(best_scores[j])
+
+        indices = np.full((queries.shape[0], k), -1, dtype=np.int64)
+        similarities = np.full((queries.shape[0], k), -np.inf, dtype=np.float32)
+
+        for q in range(queries.shape[0]):
+            if not candidate_ids[q]:
+                continue
+
+            ids = np.concatenate(candidate_ids[q])
+            best, best_scores = _top_k(np.concatenate(candidate_scores[q])[np.newaxis, :], k)
+            found = best.shape[1]
+            indices[q, :found] = ids[best[0]]
+            similarities[q, :found] = best_scores[0]
+
+        return indices, similarities
+
+    def state(self) -> dict:
+        return {
+            'embeddings': self.embeddings,
+            'centroids': self.centroids,
+            'ids': self.ids,
+            'offsets': self.offsets,
+            'params': np.array([self.n_lists, self.n_probe, self.train_iterations, self.seed], dtype=np.int64)
+        }
+
+    def _restore(self, state: dict):
+        super()._restore(state)
+        self.centroids = np.asarray(state['centroids'], dtype=np.float32)
+        self.ids = np.asarray(state['ids'], dtype=np.int64)
+        self.offsets = np.asarray(state['offsets'], dtype=np.int64)
+        self.n_lists, self.n_probe, self.train_iterations, self.seed = (int(p) for p in state['params'])
+
+
+class QuantizedIndex(FaceIndex):
+    """
+    Flat search over a compressed copy of the embeddings. The compressed matrix is scanned
+    in chunks to shortlist rescore_k candidates, which are then re-scored exactly against
+    the float32 embeddings. Only worth it when those embeddings are a memory-mapped snapshot,
+    so just the shortlisted rows are read: otherwise the float32 matrix stays resident next
+    to the codes and the index costs more memory than FlatIndex, and it is slower anyway.
+    """
+
+    kind = "quantized"
+    chunk_rows = 4096  # rows decompressed per matmul, keeps the float32 scratch buffer in cache
+
+    def __init__(self, rescore_k: int = 32):
+        super().__init__()
+        self.rescore_k = rescore_k
+        self.codes = np.empty((0, 0), dtype=np.float32)
+
+    @property
+    def code_nbytes(self) -> int:
+        """Memory of the compressed matrix scanned on every search."""
+        return sum(array.nbytes for key, array in self.state().items() if key not in ('embeddings', 'params'))
+
+    @abstractmethod
+    def _quantize(self, embeddings: np.ndarray):
+        """Fill the compressed arrays from the (N x D) float32 embeddings."""
+
+    @abstractmethod
+    def _chunk_scores(self, queries: np.ndarray, start: int, end: int) -> np.ndarray:
+        """Approximate (M x (end - start)) scores against rows start:end of the compressed matrix."""
+
+    def build(self, embeddings: np.ndarray):
+        super().build(embeddings)
+        self._quantize(self.embeddings)
+
+    def search(self, queries: np.ndarray, top_k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        queries = _as_queries(queries)
+        if len(self) == 0 or queries.shape[0] == 0:
+            return _empty_result(queries.shape[0])
+
+        shortlist_k = min(max(self.rescore_k, top_k), len(self))
+        shortlist = np.empty((queries.shape[0], 0), dtype=np.int64)
+        shortlist_scores = np.empty((queries.shape[0], 0), dtype=np.float32)
+
+        # Keep a running shortlist while scanning the compressed matrix chunk by chunk
+        for start in range(0, len(self), self.chunk_rows):
+            end = min(start + self.chunk_rows, len(self))
+            chunk_best, chunk_scores = _top_k(self._chunk_scores(queries, start, end), shortlist_k)
+
+            merged = np.concatenate([shortlist, chunk_best + start], axis=1)
+            merged_scores = np.concatenate([shortlist_scores, chunk_scores], axis=1)
+            best, shortlist_scores = _top_k(merged_scores, shortlist_k)
+            shortlist = np.take_along_axis(merged, best, axis=1)
+
+        # Exact float32 re-scoring of the shortlisted rows only
+        exact = np.einsum('mkd,md->mk', self.embeddings[shortlist], queries)
+        best, similarities = _top_k(exact, top_k)
+        return np.take_along_axis(shortlist, best, axis=1), similarities
+
+    def state(self) -> dict:
+        return {
+            'embeddings': self.embeddings,
+            'codes': self.codes,
+            'params': np.array([self.rescore_k], dtype=np.int64)
+        }
+
+    def _restore(self, state: dict):
+        super()._restore(state)
+        self.codes = np.asarray(state['codes'])
+        self.rescore_k = int(state['params'][0])
+
+
+class Float16Index(QuantizedIndex):
+    """Half-precision copy of the embeddings, half the memory of float32."""
+
+    kind = "fp16"
+
+    def _quantize(self, embeddings: np.ndarray):
+        self.codes = embeddings.astype(np.float16)
+
+    def _chunk_scores(self, queries: np.ndarray, start: int, end: int) -> np.ndarray:
+        # NumPy has no fast float16 matmul, so widen one chunk at a time
+        return queries @ self.codes[start:end].astype(np.float32).T
+
+
+class Int8Index(QuantizedIndex):
+    """Symmetric per-vector int8 codes, a quarter of the memory of float32."""
+
+    kind = "int8"
+
+    def __init__(self, rescore_k: int = 32):
+        super().__init__(rescore_k)
+        self.codes = np.empty((0, 0), dtype=np.int8)
+        self.scales = np.empty(0, dtype=np.float32)
+
+    def _quantize(self, embeddings: np.ndarray):
+        # x ~= scale * codes with codes in [-127, 127], one scale per vector
+        max_abs = np.max(np.abs(embeddings), axis=1) if len(embeddings) else np.empty(0, dtype=np.float32)
+        self.scales = (np.maximum(max_abs, 1e-12) / 127.0).astype(np.float32)
+        self.codes = np.round(embeddings / self.scales[:, np.newaxis]).astype(np.int8)
+
+    def _chunk_scores(self, queries: np.ndarray, start: int, end: int) -> np.ndarray:
+        return (queries @ self.codes[start:end].astype(np.float32).T) * self.scales[start:end]
+
+    def state(self) -> dict:
+        state = super().state()
+        state['scales'] = self.scales
+        return state
+
+    def _restore(self, state: dict):
+        super()._restore(state)
+        self.scales = np.asarray(state['scales'], dtype=np.float32)
+
+
+INDEX_TYPES = {
+    FlatIndex.kind: FlatIndex,
+    IVFIndex.kind: IVFIndex,
+    Float16Index.kind: Float16Index,
+    Int8Index.kind: Int8Index,
+}
+
+
+def create_index(index_type: str, gallery_size: int, ivf_min_size: int = 10000,
+                 n_lists: int = 0, n_probe: int = 8, rescore_k: int = 32) -> FaceIndex:
+    """
+    Create an index for a gallery of the given size.
+    index_type is "flat", "ivf", "fp16", "int8" or "auto" (IVF once the gallery reaches ivf_min_size).
+    """
+    if index_type == "auto":
+        index_type = IVFIndex.kind if gallery_size >= ivf_min_size else FlatIndex.kind
+
+    if index_type == FlatIndex.kind:
+        return FlatIndex()
+    if index_type == IVFIndex.kind:
+        return IVFIndex(n_lists=n_lists, n_probe=n_probe)
+    if index_type == Float16Index.kind:
+        return Float16Index(rescore_k=rescore_k)
+    if index_type == Int8Index.kind:
+        return Int8Index(rescore_k=rescore_k)
+
+    raise ValueError(f"Unknown face index type: {index_type}")
@@ -0,0 +1,123 @@
+# app/core/face_quality.py
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+# MTCNN landmark order
+_LEFT_EYE, _RIGHT_EYE, _NOSE = 0, 1, 2
+
+
+def laplacian_variance(gray_faces: np.ndarray) -> np.ndarray:
+    """
+    Sharpness of a (K x H x W) stack of grayscale faces, the same measure as
+    cv2.Laplacian(face, cv2.CV_64F).var() but for the whole stack at once.
+    Returns: (K,) array
+    """
+    gray_faces = gray_faces.astype(np.float32, copy=False)
+    center = gray_faces[:, 1:-1, 1:-1]
+    laplacian = (gray_faces[:, :-2, 1:-1] + gray_faces[:, 2:, 1:-1] +
+                 gray_faces[:, 1:-1, :-2] + gray_faces[:, 1:-1, 2:] - 4 * center)
+    return laplacian.reshape(len(laplacian), -1).var(axis=1)
+
+
+def landmark_pose(landmarks: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Rough head pose from (K x 5 x 2) MTCNN landmarks.
+    yaw: nose offset from the eye midpoint in half eye distances, 0 frontal, about 1 when
+         the nose lines up with an eye (profile)
+    roll: tilt of the eye line in degrees
+    Returns: {'yaw': (K,), 'roll': (K,)}
+    """
+    left_eye, right_eye, nose = landmarks[:, _LEFT_EYE], landmarks[:, _RIGHT_EYE], landmarks[:, _NOSE]
+    eye_vector = right_eye - left_eye
+    eye_distance = np.maximum(np.linalg.norm(eye_vector, axis=1), 1e-6)
+
+    # Nose offset along the eye line, so roll doesn't read as yaw
+    nose_offset = np.einsum('ij,ij->i', nose - (left_eye + right_eye) / 2, eye_vector) / eye_distance
+    return {
+        'yaw': np.abs(nose_offset) / (eye_distance / 2),
+        'roll': np.degrees(np.arctan2(np.abs(eye_vector[:, 1]), np.abs(eye_vector[:, 0])))
+    }
+
+
+@dataclass
+class QualityStats:
+    faces_checked: int = 0
+    faces_kept: int = 0
+    dropped: Dict[str, int] = field(default_factory=lambda: {
+        'probability': 0, 'size': 0, 'pose': 0, 'sharpness': 0
+    })
+
+    def as_dict(self) -> Dict:
+        return {
+            'faces_checked': self.faces_checked,
+            'faces_kept': self.faces_kept,
+            'encoder_calls_saved': self.faces_checked - self.faces_kept,
+            'dropped': dict(self.dropped)
+        }
+
+
+class FaceQualityGate:
+    """
+    Drops detected faces that can't produce a confident match before they are encoded:
+    low MTCNN probability, too small, turned too far away (landmark pose) or blurred.
+    Other detectors' scores aren't on MTCNN's scale, they are already filtered by their own
+    threshold (e.g. YUNET_SCORE_THRESHOLD), so the probability check is skipped for them.
+    The detection-level checks run before faces are cropped, sharpness on the aligned crops.
+    """
+
+    def __init__(self, min_probability: float = 0.95, min_face_size: int = 40, max_yaw: float = 0.6,
+                 max_roll: float = 30.0, min_sharpness: float = 25.0):
+        self.min_probability = min_probability
+        self.min_face_size = min_face_size  # Shorter box side in frame pixels
+        self.max_yaw = max_yaw
+        self.max_roll = max_roll
+        self.min_sharpness = min_sharpness  # Laplacian variance of the aligned grayscale crop
+
+        self.stats = QualityStats()
+
+    def check_detections(self, boxes: np.ndarray, probs: np.ndarray, landmarks: Optional[np.ndarray],
+                         check_probability: bool = True) -> np.ndarray:
+        """
+        check_probability is False for detectors whose probabilities aren't MTCNN's.
+        Returns: (K,) bool mask of faces that pass the probability, size and pose checks
+        """
+        self.stats.faces_checked += len(boxes)
+
+        if check_probability:
+            keep = np.asarray(probs, dtype=np.float64) >= self.min_probability
+        else:
+            keep = np.ones(len(boxes), dtype=bool)
+        self.stats.dropped['probability'] += int(np.count_nonzero(~keep))
+
+        sizes = np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+        small = keep & (sizes < self.min_face_size)
+        self.stats.dropped['size'] += int(np.count_nonzero(small))
+        keep &= ~small
+
+        if landmarks is not None:
+            pose = landmark_pose(landmarks)
+            turned = keep & ((pose['yaw'] > self.max_yaw) | (pose['roll'] > self.max_roll))
+            self.stats.dropped['pose'] += int(np.count_nonzero(turned))
+            keep &= ~turned
+
+        self.stats.faces_kept += int(np.count_nonzero(keep))
+        return keep
+
+    def check_sharpness(self, aligned_faces) -> np.ndarray:
+        """
+        aligned_faces: (K x 3 x H x W) normalised tensor as MTCNN extracts it.
+        Returns: (K,) bool mask of faces sharp enough to encode
+        """
+        # Undo (x - 127.5) / 128 so the threshold is in gray levels like validate_photo_quality
+        faces = aligned_faces.detach().cpu().numpy()
+        gray = (faces[:, 0] * 0.299 + faces[:, 1] * 0.587 + faces[:, 2] * 0.114) * 128
+        keep = laplacian_variance(gray) >= self.min_sharpness
+
+        blurred = int(np.count_nonzero(~keep))
+        self.stats.dropped['sharpness'] += blurred
+        self.stats.faces_kept -= blurred
+        return keep
+
+    def get_stats(self) -> Dict:
+        return self.stats.as_dict()
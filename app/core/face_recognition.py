@@ -7,6 +7,9 @@ import logging
 from config import settings
 from .face_detection import FaceDetector
 from .face_encoding import FaceEncoder
+from .face_gallery import FaceGallery
+from .face_index import FlatIndex, Float16Index, Int8Index
+from .face_quality import FaceQualityGate
 
 logger = logging.getLogger(__name__)
 
@@ -15,96 +18,206 @@ class FaceRecognitionSystem:
     def __init__(self):
         self.detector = FaceDetector()
         self.encoder = FaceEncoder()
-        self.known_face_encodings: List[np.ndarray] = []
-        self.known_face_names: List[str] = []
-        self.known_face_ids: List[int] = []
+
+        self.index_type = settings.face_index_type
+        if self.index_type in (Float16Index.kind, Int8Index.kind) and not settings.enable_gallery_snapshots:
+            # Quantized indexes only save memory when the float32 matrix they re-score against is memory-mapped
+            logger.warning(f"FACE_INDEX_TYPE={self.index_type} needs ENABLE_GALLERY_SNAPSHOTS, using the flat index")
+            self.index_type = FlatIndex.kind
+        self.gallery = self.create_gallery()
 
         # FaceNet uses cosine similarity, so we use different thresholds
         self.similarity_threshold = 0.6  # Cosine similarity threshold
         self.confidence_threshold = 0.7  # Minimum confidence for positive match
+        self.distance_threshold = 1.2  # FaceNet typically uses distance threshold around 1.0-1.2
+        self.rerank_top_k = settings.rerank_top_k  # Centroid candidates re-scored on per-photo embeddings
+        self.tensor_pipeline = settings.face_tensor_pipeline  # Aligned tensors go to the encoder as they are
 
-    def load_known_faces(self, students: List[Dict]):
-        """Load known faces from database."""
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.known_face_ids = []
+        # Faces too small, blurred or turned away to match confidently are dropped before encoding
+        self.quality_gate = FaceQualityGate(
+            min_probability=settings.quality_min_probability,
+            min_face_size=settings.quality_min_face_size,
+            max_yaw=settings.quality_max_yaw,
+            max_roll=settings.quality_max_roll,
+            min_sharpness=settings.quality_min_sharpness
+        ) if settings.face_quality_gate else None
+
+    @property
+    def known_face_encodings(self) -> np.ndarray:
+        return self.gallery.embeddings
+
+    @property
+    def known_face_names(self) -> List[str]:
+        return self.gallery.names
+
+    @property
+    def known_face_ids(self) -> List[int]:
+        return self.gallery.ids
+
+    def create_gallery(self) -> FaceGallery:
+        """Create an empty gallery configured from settings."""
+        return FaceGallery(
+            self.encoder.embedding_size,
+            index_type=self.index_type,
+            ivf_min_size=settings.ivf_min_gallery_size,
+            ivf_n_lists=settings.ivf_n_lists,
+            ivf_n_probe=settings.ivf_n_probe,
+            rescore_k=settings.quantized_rescore_k
+        )
+
+    def build_gallery(self, students: List[Dict]) -> FaceGallery:
+        """Build a new gallery from student rows without touching the active one."""
+        encodings = []
+        embedding_sets = []
+        names = []
+        ids = []
 
         for student in students:
             if student.get('face_encoding'):
-                encoding = self.encoder.load_encoding_from_db(student['face_encoding'])
-                self.known_face_encodings.append(encoding)
-                self.known_face_names.append(student['full_name'])
-                self.known_face_ids.append(student['id'])
+                encoding, embeddings = self.encoder.load_embeddings_from_db(student['face_encoding'])
+                encodings.append(encoding)
+                embedding_sets.append(embeddings)
+                names.append(student['full_name'])
+                ids.append(student['id'])
+
+        gallery = self.create_gallery()
+        gallery.build(encodings, ids, names, embedding_sets)
+        return gallery
+
+    def set_gallery(self, gallery: FaceGallery):
+        """Switch matching to an already built (possibly shared) gallery."""
+        self.gallery = gallery
 
-        logger.info(f"Loaded {len(self.known_face_encodings)} known faces")
+    def load_known_faces(self, students: List[Dict]):
+        """Load known faces from database."""
+        self.set_gallery(self.build_gallery(students))
+
+        logger.info(f"Loaded {len(self.gallery)} known faces")
 
-    def recognize_faces(self, image: np.ndarray) -> List[Dict]:
+    def match_encodings(self, face_encodings: np.ndarray) -> List[Tuple[Optional[int], float]]:
+        """
+        Match a batch of face encodings against the gallery.
+        Returns: List of (gallery_index or None, confidence) per encoding
+        """
+        if len(face_encodings) == 0:
+            return []
+
+        if len(self.gallery) == 0:
+            return [(None, 0.0)] * len(face_encodings)
+
+        if self.gallery.has_members:
+            # Fast pass against centroids, then re-rank the top candidates on their per-photo embeddings
+            indices, similarities = self.gallery.search(face_encodings, top_k=self.rerank_top_k)
+            best_indices, best_similarities = self.gallery.rerank(face_encodings, indices, similarities)
+        else:
+            indices, similarities = self.gallery.search(face_encodings, top_k=1)
+            best_indices = indices[:, 0]
+            # Approximate indexes mark queries whose probed lists were empty with -1
+            best_similarities = np.where(best_indices >= 0, similarities[:, 0], 0.0)
+
+        # Distance verification comes from the same scores since both vectors are unit length
+        distances = FaceGallery.similarity_to_distance(best_similarities)
+        above_threshold = best_similarities >= self.similarity_threshold
+        too_far = above_threshold & (distances > self.distance_threshold)
+
+        matches = []
+        for i in range(len(best_indices)):
+            if too_far[i]:
+                matches.append((None, 0.0))
+            elif above_threshold[i]:
+                matches.append((int(best_indices[i]), float(best_similarities[i])))
+            else:
+                matches.append((None, float(best_similarities[i])))
+
+        return matches
+
+    def recognize_faces(self, image: np.ndarray, detection_scale: Optional[float] = None) -> List[Dict]:
         """
         Recognize faces in an image using FaceNet.
         Returns: List of dicts with face info (name, id, location, confidence)
         """
-        # Detect and align faces
-        aligned_faces, face_locations = self.detector.detect_and_align_faces(image)
+        return self.recognize_faces_batch([image], [detection_scale])[0]
 
-        if not aligned_faces:
-            return []
+    def recognize_faces_batch(self, images: List[np.ndarray],
+                              detection_scales: Optional[List[Optional[float]]] = None,
+                              detector_backends: Optional[List[Optional[str]]] = None) -> List[List[Dict]]:
+        """
+        Recognize faces in several frames, encoding every face in batched forward passes.
+        detection_scales and detector_backends optionally give each frame its own detection
+        downscale factor and detector.
+        Returns: One result list per input image
+        """
+        return self.recognize_detections(self.detect_faces_batch(images, detection_scales, detector_backends))
+
+    def detect_faces_batch(self, images: List[np.ndarray],
+                           detection_scales: Optional[List[Optional[float]]] = None,
+                           detector_backends: Optional[List[Optional[str]]] = None) -> List[Tuple]:
+        """
+        Detect and align faces in several frames, equally sized frames share one MTCNN pass.
+        Returns: One (aligned_faces, face_locations) per input image, for recognize_detections
+        """
+        return self.detector.detect_and_align_faces_batch(
+            images, detection_scales, as_tensors=self.tensor_pipeline, quality_gate=self.quality_gate,
+            backends=detector_backends
+        )
+
+    def recognize_detections(self, detections: List[Tuple],
+                             selected: Optional[List[List[int]]] = None) -> List[List[Dict]]:
+        """
+        Encode and match faces from detect_faces_batch. selected optionally limits, per frame,
+        which face indices are encoded (e.g. only faces a tracker can't vouch for).
+        Returns: One result list per frame, in the order of its (selected) faces
+        """
+        all_faces = []
+        all_locations = []
+        frame_indices = []
 
-        # Generate encodings for detected faces
-        face_encodings = []
-        for aligned_face in aligned_faces:
-            encoding = self.encoder.generate_encoding(aligned_face)
-            if encoding is not None:
-                face_encodings.append(encoding)
-
-        results = []
-
-        for i, (face_encoding, face_location) in enumerate(zip(face_encodings, face_locations)):
-            name = "Unknown"
-            student_id = None
-            best_similarity = 0.0
-
-            if len(self.known_face_encodings) > 0:
-                # Compute similarities with all known faces
-                similarities = []
-                for known_encoding in self.known_face_encodings:
-                    similarity = self.encoder.compute_similarity(face_encoding, known_encoding)
-                    similarities.append(similarity)
-
-                # Find best match
-                best_match_index = np.argmax(similarities)
-                best_similarity = similarities[best_match_index]
-
-                # Check if similarity exceeds threshold
-                if best_similarity >= self.similarity_threshold:
-                    name = self.known_face_names[best_match_index]
-                    student_id = self.known_face_ids[best_match_index]
-
-                    # Additional verification with distance metric
-                    distance = self.encoder.compute_distance(
-                        face_encoding,
-                        self.known_face_encodings[best_match_index]
-                    )
-
-                    # FaceNet typically uses distance threshold around 1.0-1.2
-                    if distance > 1.2:
-                        name = "Unknown"
-                        student_id = None
-                        best_similarity = 0.0
-
-            results.append({
-                'name': name,
-                'student_id': student_id,
+        for frame_index, (aligned_faces, face_locations) in enumerate(detections):
+            if aligned_faces is None:
+                continue
+            indices = range(len(face_locations)) if selected is None else selected[frame_index]
+            if not indices:
+                continue
+
+            if self.tensor_pipeline:
+                all_faces.append(aligned_faces if selected is None else aligned_faces[list(indices)])
+            else:
+                all_faces.extend(aligned_faces[i] for i in indices)
+            all_locations.extend(face_locations[i] for i in indices)
+            frame_indices.extend([frame_index] * len(indices))
+
+        results: List[List[Dict]] = [[] for _ in detections]
+
+        if not all_locations:
+            return results
+
+        # Generate encodings for all detected faces at once
+        if self.tensor_pipeline:
+            face_encodings = self.encoder.generate_encoding_matrix_from_tensors(all_faces)
+        else:
+            face_encodings = self.encoder.generate_encoding_matrix(all_faces)
+        if face_encodings is None:
+            return results
+
+        matches = self.match_encodings(face_encodings)
+        timestamp = datetime.now()
+
+        for (gallery_index, confidence), face_location, frame_index in zip(matches, all_locations, frame_indices):
+            results[frame_index].append({
+                'name': self.gallery.names[gallery_index] if gallery_index is not None else "Unknown",
+                'student_id': self.gallery.ids[gallery_index] if gallery_index is not None else None,
                 'location': face_location,
-                'confidence': float(best_similarity),
-                'timestamp': datetime.now()
+                'confidence': confidence,
+                'timestamp': timestamp
             })
 
         return results
 
-    def process_frame(self, frame: np.ndarray) -> Tuple[np.ndarray, List[Dict]]:
+    def process_frame(self, frame: np.ndarray,
+                      detection_scale: Optional[float] = None) -> Tuple[np.ndarray, List[Dict]]:
         """Process a single frame and return annotated image with recognition results."""
         # Recognize faces
-        results = self.recognize_faces(frame)
+        results = self.recognize_faces(frame, detection_scale)
 
         # Draw boxes and labels
         names = [r['name'] for r in results]
@@ -128,18 +241,20 @@ class FaceRecognitionSystem:
             return False, 0.0
 
         # Find the student's encoding
-        try:
-            student_index = self.known_face_ids.index(student_id)
-            known_encoding = self.known_face_encodings[student_index]
+        student_index = self.gallery.index_of(student_id)
+        if student_index is None:
+            # Student not found in known faces
+            return False, 0.0
 
-            # Compute similarity
-            similarity = self.encoder.compute_similarity(face_encoding, known_encoding)
+        known_encoding = self.gallery.embeddings[student_index]
 
-            # Check if it's a match
-            is_match = similarity >= self.similarity_threshold
+        # Compute similarity against the averaged encoding and each enrolled photo
+        similarity = max(
+            self.encoder.compute_similarity(face_encoding, known_encoding),
+            float(np.max(self.gallery.members_of(student_index) @ face_encoding))
+        )
 
-            return is_match, float(similarity)
+        # Check if it's a match
+        is_match = similarity >= self.similarity_threshold
 
-        except ValueError:
-            # Student not found in known faces
-            return False, 0.0
\ No newline at end of file
+        return is_match, float(similarity)
\ No newline at end of file
@@ -0,0 +1,198 @@
+# app/core/face_tracker.py
+import numpy as np
+from dataclasses import dataclass
+from typing import AbstractSet, Dict, List, Optional, Sequence, Tuple
+
+# Box state is (cx, cy, w, h) plus their per-frame velocities, constant velocity model
+_STATE_SIZE = 8
+_TRANSITION = np.eye(_STATE_SIZE) + np.eye(_STATE_SIZE, k=4)
+_MEASUREMENT = np.eye(4, _STATE_SIZE)
+
+
+def _to_xywh(location: Tuple[int, int, int, int]) -> np.ndarray:
+    top, right, bottom, left = location
+    return np.array([(left + right) / 2, (top + bottom) / 2, right - left, bottom - top], dtype=np.float64)
+
+
+def _to_xyxy(boxes: np.ndarray) -> np.ndarray:
+    """(N x 4) (cx, cy, w, h) -> (N x 4) (x1, y1, x2, y2)"""
+    half = boxes[:, 2:4] / 2
+    return np.concatenate([boxes[:, :2] - half, boxes[:, :2] + half], axis=1)
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (N x 4) and (M x 4) [x1, y1, x2, y2] boxes. Returns: (N x M) array"""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+
+@dataclass
+class BoxTrack:
+    """One face followed across frames of a camera by its box, with the identity last recognised for it."""
+    track_id: int
+    state: np.ndarray
+    covariance: np.ndarray
+    student_id: Optional[int] = None
+    name: str = "Unknown"
+    confidence: float = 0.0
+    hits: int = 1
+    misses: int = 0
+    frames_since_encoding: int = 0
+    encoded: bool = False
+
+    @property
+    def box(self) -> np.ndarray:
+        return self.state[:4]
+
+
+@dataclass
+class TrackAssignment:
+    """Per-frame result of BoxTracker.update for one detection."""
+    track: BoxTrack
+    needs_encoding: bool
+
+
+@dataclass
+class TrackerStats:
+    frames: int = 0
+    faces: int = 0
+    faces_encoded: int = 0
+    tracks_created: int = 0
+
+    def as_dict(self) -> Dict:
+        return {
+            'frames': self.frames,
+            'faces': self.faces,
+            'faces_encoded': self.faces_encoded,
+            'faces_reused': self.faces - self.faces_encoded,
+            'encoded_per_frame': self.faces_encoded / self.frames if self.frames else 0.0,
+            'tracks_created': self.tracks_created
+        }
+
+
+class BoxTracker:
+    """
+    SORT-style tracker for one camera: a small Kalman filter per face predicts where its box
+    moves, detections are associated to tracks by IoU, and a track keeps the identity it was
+    recognised with. A detection only needs a new embedding when its track is new, its
+    identity is unknown, low confidence or not yet confirmed by the caller, or it hasn't been
+    re-verified for reencode_interval frames.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_misses: int = 5, reencode_interval: int = 10,
+                 min_confidence: float = 0.75):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.reencode_interval = reencode_interval
+        self.min_confidence = min_confidence
+
+        self.tracks: List[BoxTrack] = []
+        self.stats = TrackerStats()
+        self._next_id = 1
+
+    def reset(self):
+        self.tracks = []
+
+    def _predict(self):
+        process_noise = np.diag([1.0, 1.0, 1.0, 1.0, 0.1, 0.1, 0.01, 0.01])
+        for track in self.tracks:
+            track.state = _TRANSITION @ track.state
+            # Keep the predicted size positive
+            track.state[2:4] = np.maximum(track.state[2:4], 1.0)
+            track.covariance = _TRANSITION @ track.covariance @ _TRANSITION.T + process_noise
+
+    @staticmethod
+    def _correct(track: BoxTrack, measurement: np.ndarray):
+        measurement_noise = np.diag([1.0, 1.0, 10.0, 10.0])
+        innovation_covariance = _MEASUREMENT @ track.covariance @ _MEASUREMENT.T + measurement_noise
+        gain = track.covariance @ _MEASUREMENT.T @ np.linalg.inv(innovation_covariance)
+        track.state = track.state + gain @ (measurement - _MEASUREMENT @ track.state)
+        track.covariance = (np.eye(_STATE_SIZE) - gain @ _MEASUREMENT) @ track.covariance
+
+    def _create_track(self, measurement: np.ndarray) -> BoxTrack:
+        state = np.zeros(_STATE_SIZE)
+        state[:4] = measurement
+        # Velocities start unknown
+        covariance = np.diag([10.0, 10.0, 10.0, 10.0, 1000.0, 1000.0, 1000.0, 1000.0])
+        track = BoxTrack(track_id=self._next_id, state=state, covariance=covariance)
+        self._next_id += 1
+        self.stats.tracks_created += 1
+        self.tracks.append(track)
+        return track
+
+    def _associate(self, measurements: np.ndarray) -> Dict[int, int]:
+        """Greedy highest-IoU-first matching. Returns: detection index -> track index"""
+        if not self.tracks or len(measurements) == 0:
+            return {}
+
+        iou = box_iou(_to_xyxy(measurements), _to_xyxy(np.stack([t.box for t in self.tracks])))
+        matches = {}
+        used_tracks = set()
+        for flat_index in np.argsort(-iou, axis=None):
+            detection_index, track_index = np.unravel_index(flat_index, iou.shape)
+            if iou[detection_index, track_index] < self.iou_threshold:
+                break
+            if detection_index in matches or track_index in used_tracks:
+                continue
+            matches[int(detection_index)] = int(track_index)
+            used_tracks.add(int(track_index))
+        return matches
+
+    def _needs_encoding(self, track: BoxTrack, confirmed: Optional[AbstractSet[int]]) -> bool:
+        return (not track.encoded or
+                track.student_id is None or
+                track.confidence < self.min_confidence or
+                track.frames_since_encoding >= self.reencode_interval or
+                (confirmed is not None and track.student_id not in confirmed))
+
+    def update(self, locations: Sequence[Tuple[int, int, int, int]],
+               confirmed: Optional[AbstractSet[int]] = None) -> List[TrackAssignment]:
+        """
+        Advance the tracks by one frame with this frame's face locations (top, right, bottom, left).
+        confirmed optionally lists the student ids that need no more fresh matches, tracks
+        holding any other identity are then re-encoded every frame.
+        Returns: One assignment per location, in order
+        """
+        self._predict()
+
+        measurements = np.array([_to_xywh(loc) for loc in locations]).reshape(-1, 4)
+        matches = self._associate(measurements)
+
+        assignments = []
+        matched_tracks = set()
+        for i, measurement in enumerate(measurements):
+            if i in matches:
+                track = self.tracks[matches[i]]
+                self._correct(track, measurement)
+                track.hits += 1
+                track.misses = 0
+                track.frames_since_encoding += 1
+            else:
+                track = self._create_track(measurement)
+            matched_tracks.add(track.track_id)
+            assignments.append(TrackAssignment(track, self._needs_encoding(track, confirmed)))
+
+        for track in self.tracks:
+            if track.track_id not in matched_tracks:
+                track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        self.stats.frames += 1
+        self.stats.faces += len(assignments)
+        self.stats.faces_encoded += sum(a.needs_encoding for a in assignments)
+        return assignments
+
+    @staticmethod
+    def record_recognition(track: BoxTrack, result: Dict):
+        """Store a fresh recognition result on the track it was encoded for."""
+        track.student_id = result.get('student_id')
+        track.name = result.get('name', "Unknown")
+        track.confidence = float(result.get('confidence', 0.0))
+        track.frames_since_encoding = 0
+        track.encoded = True
@@ -0,0 +1,142 @@
+# app/core/ffmpeg_capture.py
+"""
+Camera capture through an ffmpeg subprocess instead of cv2.VideoCapture. ffmpeg drops frames
+to the processing rate and scales them before they reach Python (-vf fps=...,scale=...),
+and the raw BGR frames are read from its stdout straight into preallocated arrays.
+"""
+import logging
+import subprocess
+import threading
+import numpy as np
+from typing import List, Optional, Tuple, Union
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class FFmpegCapture:
+    """
+    The part of the cv2.VideoCapture interface CameraStream uses (isOpened, grab, retrieve,
+    read, release), for a stream URL, a local video file or a USB camera index.
+    Every frame it delivers already is at the requested fps and resolution, so callers
+    shouldn't drop frames themselves.
+    """
+
+    def __init__(self, source: Union[int, str], resolution: Tuple[int, int], fps: Optional[float] = None,
+                 realtime: bool = False, ffmpeg_binary: Optional[str] = None):
+        self.source = source
+        self.width, self.height = resolution
+        self.fps = fps  # None keeps the source rate
+        self.realtime = realtime  # Play files at their own rate, like a live camera
+        self.ffmpeg_binary = ffmpeg_binary or settings.ffmpeg_binary
+
+        self.frame_size = self.width * self.height * 3
+        self._frame = self._new_frame()
+        self._grabbed = False
+        self._process: Optional[subprocess.Popen] = None
+        self._release_lock = threading.Lock()  # release() also runs from CameraStream.stop() on another thread
+        self.open()
+
+    def _new_frame(self) -> np.ndarray:
+        return np.empty((self.height, self.width, 3), dtype=np.uint8)
+
+    def command(self) -> List[str]:
+        """The ffmpeg command line."""
+        command = [self.ffmpeg_binary, "-hide_banner", "-loglevel", "error", "-nostdin"]
+
+        source = self.source
+        if isinstance(source, int):
+            command += ["-f", "v4l2", "-i", f"/dev/video{source}"]
+        else:
+            if source.startswith("rtsp://"):
+                # TCP avoids smeared frames from lost UDP packets, timeout is in microseconds
+                command += ["-rtsp_transport", "tcp", "-timeout", "5000000"]
+            elif source.startswith(("http://", "https://")):
+                command += ["-rw_timeout", "5000000"]
+            if source.startswith(("rtsp://", "http://", "https://")):
+                command += ["-fflags", "nobuffer", "-flags", "low_delay"]
+            elif self.realtime:
+                command += ["-re"]
+            command += ["-i", source]
+
+        # fps first, so frames it drops are never scaled or converted
+        filters = ([f"fps={self.fps}"] if self.fps else []) + [f"scale={self.width}:{self.height}"]
+        command += ["-an", "-vf", ",".join(filters), "-pix_fmt", "bgr24", "-f", "rawvideo", "pipe:1"]
+        return command
+
+    def open(self) -> bool:
+        self.release()
+        try:
+            # stderr isn't read, a full pipe would stall ffmpeg
+            self._process = subprocess.Popen(
+                self.command(), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                bufsize=self.frame_size
+            )
+        except OSError as e:
+            logger.error(f"Cannot start {self.ffmpeg_binary} for {self.source}: {e}")
+            self._process = None
+        return self.isOpened()
+
+    def isOpened(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def grab(self) -> bool:
+        """Read the next frame into the preallocated buffer, blocking until ffmpeg delivers it."""
+        self._grabbed = False
+        # release() may clear self._process and close the pipe from another thread meanwhile
+        process = self._process
+        if process is None:
+            return False
+
+        view = memoryview(self._frame).cast("B")
+        filled = 0
+        while filled < self.frame_size:
+            try:
+                count = process.stdout.readinto(view[filled:])
+            except (OSError, ValueError):  # Pipe closed by release()
+                count = 0
+            if not count:
+                # End of file, a dropped stream or release(), ffmpeg exits right after closing stdout
+                if self._process is process:
+                    try:
+                        code = process.wait(timeout=1.0)
+                    except subprocess.TimeoutExpired:
+                        code = None
+                    if code:
+                        logger.warning(f"ffmpeg for {self.source} stopped with code {code}")
+                    self.release()
+                return False
+            filled += count
+
+        self._grabbed = True
+        return True
+
+    def retrieve(self) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        Hand out the grabbed frame without copying. Later grabs fill a new buffer, so the
+        frame stays valid however long the caller keeps it.
+        """
+        if not self._grabbed:
+            return False, None
+        frame, self._frame = self._frame, self._new_frame()
+        self._grabbed = False
+        return True, frame
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        with self._release_lock:
+            process, self._process = self._process, None
+        if process is None:
+            return
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=2.0)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        process.stdout.close()
@@ -0,0 +1,192 @@
+# app/core/frame_buffer.py
+import threading
+import time
+import cv2
+import numpy as np
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional, Tuple
+
+
+@dataclass
+class CapturedFrame:
+    """A camera frame with its capture sequence number and time.monotonic() capture time."""
+    image: np.ndarray
+    sequence: int
+    captured_at: float
+
+    @property
+    def age(self) -> float:
+        """Seconds since the frame was captured."""
+        return time.monotonic() - self.captured_at
+
+
+class LatestFrameSlot:
+    """
+    Holds only the newest frame of a camera. The capture thread overwrites it, consumers read
+    it without taking it away and can wait for a frame newer than the one they already have,
+    so they never see a backlog of stale frames and only one frame per camera stays in memory.
+    """
+
+    def __init__(self, listener: Optional[threading.Condition] = None):
+        self._condition = threading.Condition()
+        self._frame: Optional[CapturedFrame] = None
+        self._sequence = 0
+        # Notified after every put, lets one consumer wait on several cameras' slots at once
+        self._listener = listener
+
+    @property
+    def sequence(self) -> int:
+        """Sequence number of the newest frame, 0 before the first one."""
+        return self._sequence
+
+    def put(self, image: np.ndarray, captured_at: Optional[float] = None) -> int:
+        """Replace the held frame and wake waiting consumers. Returns: the frame's sequence number"""
+        with self._condition:
+            self._sequence += 1
+            self._frame = CapturedFrame(image, self._sequence,
+                                        time.monotonic() if captured_at is None else captured_at)
+            self._condition.notify_all()
+            sequence = self._sequence
+
+        if self._listener is not None:
+            with self._listener:
+                self._listener.notify_all()
+        return sequence
+
+    def latest(self) -> Optional[CapturedFrame]:
+        """The newest frame, without waiting."""
+        return self._frame
+
+    def wait_newer(self, after_sequence: int, timeout: Optional[float] = None) -> Optional[CapturedFrame]:
+        """
+        Wait until a frame with a sequence number above after_sequence arrives.
+        Returns: That frame, or None on timeout
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._sequence > after_sequence, timeout):
+                return None
+            return self._frame
+
+    def clear(self):
+        """Drop the held frame, sequence numbers keep counting up."""
+        with self._condition:
+            self._frame = None
+
+
+# SharedFrameRing header, int64 fields at the start of the segment
+_SLOTS, _HEIGHT, _WIDTH, _CHANNELS, _WRITE_SEQUENCE = range(5)
+_HEADER_FIELDS = 8  # 64 bytes, the rest reserved
+
+
+class SharedFrameRing:
+    """
+    Fixed-size ring of frames in a multiprocessing.shared_memory segment, so worker processes
+    can read a camera's frames without copying them through pipes. One process writes
+    (create), any number read (attach, by name).
+
+    Layout: an int64 header (slot count, height, width, channels, newest sequence), then a
+    sequence number and a time.monotonic() capture time per slot, then the frames. The writer
+    zeroes a slot's sequence while it overwrites it and sets it last, readers check it again
+    after reading: a frame whose slot sequence changed was overwritten mid-read.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self._shm = shm
+        self._owner = owner
+        self.name = shm.name
+
+        self._header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        slots, height, width, channels = (int(v) for v in self._header[[_SLOTS, _HEIGHT, _WIDTH, _CHANNELS]])
+        offset = self._header.nbytes
+        self._sequences = np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self._sequences.nbytes
+        self._times = np.ndarray((slots,), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += self._times.nbytes
+        self._frames = np.ndarray((slots, height, width, channels), dtype=np.uint8, buffer=shm.buf, offset=offset)
+
+    @staticmethod
+    def _size(slots: int, shape: Tuple[int, int, int]) -> int:
+        return 8 * (_HEADER_FIELDS + 2 * slots) + slots * int(np.prod(shape))
+
+    @classmethod
+    def create(cls, name: str, resolution: Tuple[int, int], slots: int = 4, channels: int = 3) -> 'SharedFrameRing':
+        """Create the segment for frames of resolution (width, height), replacing a stale one left by a crash."""
+        width, height = resolution
+        size = cls._size(slots, (height, width, channels))
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[[_SLOTS, _HEIGHT, _WIDTH, _CHANNELS]] = slots, height, width, channels
+        del header  # Views must be gone before the segment can be closed
+        ring = cls(shm, owner=True)
+        ring._sequences[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name: str) -> 'SharedFrameRing':
+        """Open a ring created by another process, read only by convention."""
+        shm = shared_memory.SharedMemory(name=name)
+        # Python < 3.13 registers attached segments too and would unlink them when this process exits
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def sequence(self) -> int:
+        """Sequence number of the newest frame, 0 before the first one."""
+        return int(self._header[_WRITE_SEQUENCE])
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self._frames.shape[1:]
+
+    def put(self, image: np.ndarray, captured_at: Optional[float] = None) -> int:
+        """Copy a frame into the next slot, resized if the camera didn't honour the resolution. Returns: its sequence"""
+        sequence = self.sequence + 1
+        slot = sequence % len(self._sequences)
+
+        self._sequences[slot] = 0
+        target = self._frames[slot]
+        if image.shape == target.shape:
+            target[...] = image
+        else:
+            cv2.resize(image, (target.shape[1], target.shape[0]), dst=target, interpolation=cv2.INTER_AREA)
+        self._times[slot] = time.monotonic() if captured_at is None else captured_at
+        self._sequences[slot] = sequence
+        self._header[_WRITE_SEQUENCE] = sequence
+        return sequence
+
+    def latest(self, copy: bool = True) -> Optional[CapturedFrame]:
+        """
+        The newest frame. copy=False returns a view into shared memory, valid until the writer
+        comes round to its slot again, check with is_current() after using it.
+        Returns: None before the first frame
+        """
+        for _ in range(3):
+            sequence = self.sequence
+            if sequence == 0:
+                return None
+            slot = sequence % len(self._sequences)
+            captured_at = float(self._times[slot])
+            image = self._frames[slot].copy() if copy else self._frames[slot]
+            if self._sequences[slot] == sequence:
+                return CapturedFrame(image, sequence, captured_at)
+        return None  # The writer lapped us three times
+
+    def is_current(self, sequence: int) -> bool:
+        """Whether the slot of frame sequence still holds that frame."""
+        return self._sequences[sequence % len(self._sequences)] == sequence
+
+    def close(self):
+        """Detach, and remove the segment if this process created it."""
+        self._header = self._sequences = self._times = self._frames = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
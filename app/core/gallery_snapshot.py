@@ -0,0 +1,215 @@
+# app/core/gallery_snapshot.py
+import fcntl
+import json
+import os
+import shutil
+import time
+import logging
+import numpy as np
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Set, Tuple
+from .face_gallery import FaceGallery
+from .face_index import FaceIndex, FlatIndex
+
+logger = logging.getLogger(__name__)
+
+
+class GallerySnapshotStore:
+    """
+    On-disk classroom gallery snapshots that every worker process memory-maps, so all of
+    them share one page-cached copy of the embedding matrices.
+
+    Layout per classroom:
+        classroom_<id>/v<version>/   embeddings.npy, member_*.npy, index_*.npy, meta.json
+        classroom_<id>/current.json  {"version": <int>, "path": "v<version>" or null}
+
+    A snapshot directory is fully written before current.json is atomically replaced to point
+    at it, so readers never see a partial snapshot. Versions are nanosecond timestamps; a
+    pointer with a null path means the classroom changed and has no valid snapshot yet.
+    Pointer updates hold classroom_<id>/.lock (flock), so an invalidation can't slip in
+    between a publisher's version check and its pointer write.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._enrolled_cache: Dict[int, Tuple[int, Set[int]]] = {}  # classroom -> (version, student ids)
+        os.makedirs(directory, exist_ok=True)
+
+    def _classroom_dir(self, classroom_id: int) -> str:
+        return os.path.join(self.directory, f"classroom_{classroom_id}")
+
+    def _pointer_path(self, classroom_id: int) -> str:
+        return os.path.join(self._classroom_dir(classroom_id), "current.json")
+
+    @contextmanager
+    def _locked(self, classroom_id: int):
+        """Exclusive lock on a classroom's pointer, across processes."""
+        classroom_dir = self._classroom_dir(classroom_id)
+        os.makedirs(classroom_dir, exist_ok=True)
+        with open(os.path.join(classroom_dir, ".lock"), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_pointer(self, classroom_id: int) -> Optional[Dict]:
+        try:
+            with open(self._pointer_path(classroom_id), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_pointer(self, classroom_id: int, version: int, path: Optional[str]):
+        classroom_dir = self._classroom_dir(classroom_id)
+        os.makedirs(classroom_dir, exist_ok=True)
+
+        tmp_path = os.path.join(classroom_dir, f".current.{os.getpid()}.{version}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': version, 'path': path}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._pointer_path(classroom_id))
+
+    def current_version(self, classroom_id: int) -> Optional[int]:
+        """Version the classroom pointer currently names, or None if there is none."""
+        pointer = self._read_pointer(classroom_id)
+        return pointer['version'] if pointer else None
+
+    def publish(self, classroom_id: int, gallery: FaceGallery, student_ids: Iterable[int],
+                expected_version: Optional[int] = None) -> Optional[int]:
+        """
+        Write a gallery snapshot and make it current.
+        If expected_version is given and the pointer moved since (someone invalidated or
+        published meanwhile), the snapshot is discarded and None is returned.
+        """
+        version = time.time_ns()
+        name = f"v{version}"
+        snapshot_dir = os.path.join(self._classroom_dir(classroom_id), name)
+        os.makedirs(snapshot_dir, exist_ok=True)
+
+        arrays = {
+            'embeddings': gallery.embeddings,
+            'member_embeddings': gallery.member_embeddings,
+            'member_offsets': gallery.member_offsets,
+        }
+        # A flat index is just the embeddings matrix, anything else is stored alongside
+        index_shares_embeddings = False
+        if not isinstance(gallery.index, FlatIndex):
+            for key, value in gallery.index.state().items():
+                # Quantized indexes re-score against the gallery matrix itself, don't write it twice
+                if key == 'embeddings' and value.shape == gallery.embeddings.shape and np.may_share_memory(value, gallery.embeddings):
+                    index_shares_embeddings = True
+                    continue
+                arrays[f"index_{key}"] = value
+
+        for key, value in arrays.items():
+            np.save(os.path.join(snapshot_dir, f"{key}.npy"), np.ascontiguousarray(value))
+
+        meta = {
+            'version': version,
+            'embedding_size': gallery.embedding_size,
+            'ids': [int(i) for i in gallery.ids],
+            'names': gallery.names,
+            'student_ids': sorted(int(i) for i in student_ids),
+            'index_kind': gallery.index.kind,
+            'index_shares_embeddings': index_shares_embeddings,
+        }
+        with open(os.path.join(snapshot_dir, "meta.json"), 'w') as f:
+            json.dump(meta, f)
+
+        with self._locked(classroom_id):
+            if expected_version is not None and self.current_version(classroom_id) != expected_version:
+                shutil.rmtree(snapshot_dir, ignore_errors=True)
+                return None
+
+            self._write_pointer(classroom_id, version, name)
+            self._remove_old_snapshots(classroom_id, keep=name)
+
+        logger.info(f"Published gallery snapshot {version} for classroom {classroom_id} ({len(gallery)} faces)")
+        return version
+
+    def load(self, classroom_id: int, gallery: FaceGallery) -> Optional[Tuple[int, FaceGallery, Set[int]]]:
+        """
+        Memory-map the current snapshot of a classroom into the given empty gallery.
+        Returns: (version, gallery, enrolled student ids) or None if there is no valid snapshot
+        """
+        pointer = self._read_pointer(classroom_id)
+        if not pointer or not pointer.get('path'):
+            return None
+
+        snapshot_dir = os.path.join(self._classroom_dir(classroom_id), pointer['path'])
+
+        try:
+            with open(os.path.join(snapshot_dir, "meta.json"), 'r') as f:
+                meta = json.load(f)
+
+            if meta['embedding_size'] != gallery.embedding_size:
+                logger.warning(f"Ignoring snapshot for classroom {classroom_id} with different embedding size")
+                return None
+
+            def open_array(key: str) -> np.ndarray:
+                return np.load(os.path.join(snapshot_dir, f"{key}.npy"), mmap_mode='r')
+
+            embeddings = open_array('embeddings')
+            index = None
+            if meta['index_kind'] != FlatIndex.kind:
+                index_keys = [f[len("index_"):-len(".npy")] for f in os.listdir(snapshot_dir) if f.startswith("index_")]
+                state = {key: open_array(f"index_{key}") for key in index_keys}
+                if meta.get('index_shares_embeddings'):
+                    state['embeddings'] = embeddings
+                index = FaceIndex.from_state(meta['index_kind'], state)
+
+            gallery.attach(
+                embeddings, meta['ids'], meta['names'],
+                open_array('member_embeddings'), open_array('member_offsets'),
+                index=index
+            )
+
+        except (FileNotFoundError, KeyError, ValueError) as e:
+            # The snapshot was replaced and cleaned up while we were opening it
+            logger.warning(f"Could not open gallery snapshot for classroom {classroom_id}: {e}")
+            return None
+
+        return pointer['version'], gallery, set(meta['student_ids'])
+
+    def invalidate(self, classroom_ids: Iterable[int]):
+        """Mark classrooms as changed so every process drops and rebuilds their gallery."""
+        for classroom_id in classroom_ids:
+            with self._locked(classroom_id):
+                self._write_pointer(classroom_id, time.time_ns(), None)
+                self._remove_old_snapshots(classroom_id, keep=None)
+
+    def classrooms_with_students(self, student_ids: Set[int]) -> Set[int]:
+        """Classrooms whose current snapshot includes any of the given students."""
+        classroom_ids = set()
+
+        for entry in os.listdir(self.directory):
+            if not entry.startswith("classroom_"):
+                continue
+            classroom_id = int(entry[len("classroom_"):])
+
+            pointer = self._read_pointer(classroom_id)
+            if not pointer or not pointer.get('path'):
+                continue
+
+            cached = self._enrolled_cache.get(classroom_id)
+            if cached is None or cached[0] != pointer['version']:
+                try:
+                    with open(os.path.join(self._classroom_dir(classroom_id), pointer['path'], "meta.json")) as f:
+                        cached = (pointer['version'], set(json.load(f)['student_ids']))
+                except (FileNotFoundError, ValueError):
+                    continue
+                self._enrolled_cache[classroom_id] = cached
+
+            if cached[1] & student_ids:
+                classroom_ids.add(classroom_id)
+
+        return classroom_ids
+
+    def _remove_old_snapshots(self, classroom_id: int, keep: Optional[str]):
+        # Processes that still map an old snapshot keep reading it, unlinking only frees the name
+        classroom_dir = self._classroom_dir(classroom_id)
+        for entry in os.listdir(classroom_dir):
+            if entry.startswith("v") and entry != keep:
+                shutil.rmtree(os.path.join(classroom_dir, entry), ignore_errors=True)
@@ -0,0 +1,227 @@
+# app/core/model_registry.py
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Pixels of context kept around each face box when it is cropped for FaceNet
+FACE_CROP_MARGIN = 20
+
+
+class InferenceDisabledError(RuntimeError):
+    """Raised when a model is requested on a worker started without inference."""
+
+
+@dataclass
+class LoadedModel:
+    """A loaded model and what it cost to load."""
+    model: Any
+    load_seconds: float
+    nbytes: int
+    loaded_at: float
+
+
+def _model_nbytes(model) -> int:
+    """Memory held by a torch module's parameters and buffers."""
+    if hasattr(model, 'nbytes'):
+        return model.nbytes
+    tensors = list(model.parameters()) + list(model.buffers()) if hasattr(model, 'parameters') else []
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of the face models. Each model is loaded once, on first use, and
+    the same instance is shared by every FaceDetector and FaceEncoder. The models run in eval
+    mode without gradients, so concurrent forward passes from several threads are safe.
+
+    torch and facenet_pytorch are only imported when the first model loads, so processes
+    that never run recognition don't pay for the ML stack. A disabled registry refuses to
+    load anything.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._factories: Dict[str, Callable[[Any], Any]] = {}
+        self._models: Dict[str, LoadedModel] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._device = None
+
+    @property
+    def device(self):
+        """Torch device every model is loaded on."""
+        if self._device is None:
+            import torch
+            self._device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+        return self._device
+
+    def register(self, name: str, factory: Callable[[Any], Any]):
+        """Register a factory called with the device the first time the model is needed."""
+        with self._lock:
+            self._factories[name] = factory
+
+    def get(self, name: str):
+        """Return the shared model, loading it if this is the first use."""
+        entry = self._models.get(name)
+        if entry is not None:
+            return entry.model
+
+        if not self.enabled:
+            raise InferenceDisabledError(f"Cannot load {name}, inference is disabled on this worker")
+
+        with self._lock:
+            if name not in self._factories:
+                raise KeyError(f"Unknown model: {name}")
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Only one thread loads, the others wait for it instead of loading their own copy
+        with load_lock:
+            entry = self._models.get(name)
+            if entry is None:
+                entry = self._load(name)
+        return entry.model
+
+    def create(self, name: str):
+        """Build a new, unshared instance of a registered model (e.g. to export it)."""
+        if not self.enabled:
+            raise InferenceDisabledError(f"Cannot load {name}, inference is disabled on this worker")
+        return self._factories[name](self.device)
+
+    def _load(self, name: str) -> LoadedModel:
+        start = time.perf_counter()
+        model = self._factories[name](self.device)
+        load_seconds = time.perf_counter() - start
+
+        entry = LoadedModel(model, load_seconds, _model_nbytes(model), time.time())
+        self._models[name] = entry
+        logger.info(f"Loaded model {name} on {self.device} in {load_seconds:.2f}s ({entry.nbytes / 2 ** 20:.1f} MB)")
+        return entry
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def unload(self, name: str):
+        """Drop a model, it is loaded again on next use."""
+        with self._lock:
+            self._models.pop(name, None)
+
+    def get_stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'device': str(self._device) if self._device is not None else None,
+            'registered': sorted(self._factories),
+            'loaded': {
+                name: {
+                    'load_seconds': round(entry.load_seconds, 3),
+                    'bytes': entry.nbytes,
+                    'loaded_at': entry.loaded_at
+                }
+                for name, entry in list(self._models.items())
+            },
+            'total_bytes': sum(entry.nbytes for entry in list(self._models.values()))
+        }
+
+
+def _cpu_optimized(device) -> bool:
+    return settings.torch_cpu_optimized and device.type == 'cpu'
+
+
+def _load_mtcnn(device):
+    from facenet_pytorch import MTCNN
+
+    detector = MTCNN(
+        image_size=settings.facenet_image_size,  # Aligned crops are FaceNet input sized
+        margin=FACE_CROP_MARGIN,
+        min_face_size=20,
+        thresholds=[0.6, 0.7, 0.7],
+        factor=0.709,
+        post_process=True,
+        select_largest=False,
+        keep_all=True,
+        device=device
+    ).eval()
+
+    # MTCNN runs python loops over an image pyramid, so it can't be traced; threads and warm-up only
+    if _cpu_optimized(device):
+        from .torch_runtime import configure_threads, warm_up_detector
+        configure_threads(settings.torch_num_threads)
+        warm_up_detector(detector)
+
+    return detector
+
+
+def _load_yunet(device):
+    import os
+    import cv2
+
+    if not os.path.exists(settings.yunet_model_path):
+        raise FileNotFoundError(
+            f"YuNet model not found at {settings.yunet_model_path}, download face_detection_yunet_2023mar.onnx "
+            f"from the OpenCV model zoo"
+        )
+    # The input size is set per frame
+    return cv2.FaceDetectorYN.create(settings.yunet_model_path, "", (320, 320), settings.yunet_score_threshold)
+
+
+def _load_haar(device):
+    import os
+    import cv2
+
+    if not hasattr(cv2, "CascadeClassifier"):
+        # OpenCV 5 moved the cascade detectors to opencv-contrib
+        raise ImportError(f"OpenCV {cv2.__version__} has no CascadeClassifier, install opencv-contrib-python")
+
+    path = settings.haar_cascade_path or os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+    cascade = cv2.CascadeClassifier(path)
+    if cascade.empty():
+        raise FileNotFoundError(f"Cannot load Haar cascade {path}")
+    return cascade
+
+
+def _build_facenet(device):
+    from facenet_pytorch import InceptionResnetV1
+
+    return InceptionResnetV1(
+        pretrained='vggface2',
+        classify=False,
+        device=device
+    ).eval()
+
+
+def _load_facenet(device):
+    model = _build_facenet(device)
+
+    if _cpu_optimized(device):
+        from .torch_runtime import configure_threads, optimize_encoder
+        configure_threads(settings.torch_num_threads)
+        model = optimize_encoder(model, settings.facenet_image_size, bf16=settings.torch_bf16)
+
+    return model
+
+
+def _load_facenet_onnx(device, quantized: bool = False):
+    from .onnx_encoder import load_onnx_encoder
+
+    # The torch model is only built when the ONNX file still has to be exported
+    return load_onnx_encoder(
+        settings.onnx_model_dir,
+        lambda: _build_facenet(device),
+        quantized=quantized,
+        image_size=settings.facenet_image_size,
+        intra_op_threads=settings.onnx_intra_op_threads
+    )
+
+
+# Singleton instance
+model_registry = ModelRegistry(enabled=settings.enable_inference)
+model_registry.register("mtcnn", _load_mtcnn)
+model_registry.register("yunet", _load_yunet)
+model_registry.register("haar", _load_haar)
+model_registry.register("facenet", _load_facenet)
+model_registry.register("facenet-onnx", _load_facenet_onnx)
+model_registry.register("facenet-onnx-int8", lambda device: _load_facenet_onnx(device, quantized=True))
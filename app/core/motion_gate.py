@@ -0,0 +1,69 @@
+# app/core/motion_gate.py
+import time
+import cv2
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+
+class MotionGate:
+    """
+    Cheap scene-change check run before face detection. Each frame is shrunk to a small
+    grayscale thumbnail and compared with the thumbnail of the last frame that was let
+    through; frames where too few pixels changed are skipped. A frame is let through at
+    least every refresh_seconds regardless, so people sitting still are still seen.
+    """
+
+    def __init__(self, threshold: float = 0.01, refresh_seconds: float = 15.0,
+                 size: Tuple[int, int] = (64, 48), pixel_threshold: int = 20):
+        self.threshold = threshold  # Fraction of thumbnail pixels that must change
+        self.refresh_seconds = refresh_seconds
+        self.size = size
+        self.pixel_threshold = pixel_threshold  # Gray level difference that counts as a change
+
+        self._reference: Optional[np.ndarray] = None
+        self._reference_time = 0.0
+
+        self.frames_checked = 0
+        self.frames_skipped = 0
+        self.forced_refreshes = 0
+
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        # Sample every step-th pixel first, still 4x the thumbnail size, so a 1080p frame
+        # costs a couple of milliseconds instead of a full-frame colour conversion
+        step = max(1, min(frame.shape[0] // (self.size[1] * 4), frame.shape[1] // (self.size[0] * 4)))
+        # INTER_AREA averages whole blocks, which also smooths out sensor noise
+        small = cv2.resize(frame[::step, ::step], self.size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    def changed_fraction(self, thumbnail: np.ndarray) -> float:
+        """Fraction of pixels that differ from the reference thumbnail (1.0 without a reference)."""
+        if self._reference is None or self._reference.shape != thumbnail.shape:
+            return 1.0
+        difference = cv2.absdiff(thumbnail, self._reference)
+        return float(np.count_nonzero(difference > self.pixel_threshold)) / difference.size
+
+    def should_process(self, frame: np.ndarray, now: Optional[float] = None) -> bool:
+        """True if the frame changed enough, or the refresh interval has passed, since the last processed frame."""
+        now = time.monotonic() if now is None else now
+        self.frames_checked += 1
+
+        thumbnail = self._thumbnail(frame)
+        if self.changed_fraction(thumbnail) < self.threshold:
+            if now - self._reference_time < self.refresh_seconds:
+                self.frames_skipped += 1
+                return False
+            self.forced_refreshes += 1
+
+        self._reference = thumbnail
+        self._reference_time = now
+        return True
+
+    def get_stats(self) -> Dict:
+        return {
+            'threshold': self.threshold,
+            'refresh_seconds': self.refresh_seconds,
+            'frames_checked': self.frames_checked,
+            'frames_skipped': self.frames_skipped,
+            'frames_processed': self.frames_checked - self.frames_skipped,
+            'forced_refreshes': self.forced_refreshes
+        }
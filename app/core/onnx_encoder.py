@@ -0,0 +1,92 @@
+# app/core/onnx_encoder.py
+import os
+import inspect
+import logging
+import numpy as np
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class OnnxEncoder:
+    """
+    FaceNet exported to ONNX and run through ONNX Runtime on CPU.
+    Takes the same normalised (N x 3 x 160 x 160) batch the torch model does and returns
+    raw (N x 512) embeddings, so FaceEncoder can use either interchangeably.
+    """
+
+    def __init__(self, model_path: str, intra_op_threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            options.intra_op_num_threads = intra_op_threads
+
+        self.model_path = model_path
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the model weights on disk, roughly what the session holds."""
+        return os.path.getsize(self.model_path)
+
+    def run(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: np.ascontiguousarray(batch, dtype=np.float32)})[0]
+
+
+def export_onnx(model, path: str, image_size: int = 160):
+    """Export a FaceNet torch model to ONNX with a dynamic batch dimension."""
+    import torch
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    dummy = torch.zeros(1, 3, image_size, image_size, device=next(model.parameters()).device)
+
+    # Newer torch defaults to the dynamo exporter, keep the TorchScript one everywhere
+    extra = {'dynamo': False} if 'dynamo' in inspect.signature(torch.onnx.export).parameters else {}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model, dummy, tmp_path,
+            input_names=["faces"],
+            output_names=["embeddings"],
+            dynamic_axes={"faces": {0: "batch"}, "embeddings": {0: "batch"}},
+            opset_version=17,
+            **extra
+        )
+    # Other workers may export concurrently, only ever expose a complete file
+    os.replace(tmp_path, path)
+    logger.info(f"Exported FaceNet to {path}")
+
+
+def quantize_onnx(source_path: str, path: str):
+    """Write a dynamic int8 (weights int8, activations quantized at runtime) copy of an ONNX model."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    # uint8 weights with uint8 activations is the fast int8 path on CPUs without VNNI
+    quantize_dynamic(source_path, tmp_path, weight_type=QuantType.QUInt8)
+    os.replace(tmp_path, path)
+    logger.info(f"Quantized {source_path} to {path}")
+
+
+def load_onnx_encoder(model_dir: str, load_torch_model, quantized: bool = False,
+                      image_size: int = 160, intra_op_threads: int = 0,
+                      model_name: Optional[str] = None) -> OnnxEncoder:
+    """
+    Return an ONNX Runtime encoder, exporting (and quantizing) the torch model on first use.
+    load_torch_model is only called when no exported file exists yet.
+    """
+    model_name = model_name or "facenet-vggface2"
+    fp32_path = os.path.join(model_dir, f"{model_name}.onnx")
+    int8_path = os.path.join(model_dir, f"{model_name}.int8.onnx")
+
+    if not os.path.exists(fp32_path) and not (quantized and os.path.exists(int8_path)):
+        export_onnx(load_torch_model(), fp32_path, image_size)
+
+    if quantized and not os.path.exists(int8_path):
+        quantize_onnx(fp32_path, int8_path)
+
+    return OnnxEncoder(int8_path if quantized else fp32_path, intra_op_threads)
@@ -0,0 +1,83 @@
+# app/core/torch_runtime.py
+"""
+CPU fast path for the torch face models (settings.torch_cpu_optimized).
+
+torch is imported inside the functions so importing this module stays cheap.
+"""
+import contextlib
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_bf16_supported: Optional[bool] = None
+
+
+def bf16_supported() -> bool:
+    """True if the CPU has native bfloat16 kernels (AVX512-BF16 / AMX), where autocast pays off."""
+    global _bf16_supported
+    if _bf16_supported is None:
+        import torch
+        try:
+            _bf16_supported = bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+        except (AttributeError, RuntimeError):
+            _bf16_supported = False
+    return _bf16_supported
+
+
+def configure_threads(num_threads: int):
+    """Set the intra-op thread pool size, 0 keeps the torch default (one per core)."""
+    import torch
+    if num_threads > 0 and torch.get_num_threads() != num_threads:
+        torch.set_num_threads(num_threads)
+        logger.info(f"Using {num_threads} torch intra-op threads")
+
+
+def inference_context(bf16: bool = False):
+    """inference_mode, plus bf16 autocast when requested and the CPU supports it."""
+    import torch
+
+    stack = contextlib.ExitStack()
+    stack.enter_context(torch.inference_mode())
+    if bf16 and bf16_supported():
+        stack.enter_context(torch.autocast("cpu", dtype=torch.bfloat16))
+    return stack
+
+
+def optimize_encoder(model, image_size: int = 160, channels_last: bool = True, freeze: bool = True,
+                     bf16: bool = False, warmup_batches: int = 3):
+    """
+    Prepare a FaceNet model for CPU inference: channels_last weights, a frozen TorchScript
+    trace and a few warm-up passes so the first real frame doesn't pay for JIT optimisation.
+    """
+    import torch
+
+    model = model.eval()
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    if channels_last:
+        model = model.to(memory_format=memory_format)
+
+    example = torch.zeros(1, 3, image_size, image_size).contiguous(memory_format=memory_format)
+
+    if freeze:
+        # Traced with batch 1, the batch dimension stays dynamic through x.shape[0]
+        with torch.inference_mode(False), torch.no_grad(), torch.autocast("cpu", enabled=False):
+            model = torch.jit.freeze(torch.jit.trace(model, example))
+
+    warmup = torch.zeros(4, 3, image_size, image_size).contiguous(memory_format=memory_format)
+    with inference_context(bf16):
+        for _ in range(warmup_batches):
+            model(warmup)
+
+    return model
+
+
+def warm_up_detector(detector, image_size: int = 320, runs: int = 2):
+    """Run MTCNN on blank frames so its first real detection isn't slowed by lazy initialisation."""
+    import numpy as np
+    import torch
+
+    frame = np.zeros((image_size, image_size, 3), dtype=np.uint8)
+    with torch.inference_mode():
+        for _ in range(runs):
+            detector.detect(frame)
@@ -31,8 +31,11 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Classroom Attendance System")
 
-    # Start background services if enabled
-    if settings.enable_background_service:
+    if not settings.enable_inference:
+        logger.info("Inference disabled, running API only (no recognition, no background services)")
+
+    # Start background services if enabled, they need the face models
+    if settings.enable_background_service and settings.enable_inference:
         logger.info("Starting background services...")
         await start_background_services()
 
@@ -42,7 +45,7 @@ async def lifespan(app: FastAPI):
     logger.info("Shutting down Classroom Attendance System")
 
     # Stop background services
-    if settings.enable_background_service:
+    if settings.enable_background_service and settings.enable_inference:
         logger.info("Stopping background services...")
         await stop_background_services()
 
@@ -65,7 +68,7 @@ app.add_middleware(
 )
 
 # Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", StaticFiles(directory="static", check_dir=False), name="static")
 
 # Include routers
 app.include_router(students.router, prefix=f"{settings.api_prefix}/students", tags=["Students"])
@@ -80,7 +83,7 @@ async def root():
         "message": "Classroom Attendance System API",
         "version": "2.0.0",
         "features": {
-            "face_recognition": "FaceNet",
+            "face_recognition": "FaceNet" if settings.enable_inference else None,
             "multi_camera": settings.enable_ip_cameras,
             "auto_scheduling": settings.enable_auto_scheduling,
             "background_service": settings.enable_background_service
@@ -126,6 +129,7 @@ async def health_check():
 async def system_info():
     """Get system information and configuration."""
     from app.core.background_service import background_service
+    from app.core.model_registry import model_registry
 
     return {
         "settings": {
@@ -136,5 +140,6 @@ async def system_info():
             "track_timeout": settings.track_timeout_seconds,
             "confidence_threshold": settings.confidence_threshold
         },
+        "models": model_registry.get_stats(),
         "service_status": background_service.get_status() if settings.enable_background_service else None
     }
\ No newline at end of file
@@ -16,7 +16,7 @@ class Student(Base):
     phone = Column(String(20))
 
     # Face recognition data
-    face_encoding = Column(LargeBinary)  # Stored as binary pickle
+    face_encoding = Column(LargeBinary)  # Raw float32 block, see app/core/encoding_format.py
     photos_count = Column(Integer, default=0)
     is_active = Column(Boolean, default=True)
 
@@ -5,10 +5,13 @@ from typing import List, Dict, Optional, Set, Tuple
 import numpy as np
 from collections import defaultdict
 import logging
-from app.core import FaceRecognitionSystem
+from app.core import FaceRecognitionSystem, FaceGallery, BoxTracker
 from app.models import Student, Attendance, Classroom, Enrollment
+from app.services.gallery_cache import gallery_cache
 from dataclasses import dataclass
 import threading
+import time as time_module
+from config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +43,12 @@ class AttendanceService:
         self.active_tracks: Dict[int, FaceTrack] = {}  # student_id -> FaceTrack
         self.processed_today: Set[int] = set()
         self.track_lock = threading.Lock()
+        self.gallery_checked_at = 0.0
+
+        # Per-camera box trackers, faces that stay in their box keep their identity without re-encoding
+        self.box_tracking = settings.face_box_tracking
+        self.box_trackers: Dict[str, BoxTracker] = {}
+        self.box_tracker_lock = threading.Lock()
 
         # Tracking thresholds
         self.min_detections = 3  # Minimum detections before marking attendance
@@ -49,27 +58,15 @@ class AttendanceService:
 
     def start_attendance_session(self, classroom_id: int, db: Session):
         """Start attendance tracking for a classroom."""
-        # Load enrolled students
-        enrollments = db.query(Enrollment).filter(
-            Enrollment.classroom_id == classroom_id
-        ).all()
-
-        students = []
-        for enrollment in enrollments:
-            student = enrollment.student
-            if student.face_encoding and student.is_active:
-                students.append({
-                    'id': student.id,
-                    'full_name': student.full_name,
-                    'face_encoding': student.face_encoding
-                })
-
-        # Load known faces
-        self.face_recognition.load_known_faces(students)
+        # Reuse the classroom gallery if another session or worker already built it
+        gallery = self._get_classroom_gallery(classroom_id, db)
+        self.face_recognition.set_gallery(gallery)
+        self.gallery_checked_at = time_module.monotonic()
 
         # Reset tracking for new session
         with self.track_lock:
             self.active_tracks.clear()
+        self._reset_box_trackers()
 
         # Load today's already marked attendance
         today = date.today()
@@ -80,7 +77,53 @@ class AttendanceService:
             ).all()
         )
 
-        logger.info(f"Started attendance session for classroom {classroom_id} with {len(students)} students")
+        logger.info(f"Started attendance session for classroom {classroom_id} with {len(gallery)} students")
+
+    def _get_classroom_gallery(self, classroom_id: int, db: Session) -> FaceGallery:
+        return gallery_cache.get_or_load(
+            classroom_id,
+            lambda: self._load_classroom_gallery(classroom_id, db),
+            self.face_recognition.create_gallery
+        )
+
+    def _refresh_gallery(self, classroom_id: int, db: Session):
+        """Switch to the cached gallery if it changed, at most once per poll interval."""
+        now = time_module.monotonic()
+        if now - self.gallery_checked_at < settings.gallery_snapshot_poll_seconds:
+            return
+        self.gallery_checked_at = now
+
+        gallery = self._get_classroom_gallery(classroom_id, db)
+        if gallery is not self.face_recognition.gallery:
+            logger.info(f"Switched to updated gallery for classroom {classroom_id} ({len(gallery)} students)")
+            self.face_recognition.set_gallery(gallery)
+            self._reset_box_trackers()
+
+    def _load_classroom_gallery(self, classroom_id: int, db: Session) -> Tuple[FaceGallery, Set[int]]:
+        """Build the gallery of a classroom's enrolled, active students with a face encoding."""
+        enrolled_ids = set(
+            student_id for (student_id,) in db.query(Enrollment.student_id).filter(
+                Enrollment.classroom_id == classroom_id
+            ).all()
+        )
+
+        # Single joined query instead of lazily loading each enrollment's student
+        enrolled_students = db.query(Student).join(Enrollment, Enrollment.student_id == Student.id).filter(
+            Enrollment.classroom_id == classroom_id,
+            Student.is_active == True,
+            Student.face_encoding.isnot(None)
+        ).all()
+
+        students = [
+            {
+                'id': student.id,
+                'full_name': student.full_name,
+                'face_encoding': student.face_encoding
+            }
+            for student in enrolled_students
+        ]
+
+        return self.face_recognition.build_gallery(students), enrolled_ids
 
     def stop_attendance_session(self):
         """Stop attendance tracking and finalize any pending tracks."""
@@ -92,71 +135,210 @@ class AttendanceService:
             logger.info(f"Stopped attendance session. Total tracks: {total_tracks}, Marked: {marked_count}")
 
             self.active_tracks.clear()
+        self._reset_box_trackers()
+
+    def _reset_box_trackers(self):
+        # Box tracks hold identities matched against the previous gallery, so start over
+        with self.box_tracker_lock:
+            self.box_trackers.clear()
+
+    def _get_box_tracker(self, camera_key: str) -> BoxTracker:
+        tracker = self.box_trackers.get(camera_key)
+        if tracker is None:
+            tracker = BoxTracker(
+                iou_threshold=settings.box_tracker_iou_threshold,
+                max_misses=settings.box_tracker_max_misses,
+                reencode_interval=settings.box_tracker_reencode_interval,
+                min_confidence=settings.box_tracker_min_confidence
+            )
+            self.box_trackers[camera_key] = tracker
+        return tracker
+
+    def get_box_tracker_stats(self) -> Dict[str, Dict]:
+        """Faces seen versus faces actually encoded, per camera."""
+        with self.box_tracker_lock:
+            return {camera_key: tracker.stats.as_dict() for camera_key, tracker in self.box_trackers.items()}
+
+    def _confirmed_students(self) -> Set[int]:
+        """Students whose carried identity is enough: already marked, or with min_detections fresh matches."""
+        with self.track_lock:
+            return self.processed_today | {
+                student_id for student_id, track in self.active_tracks.items()
+                if track.marked_attendance or track.detection_count >= self.min_detections
+            }
+
+    def _recognize_tracked(self, camera_keys: List[str], detections: List[Tuple]) -> List[List[Dict]]:
+        """
+        Recognize detected faces, encoding only those whose box track needs it (new, unknown,
+        low confidence, not yet confirmed or due for re-verification). Other faces carry their
+        track's identity.
+        Returns: One result list per camera, like FaceRecognitionSystem.recognize_detections
+        """
+        timestamp = datetime.now()
+        # Carried identities don't count towards min_detections, so keep encoding until they're reached
+        confirmed = self._confirmed_students()
+
+        with self.box_tracker_lock:
+            assignments = [
+                self._get_box_tracker(camera_key).update(face_locations, confirmed)
+                for camera_key, (_, face_locations) in zip(camera_keys, detections)
+            ]
+            selected = [[i for i, a in enumerate(frame) if a.needs_encoding] for frame in assignments]
+
+            recognized = self.face_recognition.recognize_detections(detections, selected)
+
+            all_results = []
+            for (_, face_locations), frame_assignments, indices, fresh in zip(
+                    detections, assignments, selected, recognized):
+                # Encoding failures come back empty, those faces just aren't recognised this frame
+                fresh_by_index = dict(zip(indices, fresh)) if len(fresh) == len(indices) else {}
+
+                results = []
+                for i, (face_location, assignment) in enumerate(zip(face_locations, frame_assignments)):
+                    track = assignment.track
+                    result = fresh_by_index.get(i)
+                    if result is not None:
+                        BoxTracker.record_recognition(track, result)
+                    elif track.encoded:
+                        result = {
+                            'name': track.name,
+                            'student_id': track.student_id,
+                            'location': face_location,
+                            'confidence': track.confidence,
+                            'timestamp': timestamp,
+                            'carried': True  # Not a new FaceNet match, see _update_tracks
+                        }
+                    else:
+                        continue
+                    result['track_id'] = track.track_id
+                    results.append(result)
+
+                all_results.append(results)
+
+        return all_results
 
     async def process_frame_with_tracking(
             self,
             frame: np.ndarray,
             classroom_id: int,
             db: Session,
-            camera_key: str
+            camera_key: str,
+            detection_scale: Optional[float] = None,
+            detector_backend: Optional[str] = None
     ) -> List[Dict]:
-        """Process frame with face tracking across multiple detections."""
-        # Detect and recognize faces
-        _, results = self.face_recognition.process_frame(frame)
+        """
+        Process frame with face tracking across multiple detections.
+        detection_scale and detector_backend override the detection defaults for this camera.
+        """
+        marked = await self.process_frames_with_tracking(
+            {camera_key: frame}, classroom_id, db, {camera_key: detection_scale}, {camera_key: detector_backend}
+        )
+        return marked[camera_key]
+
+    async def process_frames_with_tracking(
+            self,
+            frames: Dict[str, np.ndarray],
+            classroom_id: int,
+            db: Session,
+            detection_scales: Optional[Dict[str, Optional[float]]] = None,
+            detector_backends: Optional[Dict[str, Optional[str]]] = None
+    ) -> Dict[str, List[Dict]]:
+        """
+        Process the current frame of every camera in one go. Equally sized frames share one
+        detection pass and all faces are encoded together, then each camera's results update
+        the tracks as if its frame had been processed on its own.
+        Returns: Marked students per camera key
+        """
+        # Pick up a gallery rebuilt after enrollment or encoding changes
+        self._refresh_gallery(classroom_id, db)
+
+        camera_keys = list(frames.keys())
+        detection_scales = detection_scales or {}
+        detector_backends = detector_backends or {}
+
+        # Detect faces, equally sized frames share one detection pass
+        detections = self.face_recognition.detect_faces_batch(
+            [frames[key] for key in camera_keys],
+            [detection_scales.get(key) for key in camera_keys],
+            [detector_backends.get(key) for key in camera_keys]
+        )
+
+        # Recognize them, with box tracking only new or doubtful faces are encoded
+        if self.box_tracking:
+            all_results = self._recognize_tracked(camera_keys, detections)
+        else:
+            all_results = self.face_recognition.recognize_detections(detections)
 
         current_time = datetime.now()
-        marked_students = []
+        marked_by_camera = {}
 
         with self.track_lock:
             # Update tracks with current detections
             detected_ids = set()
 
-            for result in results:
-                student_id = result.get('student_id')
+            for camera_key, results in zip(camera_keys, all_results):
+                marked_by_camera[camera_key] = self._update_tracks(
+                    results, classroom_id, db, camera_key, current_time, detected_ids
+                )
 
-                if not student_id or result['confidence'] < 0.6:
-                    continue
+            # Clean up old tracks
+            self._cleanup_old_tracks(current_time, detected_ids)
+
+        return marked_by_camera
+
+    def _update_tracks(self, results: List[Dict], classroom_id: int, db: Session, camera_key: str,
+                       current_time: datetime, detected_ids: Set[int]) -> List[Dict]:
+        """Fold one camera's recognition results into the tracks, call with track_lock held."""
+        marked_students = []
+
+        for result in results:
+            student_id = result.get('student_id')
 
-                detected_ids.add(student_id)
+            if not student_id or result['confidence'] < 0.6:
+                continue
 
-                # Update or create track
-                if student_id in self.active_tracks:
-                    track = self.active_tracks[student_id]
-                    track.last_seen = current_time
+            detected_ids.add(student_id)
+
+            # Identities carried forward by the box tracker keep the track alive, but only
+            # fresh encodings count as independent detections towards min_detections
+            fresh = not result.get('carried')
+
+            # Update or create track
+            if student_id in self.active_tracks:
+                track = self.active_tracks[student_id]
+                track.last_seen = current_time
+                if fresh:
                     track.detection_count += 1
                     track.confidence_scores.append(result['confidence'])
-                    track.cameras_seen.add(camera_key)
-                else:
-                    track = FaceTrack(
-                        student_id=student_id,
-                        student_name=result['name'],
-                        first_seen=current_time,
-                        last_seen=current_time,
-                        detection_count=1,
-                        confidence_scores=[result['confidence']],
-                        cameras_seen={camera_key}
-                    )
-                    self.active_tracks[student_id] = track
-
-                # Check if track meets criteria for marking attendance
-                if (not track.marked_attendance and
-                        student_id not in self.processed_today and
-                        track.detection_count >= self.min_detections and
-                        track.average_confidence >= self.min_confidence and
-                        track.duration_seconds >= self.min_duration):
-
-                    # Mark attendance
-                    marked_student = self._mark_attendance(
-                        student_id, classroom_id, track, db
-                    )
-
-                    if marked_student:
-                        track.marked_attendance = True
-                        self.processed_today.add(student_id)
-                        marked_students.append(marked_student)
-
-            # Clean up old tracks
-            self._cleanup_old_tracks(current_time, detected_ids)
+                track.cameras_seen.add(camera_key)
+            else:
+                track = FaceTrack(
+                    student_id=student_id,
+                    student_name=result['name'],
+                    first_seen=current_time,
+                    last_seen=current_time,
+                    detection_count=1 if fresh else 0,
+                    confidence_scores=[result['confidence']] if fresh else [],
+                    cameras_seen={camera_key}
+                )
+                self.active_tracks[student_id] = track
+
+            # Check if track meets criteria for marking attendance
+            if (not track.marked_attendance and
+                    student_id not in self.processed_today and
+                    track.detection_count >= self.min_detections and
+                    track.average_confidence >= self.min_confidence and
+                    track.duration_seconds >= self.min_duration):
+
+                # Mark attendance
+                marked_student = self._mark_attendance(
+                    student_id, classroom_id, track, db
+                )
+
+                if marked_student:
+                    track.marked_attendance = True
+                    self.processed_today.add(student_id)
+                    marked_students.append(marked_student)
 
         return marked_students
 
@@ -0,0 +1,299 @@
+# app/services/gallery_cache.py
+import threading
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Set, Tuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from app.core import FaceGallery
+from app.core.gallery_snapshot import GallerySnapshotStore
+from app.models import Student, Enrollment
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedGallery:
+    """A built classroom gallery and the enrolled students it was built from."""
+    gallery: FaceGallery
+    student_ids: Set[int]
+    nbytes: int
+    loaded_at: float
+    version: Optional[int] = None  # snapshot version, None if not backed by a snapshot
+    checked_at: float = 0.0
+
+
+class GalleryCache:
+    """
+    Process-wide LRU cache of built classroom galleries, shared by every AttendanceService.
+    Entries are dropped when a cached student's encoding or active flag changes, or when a
+    classroom's enrollments change (see the ORM listeners below).
+
+    With a snapshot store, galleries are memory-mapped from snapshot files shared by all
+    worker processes, and entries are re-checked against the snapshot version every
+    poll_interval seconds so changes made by other processes are picked up.
+    """
+
+    def __init__(self, max_entries: int = 32, max_bytes: int = 256 * 1024 * 1024,
+                 snapshots: Optional[GallerySnapshotStore] = None, poll_interval: float = 5.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.snapshots = snapshots
+        self.poll_interval = poll_interval
+        self._entries: "OrderedDict[int, CachedGallery]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped on every invalidation to reject stale concurrent loads
+        self._total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.snapshot_loads = 0
+
+    def get(self, classroom_id: int) -> Optional[FaceGallery]:
+        """Return the cached gallery for a classroom, or None."""
+        with self._lock:
+            entry = self._entries.get(classroom_id)
+            needs_check = (
+                entry is not None and self.snapshots is not None and
+                time.time() - entry.checked_at >= self.poll_interval
+            )
+
+        # Another process may have published or invalidated this classroom's snapshot
+        if needs_check and self._snapshot_version(classroom_id) != entry.version:
+            with self._lock:
+                if self._entries.get(classroom_id) is entry:
+                    self._remove(classroom_id)
+            entry = None
+        elif needs_check:
+            entry.checked_at = time.time()
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if classroom_id in self._entries:
+                self._entries.move_to_end(classroom_id)
+            self.hits += 1
+            return entry.gallery
+
+    def get_or_load(self, classroom_id: int,
+                    loader: Callable[[], Tuple[FaceGallery, Set[int]]],
+                    new_gallery: Optional[Callable[[], FaceGallery]] = None) -> FaceGallery:
+        """
+        Return the cached gallery, falling back to the shared snapshot and then to loader().
+        loader returns (gallery, ids of every student enrolled in the classroom); new_gallery
+        creates the empty gallery a snapshot is mapped into.
+        """
+        gallery = self.get(classroom_id)
+        if gallery is not None:
+            return gallery
+
+        with self._lock:
+            generation = self._generation
+
+        expected_version = self._snapshot_version(classroom_id)
+
+        if self.snapshots is not None and new_gallery is not None:
+            try:
+                snapshot = self.snapshots.load(classroom_id, new_gallery())
+            except OSError as e:
+                logger.error(f"Failed to read gallery snapshot for classroom {classroom_id}: {e}")
+                snapshot = None
+
+            if snapshot is not None:
+                version, gallery, student_ids = snapshot
+                self.snapshot_loads += 1
+                self._put(classroom_id, gallery, student_ids, generation, version)
+                return gallery
+
+        start = time.perf_counter()
+        gallery, student_ids = loader()
+        logger.info(
+            f"Built gallery for classroom {classroom_id} with {len(gallery)} faces "
+            f"in {(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+
+        version = None
+        if self.snapshots is not None:
+            try:
+                version = self.snapshots.publish(classroom_id, gallery, student_ids, expected_version)
+            except OSError as e:
+                logger.error(f"Failed to write gallery snapshot for classroom {classroom_id}: {e}")
+
+        if version is not None and new_gallery is not None:
+            # Serve the snapshot just written rather than the freshly built arrays, so this
+            # process shares the page-cached copy and drops its private float32 matrix
+            try:
+                snapshot = self.snapshots.load(classroom_id, new_gallery())
+            except OSError:
+                snapshot = None
+            if snapshot is not None and snapshot[0] == version:
+                gallery = snapshot[1]
+
+        self._put(classroom_id, gallery, student_ids, generation, version)
+        return gallery
+
+    def _snapshot_version(self, classroom_id: int) -> Optional[int]:
+        if self.snapshots is None:
+            return None
+        try:
+            return self.snapshots.current_version(classroom_id)
+        except OSError:
+            return None
+
+    def _put(self, classroom_id: int, gallery: FaceGallery, student_ids: Set[int], generation: int,
+             version: Optional[int] = None):
+        nbytes = gallery.nbytes
+
+        with self._lock:
+            # Something changed while we were loading, the result may already be stale
+            if generation != self._generation:
+                return
+
+            if nbytes > self.max_bytes:
+                logger.warning(f"Gallery for classroom {classroom_id} ({nbytes} bytes) exceeds cache limit")
+                return
+
+            self._remove(classroom_id)
+            now = time.time()
+            self._entries[classroom_id] = CachedGallery(gallery, set(student_ids), nbytes, now, version, now)
+            self._total_bytes += nbytes
+
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                evicted_id, _ = next(iter(self._entries.items()))
+                self._remove(evicted_id)
+                self.evictions += 1
+                logger.debug(f"Evicted gallery for classroom {evicted_id}")
+
+    def _remove(self, classroom_id: int):
+        entry = self._entries.pop(classroom_id, None)
+        if entry is not None:
+            self._total_bytes -= entry.nbytes
+
+    def invalidate_classrooms(self, classroom_ids: Set[int]):
+        """Drop the galleries of the given classrooms, in this and every other process."""
+        with self._lock:
+            self._generation += 1
+            for classroom_id in classroom_ids:
+                if classroom_id in self._entries:
+                    self._remove(classroom_id)
+                    self.invalidations += 1
+                    logger.debug(f"Invalidated gallery for classroom {classroom_id}")
+
+        if self.snapshots is not None and classroom_ids:
+            try:
+                self.snapshots.invalidate(classroom_ids)
+            except OSError as e:
+                logger.error(f"Failed to invalidate gallery snapshots: {e}")
+
+    def invalidate_students(self, student_ids: Set[int]):
+        """Drop every gallery that includes one of the given students."""
+        with self._lock:
+            classroom_ids = {
+                classroom_id for classroom_id, entry in self._entries.items()
+                if entry.student_ids & student_ids
+            }
+
+        # Galleries only other processes have loaded are found through their snapshots
+        if self.snapshots is not None and student_ids:
+            try:
+                classroom_ids |= self.snapshots.classrooms_with_students(student_ids)
+            except OSError as e:
+                logger.error(f"Failed to scan gallery snapshots: {e}")
+
+        self.invalidate_classrooms(classroom_ids)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'classrooms': list(self._entries.keys()),
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'snapshot_loads': self.snapshot_loads
+            }
+
+
+# Singleton instance
+gallery_cache = GalleryCache(
+    max_entries=settings.gallery_cache_max_classrooms,
+    max_bytes=settings.gallery_cache_max_mb * 1024 * 1024,
+    snapshots=GallerySnapshotStore(settings.gallery_snapshot_dir) if settings.enable_gallery_snapshots else None,
+    poll_interval=settings.gallery_snapshot_poll_seconds
+)
+
+
+# ORM listeners: changes are collected per session and applied once the transaction commits,
+# so a concurrent reload cannot cache data from before the commit. Bulk query.update() calls
+# bypass these hooks and should call gallery_cache.clear() themselves.
+_PENDING_KEY = 'gallery_cache_invalidations'
+
+
+def _pending(target) -> Optional[Dict[str, Set[int]]]:
+    session = object_session(target)
+    if session is None:
+        return None
+    return session.info.setdefault(_PENDING_KEY, {'students': set(), 'classrooms': set()})
+
+
+@event.listens_for(Student, 'after_update')
+def _student_updated(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.face_encoding.history.has_changes() or state.attrs.is_active.history.has_changes():
+        pending = _pending(target)
+        if pending is not None:
+            pending['students'].add(target.id)
+
+
+@event.listens_for(Student, 'after_delete')
+def _student_deleted(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending['students'].add(target.id)
+
+
+@event.listens_for(Enrollment, 'after_insert')
+@event.listens_for(Enrollment, 'after_delete')
+def _enrollment_changed(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending['classrooms'].add(target.classroom_id)
+
+
+@event.listens_for(Enrollment, 'after_update')
+def _enrollment_updated(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        # A moved enrollment affects both its old and new classroom
+        history = inspect(target).attrs.classroom_id.history
+        pending['classrooms'].update(c for c in (history.deleted or ()) if c is not None)
+        pending['classrooms'].add(target.classroom_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_invalidations(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        gallery_cache.invalidate_students(pending['students'])
+        gallery_cache.invalidate_classrooms(pending['classrooms'])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_invalidations(session):
+    session.info.pop(_PENDING_KEY, None)
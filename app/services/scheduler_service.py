@@ -10,6 +10,7 @@ from app.models import Classroom, Enrollment
 from app.services.attendance_service import AttendanceService
 from app.core.camera_handler import MultiCameraHandler, CameraConfig, CameraType
 from config.database import SessionLocal
+from config import settings
 import json
 
 logger = logging.getLogger(__name__)
@@ -203,18 +204,29 @@ class AttendanceSchedulerService:
 
         while classroom_id in self.active_sessions:
             try:
-                # Get frames from all cameras
-                frames = self.camera_handler.get_all_frames()
+                # Wait briefly for new frames from the room's cameras, a dead camera can't stall the loop
+                snapshot = await asyncio.to_thread(
+                    self.camera_handler.wait_for_frames,
+                    settings.camera_batch_min_cameras, settings.camera_batch_wait_seconds
+                )
+
+                # Static scenes are skipped until their refresh is due
+                frames = self.camera_handler.get_changed_frames(
+                    {key: frame.image for key, frame in snapshot.items()}
+                )
 
                 if frames:
                     db = SessionLocal()
                     try:
-                        # Process each camera frame
-                        for camera_key, frame in frames.items():
-                            marked_students = await self.attendance_service.process_frame_with_tracking(
-                                frame, classroom_id, db, camera_key
-                            )
+                        # Process all camera frames together, detection is batched per resolution
+                        cameras = self.camera_handler.cameras
+                        detection_scales = {key: camera.config.detection_scale for key, camera in cameras.items()}
+                        detector_backends = {key: camera.config.detector_backend for key, camera in cameras.items()}
+                        marked_by_camera = await self.attendance_service.process_frames_with_tracking(
+                            frames, classroom_id, db, detection_scales, detector_backends
+                        )
 
+                        for camera_key, marked_students in marked_by_camera.items():
                             if marked_students:
                                 self.active_sessions[classroom_id]['processed_count'] += len(marked_students)
                                 logger.info(f"Marked {len(marked_students)} students from {camera_key}")
@@ -15,8 +15,11 @@ class StudentService:
         self.detector = FaceDetector()
 
     async def generate_student_encoding(self, photo_paths: List[str]) -> Optional[bytes]:
-        """Generate face encoding from multiple photos using FaceNet."""
-        encodings = []
+        """
+        Generate face encoding from multiple photos using FaceNet.
+        The averaged encoding is stored together with every per-photo embedding.
+        """
+        faces = []
 
         for path in photo_paths:
             # Load and preprocess image
@@ -35,30 +38,26 @@ class StudentService:
             if len(aligned_faces) > 1:
                 logger.warning(f"Multiple faces detected in {path}, using the first one")
 
-            # Generate encoding
-            encoding = self.encoder.generate_encoding(aligned_faces[0])
-            if encoding is not None:
-                encodings.append(encoding)
-            else:
-                logger.warning(f"Failed to generate encoding for {path}")
+            faces.append(aligned_faces[0])
 
-        if not encodings:
+        if not faces:
             return None
 
-        # Average multiple encodings for better accuracy
-        if len(encodings) > 1:
-            # Stack encodings and compute mean
-            stacked_encodings = np.stack(encodings)
-            average_encoding = np.mean(stacked_encodings, axis=0)
-            # Re-normalize the averaged encoding
-            average_encoding = average_encoding / np.linalg.norm(average_encoding)
-        else:
-            average_encoding = encodings[0]
+        # Generate encodings for all photos in one batch
+        encodings = self.encoder.generate_encoding_matrix(faces)
+        if encodings is None or len(encodings) == 0:
+            logger.warning("Failed to generate encodings for student photos")
+            return None
+
+        # Average multiple encodings for the fast first-pass match
+        average_encoding = np.mean(encodings, axis=0)
+        # Re-normalize the averaged encoding
+        average_encoding = average_encoding / np.linalg.norm(average_encoding)
 
         logger.info(f"Generated encoding from {len(encodings)} photos")
 
-        # Convert to bytes for storage
-        return self.encoder.save_encoding_to_db(average_encoding)
+        # Convert to bytes for storage, keeping the per-photo embeddings for re-ranking
+        return self.encoder.save_encoding_to_db(average_encoding, embeddings=encodings)
 
     def update_student_photos(self, student_id: str, new_photo_paths: List[str]) -> Optional[bytes]:
         """Update student's face encoding with new photos."""
@@ -19,13 +19,63 @@ class Settings(BaseSettings):
     enable_ip_cameras: bool = True
     camera_reconnect_attempts: int = 3
     camera_reconnect_delay: int = 5  # seconds
+    camera_max_frame_age: float = 5.0  # Frames older than this (seconds) are left out of snapshots, 0 = no limit
+    camera_batch_min_cameras: int = 0  # Cameras with new frames the scheduler waits for, 0 = all
+    camera_batch_wait_seconds: float = 1.0  # Longest the scheduler waits for them
+    camera_shared_memory: bool = False  # Also publish frames to a shared-memory ring per camera for worker processes
+    camera_shared_memory_slots: int = 4  # Frames each ring holds
+    # opencv or ffmpeg (opt-in, needs the ffmpeg system package, falls back to opencv without it), per-camera
+    # override. ffmpeg scales frames to the camera resolution, pixel thresholds like QUALITY_MIN_FACE_SIZE follow
+    camera_capture_backend: str = "opencv"
+    ffmpeg_binary: str = "ffmpeg"  # Name on PATH or full path of the ffmpeg executable
 
     # FaceNet Recognition settings
+    enable_inference: bool = True  # False runs an API-only worker (reports, admin) without loading torch
     similarity_threshold: float = 0.6  # Cosine similarity threshold (0.5-0.7 typical)
     confidence_threshold: float = 0.7  # Minimum confidence for positive match
     face_detection_confidence: float = 0.6  # MTCNN detection confidence
     min_face_size: int = 20  # Minimum face size for detection
+    detector_backend: str = "mtcnn"  # mtcnn, yunet (OpenCV DNN), haar (OpenCV cascade) or cascade, per-camera override
+    cascade_proposer: str = "haar"  # cascade backend: haar or yunet proposes regions, MTCNN confirms
+    cascade_padding: float = 0.5  # Proposal boxes grow by this fraction of their size per side before MTCNN
+    cascade_proposal_scale: float = 1.0  # The proposer runs on frames downscaled by this factor
+    yunet_model_path: str = "./data/models/face_detection_yunet_2023mar.onnx"  # From the OpenCV model zoo
+    yunet_score_threshold: float = 0.8  # YuNet face confidence
+    haar_cascade_path: str = ""  # Empty = OpenCV's bundled haarcascade_frontalface_default.xml
+    detection_scale: float = 1.0  # Detect on frames downscaled by this factor (0-1], per-camera override in camera_config.json
+    motion_gating: bool = True  # Skip detection on camera frames where the scene hasn't changed
+    motion_threshold: float = 0.01  # Fraction of changed pixels that counts as motion, per-camera override
+    motion_refresh_seconds: float = 15.0  # Process a static scene at least this often, per-camera override
     facenet_image_size: int = 160  # FaceNet input image size
+    encoder_batch_size: int = 32  # Maximum faces per FaceNet forward pass
+    face_quality_gate: bool = False  # Opt-in: skip encoding faces that can't produce a confident match
+    quality_min_probability: float = 0.95  # MTCNN face probability, only checked for mtcnn and cascade
+    quality_min_face_size: int = 40  # Shorter face box side in frame pixels, above MIN_FACE_SIZE drops small faces
+    quality_max_yaw: float = 0.6  # Nose offset from the eye midpoint in half eye distances, ~1 = profile
+    quality_max_roll: float = 30.0  # Eye line tilt in degrees
+    quality_min_sharpness: float = 25.0  # Laplacian variance of the aligned grayscale face
+    face_tensor_pipeline: bool = True  # Feed MTCNN's aligned tensors straight to the encoder, no uint8 round trip
+    encoder_backend: str = "torch"  # torch, onnx or onnx-int8 (ONNX Runtime, CPU)
+    onnx_model_dir: str = "./data/models"  # Exported ONNX models, created on first use
+    onnx_intra_op_threads: int = 0  # ONNX Runtime threads per inference, 0 = all cores
+    torch_cpu_optimized: bool = False  # Frozen TorchScript, channels_last and warm-up for the torch backend on CPU
+    torch_bf16: bool = False  # bfloat16 autocast for FaceNet, only applied on CPUs with native bf16
+    torch_num_threads: int = 0  # torch intra-op threads, 0 = one per core
+
+    # Gallery search index
+    face_index_type: str = "auto"  # flat (exact), ivf (approximate), fp16/int8 (quantized, needs gallery snapshots) or auto
+    ivf_min_gallery_size: int = 10000  # auto switches to IVF from this many identities
+    ivf_n_lists: int = 0  # IVF clusters, 0 = sqrt(gallery size)
+    ivf_n_probe: int = 8  # Clusters scanned per query, higher = better recall, slower
+    quantized_rescore_k: int = 32  # fp16/int8 candidates re-scored in float32
+    rerank_top_k: int = 5  # Candidates re-ranked against each student's per-photo embeddings
+
+    # Classroom gallery cache shared across attendance sessions
+    gallery_cache_max_classrooms: int = 32
+    gallery_cache_max_mb: int = 256
+    enable_gallery_snapshots: bool = True  # Memory-mapped gallery files shared by all worker processes
+    gallery_snapshot_dir: str = "./data/galleries"
+    gallery_snapshot_poll_seconds: float = 5.0  # How often cached galleries check for a newer snapshot
 
     # Attendance tracking settings
     min_detections_required: int = 3  # Minimum detections before marking attendance
@@ -33,6 +83,13 @@ class Settings(BaseSettings):
     min_tracking_duration: int = 10  # Minimum seconds of tracking before marking
     min_average_confidence: float = 0.7  # Minimum average confidence for attendance
 
+    # Per-camera box tracking, skips re-encoding faces that stay in their box
+    face_box_tracking: bool = True
+    box_tracker_iou_threshold: float = 0.3  # Minimum IoU between a predicted box and a detection
+    box_tracker_max_misses: int = 5  # Frames a track survives without a matching detection
+    box_tracker_reencode_interval: int = 10  # Re-verify a tracked identity every this many frames
+    box_tracker_min_confidence: float = 0.75  # Tracks matched below this are re-encoded every frame
+
     # Automatic scheduling
     enable_auto_scheduling: bool = True
     pre_class_start_minutes: int = 5  # Start attendance this many minutes before class
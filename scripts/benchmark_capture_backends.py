@@ -0,0 +1,77 @@
+# !/usr/bin/env python
+"""
+Compare the CPU cost of the camera capture backends on a recorded video: opencv grabs every
+frame and decodes the ones due at --fps, then resizes, ffmpeg drops and scales frames itself.
+CPU time includes the ffmpeg subprocess
+"""
+import sys
+import os
+import time
+import resource
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+from app.core.camera_handler import DecodePacer
+from app.core.ffmpeg_capture import FFmpegCapture
+
+
+def cpu_seconds() -> float:
+    """User + system time of this process and its finished children."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def run_opencv(video: str, fps: float, size: tuple) -> int:
+    capture = cv2.VideoCapture(video, cv2.CAP_FFMPEG)
+    source_fps = capture.get(cv2.CAP_PROP_FPS) or 30
+    # Files don't block like live cameras, so pace on the video's own clock
+    pacer = DecodePacer(1.0 / fps)
+    index = 0
+    frames = 0
+    while capture.grab():
+        if pacer.due(index / source_fps):
+            ok, frame = capture.retrieve()
+            if ok:
+                cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                frames += 1
+        index += 1
+    capture.release()
+    return frames
+
+
+def run_ffmpeg(video: str, fps: float, size: tuple) -> int:
+    capture = FFmpegCapture(video, size, fps)
+    frames = 0
+    while capture.read()[0]:
+        frames += 1
+    capture.release()
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--video", required=True, help="Recorded camera footage")
+    parser.add_argument("--fps", type=float, default=15, help="Processing frame rate")
+    parser.add_argument("--size", type=int, nargs=2, default=[1440, 810], metavar=("WIDTH", "HEIGHT"))
+    args = parser.parse_args()
+
+    capture = cv2.VideoCapture(args.video)
+    if not capture.isOpened():
+        raise SystemExit(f"Cannot open {args.video}")
+    print(f"{args.video}: {int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))} "
+          f"at {capture.get(cv2.CAP_PROP_FPS):.0f} fps, delivering {args.size[0]}x{args.size[1]} at {args.fps:g} fps")
+    capture.release()
+
+    print(f"{'backend':>8} {'frames':>7} {'cpu s':>7} {'wall s':>7} {'cpu ms/frame':>13}")
+    for name, run in (("opencv", run_opencv), ("ffmpeg", run_ffmpeg)):
+        cpu, wall = cpu_seconds(), time.perf_counter()
+        frames = run(args.video, args.fps, tuple(args.size))
+        cpu, wall = cpu_seconds() - cpu, time.perf_counter() - wall
+        print(f"{name:>8} {frames:>7} {cpu:>7.2f} {wall:>7.2f} {cpu * 1000 / max(frames, 1):>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# !/usr/bin/env python
+"""
+Compare the face detector backends on the same frames: throughput, and recall against a
+reference backend (MTCNN by default) at IoU >= 0.5
+"""
+import sys
+import os
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+from app.core.face_detection import FaceDetector
+from app.core.face_tracker import box_iou
+from app.core.detector_backends import DETECTOR_BACKENDS
+
+
+def load_frames(video: str, image: str, every: int, max_frames: int, width: int) -> list:
+    if image:
+        frame = cv2.imread(image)
+        if frame is None:
+            raise SystemExit(f"Cannot read {image}")
+        frames = [frame]
+    else:
+        capture = cv2.VideoCapture(video)
+        if not capture.isOpened():
+            raise SystemExit(f"Cannot open {video}")
+        frames = []
+        index = 0
+        while len(frames) < max_frames:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if index % every == 0:
+                frames.append(frame)
+            index += 1
+        capture.release()
+
+    if width:
+        frames = [cv2.resize(f, (width, round(f.shape[0] * width / f.shape[1]))) for f in frames]
+    return frames
+
+
+def detect_all(detector: FaceDetector, backend: str, frames: list, scale: float) -> list:
+    """Returns: [x1, y1, x2, y2] boxes per frame"""
+    results = []
+    with detector._inference():
+        for frame in frames:
+            boxes, _, _ = detector._detect(detector._to_rgb(frame), scale, backend)
+            results.append(boxes if boxes is not None else np.empty((0, 4), dtype=np.float32))
+    return results
+
+
+def matched(reference: np.ndarray, boxes: np.ndarray, threshold: float = 0.5) -> int:
+    """Reference faces with a detection overlapping at IoU >= threshold."""
+    if len(reference) == 0 or len(boxes) == 0:
+        return 0
+    return int(np.count_nonzero(box_iou(reference, boxes).max(axis=1) >= threshold))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--video", help="Recorded classroom footage")
+    source.add_argument("--image", help="A single frame with faces")
+    parser.add_argument("--every", type=int, default=15, help="Use every n-th video frame")
+    parser.add_argument("--frames", type=int, default=100, help="Maximum frames to use")
+    parser.add_argument("--width", type=int, default=0, help="Resize frames to this width first")
+    parser.add_argument("--scale", type=float, default=1.0, help="Detection downscale factor")
+    parser.add_argument("--runs", type=int, default=3, help="Timed passes over the frames")
+    parser.add_argument("--reference", default="mtcnn", help="Backend whose faces count as ground truth")
+    parser.add_argument("--backends", nargs="+", default=sorted(DETECTOR_BACKENDS))
+    args = parser.parse_args()
+
+    frames = load_frames(args.video, args.image, args.every, args.frames, args.width)
+    detector = FaceDetector()
+
+    reference = detect_all(detector, args.reference, frames, args.scale)
+    reference_faces = sum(len(r) for r in reference)
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}, "
+          f"{reference_faces} reference faces ({args.reference})")
+    print(f"{'backend':>8} {'frames/s':>9} {'faces':>6} {'recall':>7}")
+
+    for backend in args.backends:
+        try:
+            boxes = detect_all(detector, backend, frames, args.scale)  # Also loads the model
+        except (FileNotFoundError, ImportError) as e:
+            print(f"{backend:>8} unavailable: {e}")
+            continue
+
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            detect_all(detector, backend, frames, args.scale)
+        frames_per_second = args.runs * len(frames) / (time.perf_counter() - start)
+
+        found = sum(len(b) for b in boxes)
+        recall = sum(matched(r, b) for r, b in zip(reference, boxes)) / max(reference_faces, 1)
+        print(f"{backend:>8} {frames_per_second:>9.1f} {found:>6} {recall:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
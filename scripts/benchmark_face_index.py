@@ -0,0 +1,87 @@
+# !/usr/bin/env python
+"""
+Benchmark recall@1 and latency of the approximate IVF index against exact flat search
+"""
+import sys
+import os
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from app.core.face_index import FlatIndex, IVFIndex
+
+EMBEDDING_SIZE = 512
+
+
+def synthetic_gallery(size: int, rng: np.random.Generator, clusters: int = 500) -> np.ndarray:
+    """
+    Unit embeddings with some cluster structure, like real face embeddings where
+    people of similar appearance sit close together.
+    """
+    centers = rng.standard_normal((clusters, EMBEDDING_SIZE)).astype(np.float32)
+    members = centers[rng.integers(0, clusters, size)]
+    vectors = members + 1.5 * rng.standard_normal((size, EMBEDDING_SIZE)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def noisy_queries(gallery: np.ndarray, count: int, rng: np.random.Generator) -> tuple:
+    """Queries are perturbed copies of random gallery members, like a new photo of the same face."""
+    targets = rng.choice(gallery.shape[0], count, replace=False)
+    queries = gallery[targets] + 0.04 * rng.standard_normal((count, EMBEDDING_SIZE)).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True), targets
+
+
+def time_search(index, queries: np.ndarray, frame_size: int, **kwargs) -> tuple:
+    """Search frame by frame; returns (top-1 indices, mean ms per frame)."""
+    results = []
+    start = time.perf_counter()
+    for i in range(0, len(queries), frame_size):
+        indices, _ = index.search(queries[i:i + frame_size], top_k=1, **kwargs)
+        results.append(indices[:, 0])
+    elapsed = (time.perf_counter() - start) * 1000
+    frames = int(np.ceil(len(queries) / frame_size))
+    return np.concatenate(results), elapsed / frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--gallery", type=int, default=60000, help="Enrolled identities")
+    parser.add_argument("--queries", type=int, default=600)
+    parser.add_argument("--faces", type=int, default=30, help="Faces per frame")
+    parser.add_argument("--n-lists", type=int, default=0, help="IVF lists, 0 = sqrt(gallery)")
+    parser.add_argument("--save", help="Optionally save the built IVF index to this .npz path")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    gallery = synthetic_gallery(args.gallery, rng)
+    queries, _ = noisy_queries(gallery, args.queries, rng)
+
+    flat = FlatIndex()
+    flat.build(gallery)
+    exact, flat_ms = time_search(flat, queries, args.faces)
+
+    build_start = time.perf_counter()
+    ivf = IVFIndex(n_lists=args.n_lists)
+    ivf.build(gallery)
+    build_s = time.perf_counter() - build_start
+
+    print(f"gallery={args.gallery} lists={ivf.centroids.shape[0]} build={build_s:.1f}s")
+    print(f"{'index':>12} {'recall@1':>9} {'ms/frame':>9}")
+    print(f"{'flat':>12} {1.0:>9.3f} {flat_ms:>9.2f}")
+
+    for n_probe in (1, 2, 4, 8, 16, 32, 64):
+        if n_probe > ivf.centroids.shape[0]:
+            break
+        found, ivf_ms = time_search(ivf, queries, args.faces, n_probe=n_probe)
+        recall = float(np.mean(found == exact))
+        print(f"{f'ivf/{n_probe}':>12} {recall:>9.3f} {ivf_ms:>9.2f}")
+
+    if args.save:
+        ivf.save(args.save)
+        print(f"Saved IVF index to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# !/usr/bin/env python
+"""
+Benchmark per-frame gallery matching time as the gallery grows
+"""
+import sys
+import os
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from app.core.face_gallery import FaceGallery
+
+GALLERY_SIZES = [50, 500, 5000, 50000]
+EMBEDDING_SIZE = 512
+
+
+def random_unit_vectors(count: int, rng: np.random.Generator) -> np.ndarray:
+    """Generate L2-normalised random embeddings."""
+    vectors = rng.standard_normal((count, EMBEDDING_SIZE)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def match_loop(faces: np.ndarray, known: np.ndarray) -> list:
+    """Previous matcher: one Python-level dot product per known face."""
+    results = []
+    for face in faces:
+        similarities = [float(np.dot(face, k)) for k in known]
+        best = int(np.argmax(similarities))
+        distance = float(np.linalg.norm(face - known[best]))
+        results.append((best, similarities[best], distance))
+    return results
+
+
+def match_vectorized(faces: np.ndarray, gallery: FaceGallery) -> tuple:
+    """Current matcher: one matrix multiply for the whole frame."""
+    indices, similarities = gallery.search(faces, top_k=1)
+    distances = FaceGallery.similarity_to_distance(similarities)
+    return indices, similarities, distances
+
+
+def time_call(fn, repeats: int) -> float:
+    """Median wall time of fn() in milliseconds."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--faces", type=int, default=30, help="Detected faces per frame")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--loop-limit", type=int, default=5000,
+                        help="Skip the per-face loop above this gallery size")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    faces = random_unit_vectors(args.faces, rng)
+
+    print(f"{'gallery':>8} {'loop ms':>10} {'matmul ms':>10} {'speedup':>8}")
+    for size in GALLERY_SIZES:
+        known = random_unit_vectors(size, rng)
+        gallery = FaceGallery(EMBEDDING_SIZE)
+        gallery.build(known, list(range(size)), [str(i) for i in range(size)])
+
+        vectorized_ms = time_call(lambda: match_vectorized(faces, gallery), args.repeats)
+
+        if size <= args.loop_limit:
+            loop_ms = time_call(lambda: match_loop(faces, known), max(1, args.repeats // 2))
+            print(f"{size:>8} {loop_ms:>10.2f} {vectorized_ms:>10.2f} {loop_ms / vectorized_ms:>7.1f}x")
+        else:
+            print(f"{size:>8} {'-':>10} {vectorized_ms:>10.2f} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# !/usr/bin/env python
+"""
+Benchmark face detection for a room with several cameras: one MTCNN pass per camera frame
+versus one batched pass per frame resolution
+"""
+import sys
+import os
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+from app.core.face_detection import FaceDetector
+
+
+def load_frames(image_path: str, cameras: int, width: int, height: int) -> list:
+    """One frame per camera, from an image with faces if given, otherwise random noise."""
+    if image_path:
+        image = cv2.imread(image_path)
+        if image is None:
+            raise SystemExit(f"Cannot read {image_path}")
+        return [cv2.resize(image, (width, height)) for _ in range(cameras)]
+
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(cameras)]
+
+
+def time_call(function, runs: int) -> float:
+    """Mean ms per call after one warm-up call."""
+    function()
+    start = time.perf_counter()
+    for _ in range(runs):
+        function()
+    return (time.perf_counter() - start) * 1000 / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--image", help="Image with faces used as every camera's frame")
+    parser.add_argument("--cameras", type=int, default=3)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    detector = FaceDetector()
+    frames = load_frames(args.image, args.cameras, args.width, args.height)
+
+    single_ms = time_call(lambda: detector.detect_and_align_faces(frames[0]), args.runs)
+    sequential_ms = time_call(lambda: [detector.detect_and_align_faces(f) for f in frames], args.runs)
+    batched_ms = time_call(lambda: detector.detect_and_align_faces_batch(frames), args.runs)
+
+    faces = sum(len(faces) for faces, _ in detector.detect_and_align_faces_batch(frames))
+    print(f"{args.cameras} cameras at {args.width}x{args.height}, {faces} faces per round")
+    print(f"{'mode':>12} {'ms/round':>9} {'x single':>9}")
+    print(f"{'single':>12} {single_ms:>9.1f} {1.0:>9.2f}")
+    print(f"{'sequential':>12} {sequential_ms:>9.1f} {sequential_ms / single_ms:>9.2f}")
+    print(f"{'batched':>12} {batched_ms:>9.1f} {batched_ms / single_ms:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
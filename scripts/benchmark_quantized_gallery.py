@@ -0,0 +1,91 @@
+# !/usr/bin/env python
+"""
+Benchmark memory, throughput and accuracy of the fp16/int8 quantized gallery against exact float32 search
+"""
+import sys
+import os
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from app.core.face_index import FlatIndex, Float16Index, Int8Index
+
+EMBEDDING_SIZE = 512
+
+
+def synthetic_gallery(size: int, rng: np.random.Generator, clusters: int = 500) -> np.ndarray:
+    """Unit embeddings with some cluster structure, like real face embeddings."""
+    centers = rng.standard_normal((clusters, EMBEDDING_SIZE)).astype(np.float32)
+    members = centers[rng.integers(0, clusters, size)]
+    vectors = members + 1.5 * rng.standard_normal((size, EMBEDDING_SIZE)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def noisy_queries(gallery: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    """Perturbed copies of random gallery members, like a new photo of the same face."""
+    targets = rng.choice(gallery.shape[0], count, replace=False)
+    queries = gallery[targets] + 0.04 * rng.standard_normal((count, EMBEDDING_SIZE)).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def time_search(index, queries: np.ndarray, frame_size: int) -> tuple:
+    """Search frame by frame; returns (top-1 indices, top-1 similarities, mean ms per frame)."""
+    indices = []
+    scores = []
+    start = time.perf_counter()
+    for i in range(0, len(queries), frame_size):
+        found, similarities = index.search(queries[i:i + frame_size], top_k=1)
+        indices.append(found[:, 0])
+        scores.append(similarities[:, 0])
+    elapsed = (time.perf_counter() - start) * 1000
+    frames = int(np.ceil(len(queries) / frame_size))
+    return np.concatenate(indices), np.concatenate(scores), elapsed / frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--gallery", type=int, default=50000, help="Enrolled identities")
+    parser.add_argument("--queries", type=int, default=600)
+    parser.add_argument("--faces", type=int, default=30, help="Faces per frame")
+    parser.add_argument("--rescore-k", type=int, default=32, help="Candidates re-scored in float32")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    gallery = synthetic_gallery(args.gallery, rng)
+    queries = noisy_queries(gallery, args.queries, rng)
+
+    flat = FlatIndex()
+    flat.build(gallery)
+    exact, exact_scores, flat_ms = time_search(flat, queries, args.faces)
+
+    # Quantization error of the raw codes, before re-scoring
+    int8 = Int8Index(rescore_k=args.rescore_k)
+    int8.build(gallery)
+    int8_error = np.abs(int8.codes.astype(np.float32) * int8.scales[:, np.newaxis] - gallery).max()
+    fp16_error = np.abs(gallery.astype(np.float16).astype(np.float32) - gallery).max()
+
+    print(f"gallery={args.gallery} faces/frame={args.faces} rescore_k={args.rescore_k}")
+    print(f"max element error: fp16={fp16_error:.2e} int8={int8_error:.2e}")
+    print(f"{'index':>8} {'scan MB':>8} {'ms/frame':>9} {'recall@1':>9} {'max |score delta|':>18}")
+    print(f"{'float32':>8} {gallery.nbytes / 2 ** 20:>8.1f} {flat_ms:>9.2f} {1.0:>9.3f} {0.0:>18.2e}")
+
+    for name, index_class in (("fp16", Float16Index), ("int8", Int8Index)):
+        index = index_class(rescore_k=args.rescore_k)
+        index.build(gallery)
+        found, scores, ms = time_search(index, queries, args.faces)
+
+        recall = float(np.mean(found == exact))
+        delta = float(np.abs(scores - exact_scores).max())
+        print(f"{name:>8} {index.code_nbytes / 2 ** 20:>8.1f} {ms:>9.2f} {recall:>9.3f} {delta:>18.2e}")
+
+        # Same candidates without float32 re-scoring, shows what re-scoring buys
+        index.rescore_k = 1
+        found, _, ms = time_search(index, queries, args.faces)
+        recall = float(np.mean(found == exact))
+        print(f"{name + '/raw':>8} {index.code_nbytes / 2 ** 20:>8.1f} {ms:>9.2f} {recall:>9.3f} {'-':>18}")
+
+
+if __name__ == "__main__":
+    main()
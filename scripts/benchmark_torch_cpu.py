@@ -0,0 +1,94 @@
+# !/usr/bin/env python
+"""
+Micro-benchmark the CPU fast-path toggles of the torch face models (faces/s per toggle)
+"""
+import sys
+import os
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import torch
+from facenet_pytorch import InceptionResnetV1, MTCNN
+from app.core.torch_runtime import bf16_supported, configure_threads, inference_context, optimize_encoder
+
+IMAGE_SIZE = 160
+
+
+def load_encoder(pretrained: bool):
+    torch.manual_seed(0)
+    return InceptionResnetV1(pretrained='vggface2' if pretrained else None, classify=False).eval()
+
+
+def time_encoder(model, batch: torch.Tensor, runs: int, context) -> tuple:
+    """Returns (first call ms, steady-state faces/s)."""
+    with context():
+        start = time.perf_counter()
+        model(batch)
+        first_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for _ in range(runs):
+            model(batch)
+        elapsed = time.perf_counter() - start
+
+    return first_ms, runs * batch.shape[0] / elapsed
+
+
+def time_detector(detector: MTCNN, frame: np.ndarray, runs: int, context) -> float:
+    """Returns frames/s."""
+    with context():
+        detector.detect(frame)
+        start = time.perf_counter()
+        for _ in range(runs):
+            detector.detect(frame)
+        return runs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch", type=int, default=16, help="Faces per forward pass")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads, 0 = default")
+    parser.add_argument("--untrained", action="store_true", help="Random weights, skips the weight download")
+    args = parser.parse_args()
+
+    configure_threads(args.threads)
+    print(f"threads={torch.get_num_threads()} batch={args.batch} bf16 supported={bf16_supported()}")
+
+    rng = np.random.default_rng(0)
+    faces = torch.from_numpy(rng.uniform(-1, 1, (args.batch, 3, IMAGE_SIZE, IMAGE_SIZE)).astype(np.float32))
+    channels_last = faces.contiguous(memory_format=torch.channels_last)
+
+    variants = [
+        ("eager, no_grad", lambda: load_encoder(not args.untrained), faces, torch.no_grad),
+        ("+ inference_mode", lambda: load_encoder(not args.untrained), faces, torch.inference_mode),
+        ("+ channels_last", lambda: optimize_encoder(load_encoder(not args.untrained), freeze=False, warmup_batches=0),
+         channels_last, torch.inference_mode),
+        ("+ frozen trace", lambda: optimize_encoder(load_encoder(not args.untrained), warmup_batches=0),
+         channels_last, torch.inference_mode),
+        ("+ warm-up", lambda: optimize_encoder(load_encoder(not args.untrained)),
+         channels_last, torch.inference_mode),
+    ]
+    if bf16_supported():
+        variants.append((
+            "+ bf16 autocast", lambda: optimize_encoder(load_encoder(not args.untrained), bf16=True),
+            channels_last, lambda: inference_context(bf16=True)
+        ))
+
+    print(f"{'encoder':<20} {'first call ms':>14} {'faces/s':>9}")
+    for name, build, batch, context in variants:
+        first_ms, faces_per_second = time_encoder(build(), batch, args.runs, context)
+        print(f"{name:<20} {first_ms:>14.0f} {faces_per_second:>9.1f}")
+
+    detector = MTCNN(keep_all=True, min_face_size=20)
+    frame = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    print(f"{'detector (640x480)':<20} {'frames/s':>24}")
+    for name, context in (("autograd on", torch.enable_grad), ("inference_mode", torch.inference_mode)):
+        print(f"{name:<20} {time_detector(detector, frame, args.runs, context):>24.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# !/usr/bin/env python
+"""
+Convert pickled Student.face_encoding rows to the raw float32 format
+"""
+import sys
+import os
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import Student
+from app.core.encoding_format import is_raw_encoding, decode_encoding, encode_encoding
+from config.database import SessionLocal
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def migrate_encodings(batch_size: int = 500, dry_run: bool = False):
+    """Rewrite every legacy encoding row in batches, leaving raw rows untouched."""
+    db = SessionLocal()
+    last_id = 0
+    converted = 0
+    skipped = 0
+    failed = 0
+
+    try:
+        while True:
+            rows = db.query(Student.id, Student.face_encoding).filter(
+                Student.id > last_id,
+                Student.face_encoding.isnot(None)
+            ).order_by(Student.id).limit(batch_size).all()
+
+            if not rows:
+                break
+
+            updates = []
+            for student_id, data in rows:
+                last_id = student_id
+
+                if is_raw_encoding(data):
+                    skipped += 1
+                    continue
+
+                try:
+                    encoding, embeddings, model_id = decode_encoding(data)
+                    updates.append({'id': student_id, 'face_encoding': encode_encoding(encoding, embeddings, model_id)})
+                except Exception as e:
+                    logger.error(f"Cannot convert encoding of student {student_id}: {e}")
+                    failed += 1
+
+            if updates and not dry_run:
+                db.bulk_update_mappings(Student, updates)
+                db.commit()
+
+            converted += len(updates)
+            logger.info(f"Processed up to student id {last_id}: {converted} converted, {skipped} already raw")
+
+        action = "Would convert" if dry_run else "Converted"
+        logger.info(f"{action} {converted} encodings ({skipped} already raw, {failed} failed)")
+
+    except Exception as e:
+        logger.error(f"Error migrating encodings: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    migrate_encodings(batch_size=args.batch_size, dry_run=args.dry_run)
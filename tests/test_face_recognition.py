@@ -0,0 +1,941 @@
+# tests/test_face_recognition.py
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Importing the API must not load the ML stack, torch alone takes longer than this
+IMPORT_TIME_BUDGET_SECONDS = 3.0
+
+_IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'seconds': elapsed,
+    'ml_modules': [m for m in ('torch', 'facenet_pytorch') if m in sys.modules]
+}))
+"""
+
+
+@pytest.mark.parametrize("enable_inference", ["true", "false"])
+def test_import_app_main_is_fast_and_skips_ml_stack(enable_inference):
+    """import app.main stays under budget and leaves torch unloaded until recognition runs."""
+    env = dict(os.environ, ENABLE_INFERENCE=enable_inference, ENABLE_BACKGROUND_SERVICE="false")
+    result = subprocess.run(
+        [sys.executable, "-c", _IMPORT_SCRIPT],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report['ml_modules'] == []
+    assert report['seconds'] < IMPORT_TIME_BUDGET_SECONDS
+
+
+# Minimum cosine similarity between ONNX Runtime and PyTorch embeddings of the same face
+ONNX_PARITY_TOLERANCE = {"onnx": 0.9999, "onnx-int8": 0.98}
+
+
+@pytest.fixture
+def seeded_facenet(monkeypatch):
+    """A private model registry with deterministic FaceNet weights, so no download is needed."""
+    pytest.importorskip("facenet_pytorch")
+    import app.core.face_encoding as face_encoding
+    from app.core.model_registry import ModelRegistry
+
+    def load_facenet(device):
+        import torch
+        from facenet_pytorch import InceptionResnetV1
+        torch.manual_seed(0)
+        return InceptionResnetV1(classify=False, device=device).eval()
+
+    registry = ModelRegistry()
+    registry.register("facenet", load_facenet)
+    monkeypatch.setattr(face_encoding, "model_registry", registry)
+    return registry
+
+
+@pytest.fixture
+def seeded_model_registry(seeded_facenet, tmp_path):
+    """seeded_facenet plus ONNX Runtime exports of the same weights."""
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    import app.core.face_encoding as face_encoding
+    from app.core.onnx_encoder import load_onnx_encoder
+
+    registry = seeded_facenet
+    for backend, quantized in (("onnx", False), ("onnx-int8", True)):
+        registry.register(
+            face_encoding.ENCODER_MODELS[backend],
+            lambda device, quantized=quantized: load_onnx_encoder(
+                str(tmp_path), lambda: registry.create("facenet"), quantized=quantized
+            )
+        )
+    return registry
+
+
+@pytest.mark.parametrize("backend", ["onnx", "onnx-int8"])
+def test_onnx_encoder_matches_torch(seeded_model_registry, backend):
+    """ONNX Runtime embeddings stay within a cosine tolerance of the PyTorch ones."""
+    import numpy as np
+    from app.core.face_encoding import FaceEncoder
+
+    rng = np.random.default_rng(0)
+    faces = [rng.integers(0, 256, (160, 160, 3), dtype=np.uint8) for _ in range(6)]
+
+    encoder = FaceEncoder()
+    expected = encoder.generate_encoding_matrix(faces)
+
+    encoder.backend = backend
+    actual = encoder.generate_encoding_matrix(faces)
+    single = encoder.generate_encoding(faces[0])
+
+    assert actual.shape == expected.shape
+    assert np.min(np.sum(actual * expected, axis=1)) >= ONNX_PARITY_TOLERANCE[backend]
+    assert float(np.dot(single, expected[0])) >= ONNX_PARITY_TOLERANCE[backend]
+
+
+def test_box_tracker_only_reencodes_new_or_stale_faces():
+    """A recognised face moving steadily keeps its track and is re-encoded only every interval frames."""
+    from app.core.face_tracker import BoxTracker
+
+    tracker = BoxTracker(reencode_interval=4, min_confidence=0.75)
+
+    def face_at(x):
+        return (100, x + 80, 180, x)  # (top, right, bottom, left)
+
+    first = tracker.update([face_at(0)])
+    assert first[0].needs_encoding
+    BoxTracker.record_recognition(first[0].track, {'student_id': 7, 'name': "A", 'confidence': 0.9})
+
+    needs_encoding = []
+    for step in range(1, 9):
+        assignments = tracker.update([face_at(5 * step), face_at(400)] if step == 3 else [face_at(5 * step)])
+        assert assignments[0].track is first[0].track
+        if step == 3:
+            assert assignments[1].needs_encoding  # a new face
+        needs_encoding.append(assignments[0].needs_encoding)
+        if assignments[0].needs_encoding:
+            BoxTracker.record_recognition(assignments[0].track, {'student_id': 7, 'name': "A", 'confidence': 0.9})
+
+    assert needs_encoding == [False, False, False, True, False, False, False, True]
+    assert tracker.stats.faces_encoded == 4
+
+
+def test_motion_gate_skips_static_frames_until_refresh():
+    """Identical frames are skipped, a scene change or the refresh interval lets a frame through."""
+    import numpy as np
+    from app.core.motion_gate import MotionGate
+
+    gate = MotionGate(threshold=0.01, refresh_seconds=10)
+    frame = np.full((480, 640, 3), 100, dtype=np.uint8)
+    changed = frame.copy()
+    changed[100:300, 200:400] = 220
+
+    assert gate.should_process(frame, now=0)
+    assert not gate.should_process(frame, now=1)
+    assert gate.should_process(changed, now=2)
+    assert not gate.should_process(changed, now=5)
+    assert gate.should_process(changed, now=12.5)
+    assert gate.get_stats()['frames_skipped'] == 2
+    assert gate.get_stats()['forced_refreshes'] == 1
+
+
+def test_face_quality_gate_checks_match_single_face_measures():
+    """The vectorised sharpness equals OpenCV's per-face Laplacian variance, pose flags profiles."""
+    import cv2
+    import numpy as np
+    from app.core.face_quality import FaceQualityGate, laplacian_variance
+
+    rng = np.random.default_rng(0)
+    faces = rng.integers(0, 256, (3, 40, 40), dtype=np.uint8)
+    expected = [cv2.Laplacian(face, cv2.CV_64F)[1:-1, 1:-1].var() for face in faces]
+    assert np.allclose(laplacian_variance(faces), expected, rtol=1e-4)
+
+    boxes = np.array([[0, 0, 100, 100], [0, 0, 100, 100], [0, 0, 20, 20]], dtype=np.float32)
+    probs = np.array([0.99, 0.99, 0.99])
+    frontal = [[30, 40], [70, 40], [50, 60], [35, 80], [65, 80]]
+    profile = [[30, 40], [70, 40], [68, 60], [55, 80], [70, 80]]
+    landmarks = np.array([frontal, profile, frontal], dtype=np.float32)
+
+    gate = FaceQualityGate(min_face_size=40, max_yaw=0.6)
+    assert gate.check_detections(boxes, probs, landmarks).tolist() == [True, False, False]
+    assert gate.get_stats()['dropped'] == {'probability': 0, 'size': 1, 'pose': 1, 'sharpness': 0}
+
+
+def test_detector_backends_share_the_detection_format():
+    """Unknown backends fail fast, landmark-less backends get frontal template landmarks."""
+    import numpy as np
+    from app.core.detector_backends import DetectorBackend, create_detector_backend, template_landmarks
+    from app.core.face_quality import landmark_pose
+
+    with pytest.raises(ValueError):
+        create_detector_backend("retinaface")
+    with pytest.raises(TypeError):
+        DetectorBackend()
+
+    boxes = np.array([[10, 20, 110, 140], [300, 50, 340, 100]], dtype=np.float32)
+    landmarks = template_landmarks(boxes)
+    assert landmarks.shape == (2, 5, 2)
+    assert np.all((landmarks[..., 0] >= boxes[:, None, 0]) & (landmarks[..., 0] <= boxes[:, None, 2]))
+    pose = landmark_pose(landmarks)
+    assert np.allclose(pose['yaw'], 0, atol=1e-5) and np.allclose(pose['roll'], 0, atol=1e-5)
+
+
+def test_cascade_regions_are_padded_clipped_and_merged():
+    """Overlapping padded proposals become one crop, regions stay inside the frame."""
+    import numpy as np
+    from app.core.detector_backends import merge_regions
+
+    boxes = np.array([[10, 10, 50, 50], [60, 10, 100, 50], [300, 300, 340, 340]], dtype=np.float32)
+    regions = merge_regions(boxes, padding=0.5, width=320, height=320)
+
+    assert sorted(regions) == [(0, 0, 120, 70), (280, 280, 320, 320)]
+
+
+def test_latest_frame_slot_keeps_only_the_newest_frame():
+    """Readers get the newest frame, and waiting for a newer one times out or wakes on put."""
+    import threading
+    import numpy as np
+    from app.core.frame_buffer import LatestFrameSlot
+
+    slot = LatestFrameSlot()
+    assert slot.latest() is None
+    assert slot.wait_newer(0, timeout=0.01) is None
+
+    for value in range(3):
+        slot.put(np.full((2, 2), value, dtype=np.uint8))
+    frame = slot.wait_newer(0, timeout=0.01)
+    assert frame.sequence == 3 and frame.image[0, 0] == 2
+    assert slot.wait_newer(frame.sequence, timeout=0.01) is None
+
+    threading.Timer(0.05, slot.put, args=(np.zeros((2, 2), dtype=np.uint8),)).start()
+    assert slot.wait_newer(frame.sequence, timeout=2).sequence == 4
+
+
+def test_camera_snapshot_skips_dead_cameras_and_waits_for_k_new_frames():
+    """Snapshots never block on a silent camera, wait_for_frames returns once K cameras have new frames."""
+    import threading
+    import time
+    import numpy as np
+    from app.core.camera_handler import MultiCameraHandler, CameraConfig, CameraType
+
+    handler = MultiCameraHandler()
+    keys = [
+        handler.add_camera(CameraConfig(camera_id=i, camera_type=CameraType.USB, name=f"cam{i}", location="room"))
+        for i in range(3)
+    ]
+    frame = np.zeros((4, 4, 3), dtype=np.uint8)
+    handler.cameras[keys[0]].frame_slot.put(frame)
+    handler.cameras[keys[1]].frame_slot.put(frame, captured_at=time.monotonic() - 60)  # Stalled camera
+
+    start = time.perf_counter()
+    snapshot = handler.get_frame_snapshot(new_only=True, max_age=5)
+    assert list(snapshot) == [keys[0]]
+    assert time.perf_counter() - start < 0.1
+    assert handler.get_frame_snapshot(new_only=True, max_age=5) == {}
+
+    threading.Timer(0.05, handler.cameras[keys[2]].frame_slot.put, args=(frame,)).start()
+    threading.Timer(0.1, handler.cameras[keys[0]].frame_slot.put, args=(frame,)).start()
+    frames = handler.wait_for_frames(min_cameras=2, timeout=2, max_age=5)
+    assert sorted(frames) == sorted([keys[0], keys[2]])
+
+
+def test_capture_grabs_every_frame_but_decodes_at_processing_fps():
+    """grab() drains the source at its own rate, retrieve() only runs on the fps deadline grid."""
+    import numpy as np
+    from app.core.camera_handler import DecodePacer, grab_and_decode
+
+    pacer = DecodePacer(0.2)
+    due = [pacer.due(t / 30) for t in range(60)]  # Two seconds of a 30 fps source
+    assert sum(due) == 10
+    assert due[0] and not due[1]
+    assert pacer.due(10.0) and not pacer.due(10.1) and pacer.due(10.2)  # Missed deadlines are skipped
+
+    class Source:
+        grabs = retrieves = 0
+
+        def grab(self):
+            self.grabs += 1
+            return True
+
+        def retrieve(self):
+            self.retrieves += 1
+            return True, np.zeros((4, 4, 3), dtype=np.uint8)
+
+    source = Source()
+    pacer = DecodePacer(3600)
+    results = [grab_and_decode(source, pacer) for _ in range(5)]
+    assert [ok for ok, _, _ in results] == [True] * 5
+    assert [frame is not None for _, frame, _ in results] == [True, False, False, False, False]
+    assert (source.grabs, source.retrieves) == (5, 1)
+
+
+def test_shared_frame_ring_is_readable_from_another_process():
+    """Frames written to the ring are read by name from a separate process, with their sequence and time."""
+    import numpy as np
+    from app.core.frame_buffer import SharedFrameRing
+
+    ring = SharedFrameRing.create(f"frames_test_{os.getpid()}", (32, 24), slots=3)
+    try:
+        assert ring.shape == (24, 32, 3) and ring.latest() is None
+        for value in range(1, 5):
+            ring.put(np.full((24, 32, 3), value, dtype=np.uint8), captured_at=float(value))
+        ring.put(np.full((48, 64, 3), 9, dtype=np.uint8))  # Wrong size is resized into the slot
+
+        frame = ring.latest(copy=False)
+        assert frame.sequence == 5 and frame.image.shape == (24, 32, 3) and (frame.image == 9).all()
+        assert ring.is_current(4) and not ring.is_current(2)  # Slot of frame 2 now holds frame 5
+
+        reader = (
+            "import sys\n"
+            "from app.core.frame_buffer import SharedFrameRing\n"
+            f"ring = SharedFrameRing.attach({ring.name!r})\n"
+            "frame = ring.latest()\n"
+            "print(frame.sequence, int(frame.image.mean()), frame.image.shape)\n"
+            "ring.close()\n"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, "-c", reader], cwd=root, capture_output=True, text=True, check=True)
+        assert output.stdout.split("(")[0].split() == ["5", "9"]
+        del frame
+    finally:
+        ring.close()
+
+
+def test_ffmpeg_capture_drops_and_scales_frames_of_a_local_video(tmp_path):
+    """ffmpeg's fps and scale filters deliver frames at the processing rate and size, each in its own buffer."""
+    import shutil
+    import cv2
+    import numpy as np
+    from config import settings
+    from app.core.ffmpeg_capture import FFmpegCapture
+
+    if shutil.which(settings.ffmpeg_binary) is None:
+        pytest.skip("ffmpeg not installed")
+
+    path = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (320, 240))
+    for i in range(60):  # Two seconds
+        writer.write(np.full((240, 320, 3), (i * 4, 0, 255 - i * 4), dtype=np.uint8))
+    writer.release()
+
+    capture = FFmpegCapture(path, (160, 120), fps=5)
+    frames = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(frame)
+    capture.release()
+
+    assert 9 <= len(frames) <= 11
+    assert all(frame.shape == (120, 160, 3) for frame in frames)
+    assert frames[0][0, 0, 0] < frames[-1][0, 0, 0]  # Blue rises over the clip, earlier frames weren't overwritten
+    assert not capture.isOpened()
+
+
+def _unit_rows(count: int, dim: int = 16, seed: int = 0):
+    import numpy as np
+    rows = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def test_ivf_index_probing_every_list_matches_flat_search():
+    import numpy as np
+    from app.core.face_index import FlatIndex, IVFIndex
+
+    embeddings, queries = _unit_rows(300), _unit_rows(20, seed=1)
+    flat = FlatIndex()
+    flat.build(embeddings)
+    ivf = IVFIndex(n_lists=12, n_probe=12)
+    ivf.build(embeddings)
+
+    flat_ids, flat_scores = flat.search(queries, top_k=5)
+    ivf_ids, ivf_scores = ivf.search(queries, top_k=5)
+    assert (ivf_ids == flat_ids).all()
+    assert np.allclose(ivf_scores, flat_scores, atol=1e-6)
+
+
+def test_ivf_index_query_probing_only_empty_lists_finds_nothing():
+    import numpy as np
+    from app.core.face_index import FaceIndex
+
+    eye = np.eye(4, dtype=np.float32)
+    # Both rows live in list 0, list 1 (centroid along the third axis) is empty
+    index = FaceIndex.from_state("ivf", {
+        'embeddings': eye[:2], 'centroids': eye[[0, 2]], 'ids': np.array([0, 1]),
+        'offsets': np.array([0, 2, 2]), 'params': np.array([2, 1, 10, 0])
+    })
+
+    ids, scores = index.search(eye[2], top_k=2)
+    assert ids.tolist() == [[-1, -1]]
+    assert np.isneginf(scores).all()
+    assert index.search(eye[0], top_k=1)[0].tolist() == [[0]]
+
+
+@pytest.mark.parametrize("kind", ["flat", "ivf"])
+def test_face_index_save_load_round_trip(tmp_path, kind):
+    import numpy as np
+    from app.core.face_index import FaceIndex, create_index
+
+    embeddings, queries = _unit_rows(200), _unit_rows(10, seed=1)
+    index = create_index(kind, len(embeddings), n_lists=8, n_probe=3)
+    index.build(embeddings)
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+    loaded = FaceIndex.load(path)
+
+    assert type(loaded) is type(index)
+    for before, after in zip(index.search(queries, top_k=4), loaded.search(queries, top_k=4)):
+        assert np.array_equal(before, after)
+
+
+def test_gallery_cache_is_invalidated_on_commit_but_not_on_rollback(db_session, monkeypatch):
+    """Student and enrollment changes drop cached galleries once committed, rolled-back ones don't."""
+    import app.services.gallery_cache as gallery_cache_module
+    from app.core import FaceGallery
+    from app.models import Student, Classroom, Enrollment
+
+    cache = gallery_cache_module.GalleryCache()
+    monkeypatch.setattr(gallery_cache_module, "gallery_cache", cache)
+
+    student = Student(student_id="S1", first_name="Ada", last_name="L", email="ada@example.com", face_encoding=b"a")
+    other = Student(student_id="S2", first_name="Bo", last_name="K", email="bo@example.com")
+    room_a, room_b = Classroom(course_code="A101", course_name="A"), Classroom(course_code="B101", course_name="B")
+    db_session.add_all([student, other, room_a, room_b])
+    db_session.flush()
+    db_session.add(Enrollment(student_id=student.id, classroom_id=room_a.id))
+    db_session.commit()
+
+    def cache_both():
+        cache._put(room_a.id, FaceGallery(), {student.id}, cache._generation)
+        cache._put(room_b.id, FaceGallery(), set(), cache._generation)
+
+    cache_both()
+    student.face_encoding = b"b"
+    db_session.flush()  # Listeners have seen the change
+    db_session.rollback()
+    assert cache.get(room_a.id) is not None and cache.get(room_b.id) is not None
+
+    student.face_encoding = b"c"
+    db_session.commit()
+    assert cache.get(room_a.id) is None  # The re-photographed student is in room A
+    assert cache.get(room_b.id) is not None
+
+    cache_both()
+    db_session.add(Enrollment(student_id=other.id, classroom_id=room_b.id))
+    db_session.flush()
+    db_session.rollback()
+    assert cache.get(room_b.id) is not None
+
+    db_session.add(Enrollment(student_id=other.id, classroom_id=room_b.id))
+    db_session.commit()
+    assert cache.get(room_b.id) is None
+    assert cache.get(room_a.id) is not None
+
+
+def test_raw_encoding_round_trip_and_header_checks():
+    import struct
+    import numpy as np
+    from app.core.encoding_format import decode_encoding, encode_encoding, is_raw_encoding
+
+    encoding = np.arange(8, dtype=np.float32)
+    embeddings = np.arange(24, dtype=np.float32).reshape(3, 8)
+    data = encode_encoding(encoding, embeddings, model_id="facenet-test")
+    assert is_raw_encoding(data)
+
+    decoded, decoded_embeddings, model_id = decode_encoding(data)
+    assert np.array_equal(decoded, encoding) and np.array_equal(decoded_embeddings, embeddings)
+    assert model_id == "facenet-test"
+    assert decode_encoding(encode_encoding(encoding))[1] is None
+
+    with pytest.raises(ValueError, match="version"):
+        decode_encoding(data[:4] + bytes([99]) + data[5:])
+    with pytest.raises(ValueError, match="dtype"):
+        decode_encoding(data[:5] + bytes([7]) + data[6:])
+    with pytest.raises(ValueError, match="Truncated"):
+        decode_encoding(data[:6])
+    with pytest.raises(ValueError):  # Header claims more rows than the payload holds
+        decode_encoding(data[:8] + struct.pack("<H", 50) + data[10:])
+
+
+@pytest.mark.parametrize("protocol", range(6))
+def test_legacy_pickled_encodings_decode_with_every_protocol(protocol):
+    import pickle
+    import numpy as np
+    from app.core.encoding_format import DEFAULT_MODEL_ID, decode_encoding
+
+    payload = {'encoding': np.arange(8, dtype=np.float64), 'embeddings': np.ones((2, 8), dtype=np.float32),
+               'model': 'facenet'}
+    encoding, embeddings, model_id = decode_encoding(pickle.dumps(payload, protocol=protocol))
+    assert encoding.dtype == np.float32 and np.array_equal(encoding, np.arange(8))
+    assert embeddings.shape == (2, 8) and model_id == DEFAULT_MODEL_ID
+
+
+def test_legacy_decoder_rejects_disallowed_globals():
+    import pickle
+    from app.core.encoding_format import decode_encoding
+
+    with pytest.raises(pickle.UnpicklingError, match="Disallowed global"):
+        decode_encoding(pickle.dumps({'encoding': os.getcwd}))
+
+
+def test_gallery_snapshot_publish_after_invalidation_is_discarded(tmp_path):
+    """A gallery built before an invalidation must not replace the invalidated pointer."""
+    import numpy as np
+    from app.core import FaceGallery, GallerySnapshotStore
+
+    store = GallerySnapshotStore(str(tmp_path))
+    gallery = FaceGallery(embedding_size=16)
+    gallery.build(list(_unit_rows(3)), [1, 2, 3], ["a", "b", "c"])
+
+    assert store.publish(7, gallery, {1, 2, 3}, expected_version=None) is not None
+    expected = store.current_version(7)
+
+    # Built from the database, then a student changed before the snapshot was published
+    store.invalidate([7])
+    invalidated = store._read_pointer(7)
+    assert store.publish(7, gallery, {1, 2, 3}, expected_version=expected) is None
+
+    assert store._read_pointer(7) == invalidated and invalidated['path'] is None
+    assert store.load(7, FaceGallery(embedding_size=16)) is None
+    assert not [entry for entry in os.listdir(tmp_path / "classroom_7") if entry.startswith("v")]
+
+    # Built after the invalidation, it goes through
+    version = store.publish(7, gallery, {1, 2, 3}, expected_version=invalidated['version'])
+    loaded_version, loaded, student_ids = store.load(7, FaceGallery(embedding_size=16))
+    assert loaded_version == version and student_ids == {1, 2, 3}
+    assert np.array_equal(loaded.embeddings, gallery.embeddings)
+
+
+def test_quantized_gallery_rescores_against_the_memory_mapped_snapshot(tmp_path):
+    """A freshly built gallery is served from its snapshot, so the float32 matrix isn't held twice."""
+    import numpy as np
+    from app.core import FaceGallery, GallerySnapshotStore
+    from app.core.face_index import FaceIndex, QuantizedIndex
+    from app.services.gallery_cache import GalleryCache
+
+    def memory_mapped(array) -> bool:
+        while array is not None:
+            if isinstance(array, np.memmap):
+                return True
+            array = array.base
+        return False
+
+    embeddings = _unit_rows(50)
+
+    def load():
+        gallery = FaceGallery(embedding_size=16, index_type="int8")
+        gallery.build(list(embeddings), list(range(50)), [str(i) for i in range(50)])
+        return gallery, set(range(50))
+
+    cache = GalleryCache(snapshots=GallerySnapshotStore(str(tmp_path)))
+    gallery = cache.get_or_load(1, load, lambda: FaceGallery(embedding_size=16, index_type="int8"))
+
+    assert gallery.index.kind == "int8"
+    assert memory_mapped(gallery.embeddings) and memory_mapped(gallery.index.embeddings)
+    assert gallery.search(embeddings[:5])[0][:, 0].tolist() == [0, 1, 2, 3, 4]
+
+    for abstract in (FaceIndex, QuantizedIndex):
+        with pytest.raises(TypeError):
+            abstract()
+
+
+def test_identities_carried_by_box_tracks_do_not_count_as_detections(monkeypatch):
+    """One FaceNet match plus carried frames must not reach min_detections on its own."""
+    from datetime import datetime, timedelta
+    from app.services.attendance_service import AttendanceService
+
+    service = AttendanceService()
+    marked = []
+    monkeypatch.setattr(service, "_mark_attendance", lambda student_id, *args: marked.append(student_id) or {})
+
+    start = datetime.now()
+
+    def frame(seconds: int, carried: bool):
+        result = {'student_id': 7, 'name': "Ada", 'confidence': 0.9}
+        if carried:
+            result['carried'] = True
+        return service._update_tracks([result], 1, None, "cam", start + timedelta(seconds=seconds), set())
+
+    frame(0, carried=False)
+    for seconds in range(1, 20):
+        frame(seconds, carried=True)
+
+    track = service.active_tracks[7]
+    assert track.detection_count == 1 and track.confidence_scores == [0.9]
+    assert track.last_seen == start + timedelta(seconds=19)
+    assert marked == []
+
+    frame(20, carried=False)
+    frame(21, carried=False)
+    assert track.detection_count == service.min_detections and marked == [7]
+
+
+def test_stationary_tracked_face_is_marked_within_min_detections_frames(monkeypatch):
+    """A box track keeps encoding its face until the student has min_detections fresh matches."""
+    import asyncio
+    import numpy as np
+    from app.services.attendance_service import AttendanceService
+
+    service = AttendanceService()
+    service.box_tracking = True
+    service.min_duration = 0
+    marked = []
+    encoded_per_frame = []
+    monkeypatch.setattr(service, "_refresh_gallery", lambda classroom_id, db: None)
+    monkeypatch.setattr(service, "_mark_attendance", lambda student_id, *args: marked.append(student_id) or {})
+
+    recognition = service.face_recognition
+    monkeypatch.setattr(recognition, "detect_faces_batch",
+                        lambda images, *args: [("faces", [(40, 120, 120, 40)]) for _ in images])
+
+    def recognize_detections(detections, selected=None):
+        encoded_per_frame.append(sum(len(indices) for indices in selected))
+        return [[{'name': "Ada", 'student_id': 7, 'location': detections[0][1][i], 'confidence': 0.9,
+                  'timestamp': None} for i in indices] for indices in selected]
+
+    monkeypatch.setattr(recognition, "recognize_detections", recognize_detections)
+
+    frame = np.zeros((160, 160, 3), dtype=np.uint8)
+    for _ in range(service.min_detections):
+        asyncio.run(service.process_frames_with_tracking({"cam": frame}, 1, None))
+
+    assert marked == [7]
+    assert encoded_per_frame == [1] * service.min_detections
+
+    # Once marked, the identity is carried until re-verification is due
+    asyncio.run(service.process_frames_with_tracking({"cam": frame}, 1, None))
+    assert encoded_per_frame[-1] == 0
+
+
+def test_yunet_backend_detects_a_face_in_the_shared_format():
+    """Runs only where the YuNet model has been downloaded to YUNET_MODEL_PATH."""
+    import numpy as np
+    from config import settings
+    from app.core.detector_backends import YuNetBackend
+
+    if not os.path.exists(settings.yunet_model_path):
+        pytest.skip(f"YuNet model not found at {settings.yunet_model_path}")
+    skimage_data = pytest.importorskip("skimage.data")
+
+    face, blank = skimage_data.astronaut(), np.zeros((240, 320, 3), dtype=np.uint8)
+    (boxes, probs, points), empty = YuNetBackend().detect([face, blank])
+
+    assert empty == (None, None, None)
+    assert boxes.dtype == probs.dtype == points.dtype == np.float32
+    assert boxes.shape[1] == 4 and points.shape == (len(boxes), 5, 2) and len(probs) == len(boxes)
+    best = int(np.argmax(probs))
+    x1, y1, x2, y2 = boxes[best]
+    assert probs[best] >= settings.yunet_score_threshold
+    assert np.all((points[best, :, 0] >= x1) & (points[best, :, 0] <= x2))
+    assert np.all((points[best, :, 1] >= y1) & (points[best, :, 1] <= y2))
+
+
+def test_ffmpeg_capture_release_from_another_thread_ends_grab_cleanly():
+    """CameraStream.stop() releases the capture while the capture thread is blocked mid-frame in grab()."""
+    import threading
+    import time
+    from app.core.ffmpeg_capture import FFmpegCapture
+
+    class StalledSource(FFmpegCapture):
+        """Stands in for ffmpeg: one and a half frames, then a stalled stream."""
+
+        def command(self):
+            return [sys.executable, "-c",
+                    f"import sys, time; sys.stdout.buffer.write(bytes({self.frame_size * 3 // 2})); "
+                    f"sys.stdout.flush(); time.sleep(60)"]
+
+    capture = StalledSource("stalled", (160, 120))
+    assert capture.grab()
+
+    errors, outcome = [], []
+    previous_hook = threading.excepthook
+    threading.excepthook = lambda args: errors.append(args.exc_value)
+    try:
+        reader = threading.Thread(target=lambda: outcome.append(capture.grab()))
+        reader.start()
+        time.sleep(0.3)
+        capture.release()
+        reader.join(timeout=5)
+    finally:
+        threading.excepthook = previous_hook
+
+    assert not reader.is_alive()
+    assert errors == [] and outcome == [False]
+    assert not capture.isOpened() and capture.grab() is False
+
+
+@pytest.fixture
+def recognition_system():
+    """A FaceRecognitionSystem without loaded models, for matching against hand-made galleries."""
+    from app.core.face_recognition import FaceRecognitionSystem
+    return FaceRecognitionSystem()
+
+
+def test_match_encodings_thresholds_and_empty_ivf_probes(recognition_system):
+    import numpy as np
+    from app.core import FaceGallery
+    from app.core.face_index import FaceIndex
+
+    eye = np.eye(4, dtype=np.float32)
+    gallery = FaceGallery(embedding_size=4)
+    gallery.build([eye[0], eye[1]], [10, 11], ["a", "b"])
+    recognition_system.set_gallery(gallery)
+
+    close = np.array([0.9, np.sqrt(1 - 0.81), 0, 0], dtype=np.float32)  # Similarity 0.9 to student 10
+    far = np.array([0.5, 0, np.sqrt(0.75), 0], dtype=np.float32)  # 0.5, below the 0.6 threshold
+    (match, confidence), (no_match, similarity) = recognition_system.match_encodings(np.stack([close, far]))
+    assert match == 0 and confidence == pytest.approx(0.9, abs=1e-6)
+    assert no_match is None and similarity == pytest.approx(0.5, abs=1e-6)
+
+    # Above the similarity threshold but past a tightened distance threshold
+    recognition_system.distance_threshold = 0.3
+    assert recognition_system.match_encodings(close[None]) == [(None, 0.0)]
+    recognition_system.distance_threshold = 1.2
+
+    # IVF query whose only probed list (centroid along the third axis) is empty
+    gallery = FaceGallery(embedding_size=4)
+    gallery.attach(eye[:2], [10, 11], ["a", "b"], index=FaceIndex.from_state("ivf", {
+        'embeddings': eye[:2], 'centroids': eye[[0, 2]], 'ids': np.array([0, 1]),
+        'offsets': np.array([0, 2, 2]), 'params': np.array([2, 1, 10, 0])
+    }))
+    recognition_system.set_gallery(gallery)
+    assert recognition_system.match_encodings(eye[2][None]) == [(None, 0.0)]
+    assert recognition_system.match_encodings(eye[0][None]) == [(0, pytest.approx(1.0))]
+
+
+def test_rerank_lets_a_single_photo_beat_a_closer_centroid(recognition_system):
+    import numpy as np
+    from app.core import FaceGallery
+
+    eye = np.eye(4, dtype=np.float32)
+    a = np.array([0.8, 0.6, 0, 0], dtype=np.float32)
+    b_centroid = (eye[0] + eye[2]) / np.sqrt(2)  # Similarity 0.71 to the query, below student a's 0.8
+    gallery = FaceGallery(embedding_size=4)
+    gallery.build(
+        [a, b_centroid, eye[3]], [1, 2, 3], ["a", "b", "c"],
+        embedding_sets=[np.stack([a, a]), np.stack([eye[0], eye[2]]), eye[3][None]]  # c has a single photo
+    )
+    recognition_system.set_gallery(gallery)
+    recognition_system.rerank_top_k = 3
+
+    assert gallery.search(eye[0][None], top_k=1)[0].tolist() == [[0]]  # Centroids alone pick a
+    matches = recognition_system.match_encodings(np.stack([eye[0], eye[3]]))
+    assert [gallery.ids[row] for row, _ in matches] == [2, 3]
+    assert [confidence for _, confidence in matches] == pytest.approx([1.0, 1.0])
+
+
+def test_model_registry_submodule_is_not_shadowed_by_the_singleton():
+    """unittest.mock.patch("app.core.model_registry.model_registry") must reach the registry singleton."""
+    from unittest import mock
+    import app.core.model_registry as registry_module
+    from app.core.model_registry import ModelRegistry
+
+    assert isinstance(registry_module.model_registry, ModelRegistry)
+    replacement = ModelRegistry()
+    with mock.patch("app.core.model_registry.model_registry", replacement):
+        assert registry_module.model_registry is replacement
+
+
+def test_manual_session_is_rejected_on_workers_without_inference(monkeypatch):
+    """Like the other session routes, the manual one answers 503 instead of queueing a session that can't run."""
+    pytest.importorskip("httpx")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from config import settings
+    from app.api.dependencies import get_db
+    from app.api.routes import scheduler
+
+    monkeypatch.setattr(settings, "enable_inference", False)
+    monkeypatch.setattr(settings, "enable_background_service", True)
+    app = FastAPI()
+    app.include_router(scheduler.router, prefix="/scheduler")
+    app.dependency_overrides[get_db] = lambda: pytest.fail("the database must not be touched")
+
+    response = TestClient(app).post("/scheduler/sessions/manual", json={"classroom_id": 1})
+    assert response.status_code == 503
+
+
+def _install_stub_backend(detector, boxes_for=None, probability=0.99):
+    """
+    Make a fixed-output backend the detector's default. boxes_for(image) gives the
+    [x1, y1, x2, y2] boxes found in the (downscaled) image it is handed, or None, each
+    scored probability.
+    Returns: the backend, which records the image shapes and crop boxes it saw
+    """
+    import numpy as np
+    from app.core.detector_backends import DetectorBackend, template_landmarks
+
+    class StubBackend(DetectorBackend):
+        name = "stub"
+
+        def __init__(self):
+            self.seen_shapes = []
+            self.extracted_boxes = []
+
+        def detect(self, rgb_images):
+            detections = []
+            for image in rgb_images:
+                self.seen_shapes.append(image.shape)
+                boxes = boxes_for(image) if boxes_for else np.array([[10, 20, 50, 60]], dtype=np.float32)
+                if boxes is None:
+                    detections.append((None, None, None))
+                else:
+                    detections.append((boxes, np.full(len(boxes), probability, np.float32), template_landmarks(boxes)))
+            return detections
+
+        def extract(self, rgb_image, boxes):
+            self.extracted_boxes.append(boxes.copy())
+            return super().extract(rgb_image, boxes)
+
+    backend = StubBackend()
+    detector._backends[backend.name] = backend
+    detector.backend_name = backend.name
+    return backend
+
+
+def test_downscaled_detections_are_mapped_back_to_full_resolution():
+    """Boxes and landmarks found at scale 0.5 reach the quality gate, the crop and the caller in frame pixels."""
+    pytest.importorskip("facenet_pytorch")
+    import numpy as np
+    from app.core.face_detection import FaceDetector
+    from app.core.detector_backends import template_landmarks
+    from app.core.face_quality import FaceQualityGate
+
+    class RecordingGate(FaceQualityGate):
+        seen = []
+
+        def check_detections(self, boxes, probs, landmarks, check_probability=True):
+            self.seen.append((boxes.copy(), landmarks.copy()))
+            return np.ones(len(boxes), dtype=bool)
+
+        def check_sharpness(self, aligned_faces):
+            return np.ones(len(aligned_faces), dtype=bool)
+
+    detector = FaceDetector()
+    backend = _install_stub_backend(detector)
+    gate = RecordingGate()
+    frame = np.random.default_rng(0).integers(0, 256, (200, 240, 3), dtype=np.uint8)
+
+    (faces, locations), = detector.detect_and_align_faces_batch([frame], [0.5], as_tensors=True, quality_gate=gate)
+
+    assert backend.seen_shapes == [(100, 120, 3)]
+    full_boxes = np.array([[20, 40, 100, 120]], dtype=np.float32)
+    assert locations == [(40, 100, 120, 20)]  # (top, right, bottom, left)
+    gate_boxes, gate_landmarks = gate.seen[0]
+    assert np.allclose(gate_boxes, full_boxes)
+    assert np.allclose(gate_landmarks, template_landmarks(full_boxes))
+    assert np.allclose(backend.extracted_boxes[0], full_boxes)
+    assert tuple(faces.shape) == (1, 3, 160, 160)
+    assert detector.detect_faces(frame, scale=0.5, backend="stub") == [(40, 100, 120, 20)]
+
+
+@pytest.mark.parametrize("tensor_pipeline", [True, False])
+def test_batched_recognition_matches_frame_by_frame(seeded_facenet, recognition_system, tensor_pipeline):
+    """Grouping frames by shape doesn't change any frame's results, a frame without faces included."""
+    import numpy as np
+
+    def faces_unless_blank(image):
+        if not image.any():
+            return None
+        height, width = image.shape[:2]
+        return np.array([[0.1 * width, 0.1 * height, 0.4 * width, 0.6 * height],
+                         [0.5 * width, 0.2 * height, 0.9 * width, 0.8 * height]], dtype=np.float32)
+
+    _install_stub_backend(recognition_system.detector, faces_unless_blank)
+    recognition_system.tensor_pipeline = tensor_pipeline
+    recognition_system.quality_gate = None
+
+    rng = np.random.default_rng(0)
+    frames = [
+        rng.integers(0, 256, (120, 160, 3), dtype=np.uint8),
+        rng.integers(0, 256, (90, 200, 3), dtype=np.uint8),
+        np.zeros((120, 160, 3), dtype=np.uint8),  # No faces, skipped mid-batch
+        rng.integers(0, 256, (120, 160, 3), dtype=np.uint8),
+    ]
+
+    # Enrol one face of the last frame, so the results hold a match as well as unknowns
+    aligned_faces, _ = recognition_system.detector.detect_and_align_faces(frames[3], 1.0)
+    enrolled = recognition_system.encoder.generate_encoding_matrix(aligned_faces[:1])
+    recognition_system.gallery.build([enrolled[0]], [7], ["Enrolled"])
+
+    scales = [1.0] * len(frames)
+    batched = recognition_system.recognize_faces_batch(frames, scales)
+    single = [recognition_system.recognize_faces(frame, 1.0) for frame in frames]
+
+    assert [len(results) for results in batched] == [2, 2, 0, 2]
+    assert batched[3][0]['student_id'] == 7
+    for batch_results, frame_results in zip(batched, single):
+        assert [r['location'] for r in batch_results] == [r['location'] for r in frame_results]
+        assert [r['student_id'] for r in batch_results] == [r['student_id'] for r in frame_results]
+        assert np.allclose([r['confidence'] for r in batch_results],
+                           [r['confidence'] for r in frame_results], atol=1e-5)
+
+
+@pytest.mark.parametrize("selected", [None, [[2, 0], [], [1]]])
+def test_tensor_pipeline_encodes_like_the_numpy_path(seeded_facenet, recognition_system, monkeypatch, selected):
+    """Aligned faces give the same embeddings as tensors and as uint8 images, also when only some are selected."""
+    import numpy as np
+    import torch
+
+    rng = np.random.default_rng(0)
+    face_counts = [3, 0, 2]
+    faces = [[rng.integers(0, 256, (160, 160, 3), dtype=np.uint8) for _ in range(count)] for count in face_counts]
+    locations = [[(i, i + 10, i + 20, i) for i in range(count)] for count in face_counts]
+
+    def as_tensor(frame_faces):
+        # The normalisation MTCNN applies, so both paths see identical pixels
+        batch = torch.from_numpy(np.stack(frame_faces).astype(np.float32)).permute(0, 3, 1, 2)
+        return (batch - 127.5) / 128.0
+
+    numpy_detections = [(frame_faces, frame_locations) for frame_faces, frame_locations in zip(faces, locations)]
+    tensor_detections = [(as_tensor(frame_faces) if frame_faces else None, frame_locations)
+                         for frame_faces, frame_locations in zip(faces, locations)]
+
+    encoded = []
+    monkeypatch.setattr(recognition_system, "match_encodings",
+                        lambda encodings: encoded.append(encodings) or [(None, 0.0)] * len(encodings))
+
+    recognition_system.tensor_pipeline = True
+    tensor_results = recognition_system.recognize_detections(tensor_detections, selected)
+    recognition_system.tensor_pipeline = False
+    numpy_results = recognition_system.recognize_detections(numpy_detections, selected)
+
+    expected_counts = face_counts if selected is None else [len(indices) for indices in selected]
+    assert [len(results) for results in tensor_results] == expected_counts
+    assert [[r['location'] for r in results] for results in tensor_results] == \
+           [[r['location'] for r in results] for results in numpy_results]
+    assert encoded[0].shape == (sum(expected_counts), recognition_system.encoder.embedding_size)
+    assert np.allclose(encoded[0], encoded[1], atol=1e-5)
+
+
+@pytest.mark.parametrize("backend_class", ["YuNetBackend", "MTCNNBackend"])
+def test_quality_gate_probability_floor_only_applies_to_mtcnn_scores(backend_class):
+    """A YuNet face scoring 0.85 passed YUNET_SCORE_THRESHOLD and must not meet MTCNN's 0.95 floor."""
+    pytest.importorskip("facenet_pytorch")
+    import numpy as np
+    import app.core.detector_backends as detector_backends
+    from app.core.face_detection import FaceDetector
+    from app.core.face_quality import FaceQualityGate
+
+    detector = FaceDetector()
+    backend = _install_stub_backend(detector, probability=0.85)
+    backend.mtcnn_probabilities = getattr(detector_backends, backend_class).mtcnn_probabilities
+    gate = FaceQualityGate(min_probability=0.95, min_face_size=20, min_sharpness=0.0)
+    frame = np.random.default_rng(0).integers(0, 256, (120, 160, 3), dtype=np.uint8)
+
+    (faces, locations), = detector.detect_and_align_faces_batch([frame], [1.0], as_tensors=True, quality_gate=gate)
+
+    if backend_class == "YuNetBackend":
+        assert locations == [(20, 50, 60, 10)] and len(faces) == 1
+        assert gate.stats.dropped['probability'] == 0
+    else:
+        assert locations == [] and faces is None
+        assert gate.stats.dropped['probability'] == 1